@@ -0,0 +1,180 @@
+"""
+How many chats can stream at once through the backend layer, and whether one
+slow reply holds up the others.
+
+Every run streams N chats from a local mock OpenAI-compatible server next to
+one chat from a second mock whose prefill takes ``--slow-prefill`` seconds,
+like a long prompt on a busy GPU. It runs once with the pooled
+``OpenAIBackend`` and once with the old blocking ``openai.OpenAI`` client
+iterated inside the event loop. The time to first token of the N chats is
+measured from the common start of the run, so waiting for a blocked loop
+counts; ``peak`` is the most chats receiving tokens at the same time.
+
+    python -m benchmarks.backend_concurrency --chats 1 10 50 100 200
+    python -m benchmarks.backend_concurrency --chats 100 200 --http2
+
+The mocks run in another process, in a thread they would share the GIL with
+the client and slow down with it. Over HTTP/1.1 every stream needs its own
+connection, and httpcore scans its pool whenever a request starts or ends at
+a cost growing with the square of the open connections. Around a hundred
+connections this CPU time, not ``max_connections``, staggers the streams so
+fewer of them overlap. ``--http2`` multiplexes the streams over a few
+connections, as h2c with prior knowledge since the mocks do not speak TLS.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Set
+
+import httpx
+import openai
+
+from bot.backends import OpenAIBackend, PoolSettings, create_http_client
+
+from .mock_llm_server import start_in_process
+from .stats import percentile
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class Run:
+    """The times to first token and concurrent streams of one run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ttft: List[float] = []
+        self.slow_ttft = 0.0
+        self.streaming = 0
+        self.peak = 0
+
+    def first_token(self, slow: bool) -> None:
+        elapsed = time.perf_counter() - self.start
+        if slow:
+            self.slow_ttft = elapsed
+        else:
+            self.ttft.append(elapsed)
+        self.streaming += 1
+        self.peak = max(self.peak, self.streaming)
+
+    def finished(self) -> None:
+        self.streaming -= 1
+
+
+async def _pooled_chat(backend: OpenAIBackend, run: Run, slow: bool) -> None:
+    first = True
+    async for _ in backend.stream_chat(MESSAGES, model="mock"):
+        if first:
+            run.first_token(slow)
+            first = False
+    run.finished()
+
+
+async def _blocking_chat(client: openai.OpenAI, run: Run, slow: bool) -> None:
+    # This is what the handler used to do: a synchronous stream on the event loop
+    first = True
+    for _ in client.chat.completions.create(model="mock", messages=MESSAGES, stream=True):
+        if first:
+            run.first_token(slow)
+            first = False
+        await asyncio.sleep(0)
+    run.finished()
+
+
+async def _watch_loop_lag(lags: List[float], interval: float = 0.005) -> None:
+    # Every other chat's Telegram I/O waits this long when the loop is blocked
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def _create_pooled_client(settings: PoolSettings, http2: bool) -> httpx.AsyncClient:
+    if not http2:
+        # Like the bot: HTTP/2 is only negotiated over TLS, the mocks get HTTP/1.1
+        return create_http_client(settings)
+    return httpx.AsyncClient(
+        http1=False, http2=True, limits=settings.limits, timeout=settings.timeout
+    )
+
+
+async def run(
+    chat_counts: List[int], tokens: int, token_delay: float, slow_prefill: float, http2: bool
+) -> None:
+    servers = [start_in_process(tokens=tokens, token_delay=token_delay)]
+    if slow_prefill:
+        servers.append(
+            start_in_process(tokens=tokens, token_delay=token_delay, first_token_delay=slow_prefill)
+        )
+    uris = [uri for _, uri in servers]
+
+    versions: Set[str] = set()
+
+    async def record_version(response: httpx.Response) -> None:
+        versions.add(response.http_version)
+
+    http_client = _create_pooled_client(PoolSettings(max_connections=max(chat_counts) + 1), http2)
+    http_client.event_hooks["response"].append(record_version)
+    # Index 1 is the slow server
+    pooled = [OpenAIBackend(uri, http_client) for uri in uris]
+    blocking = [openai.OpenAI(base_url=uri, api_key="0") for uri in uris]
+
+    # Warm up both clients, the first request imports and builds their models
+    async for _ in pooled[0].stream_chat(MESSAGES, model="mock"):
+        pass
+    blocking[0].chat.completions.create(model="mock", messages=MESSAGES)
+
+    print(f"{tokens} tokens per reply, ideal stream time {tokens * token_delay:.2f}s")
+    print(f"pooled client speaks {', '.join(sorted(versions))}, blocking client HTTP/1.1")
+    if slow_prefill:
+        print(f"one more chat per run waits {slow_prefill:g}s for its first token")
+    print(
+        f"{'client':<10}{'chats':>7}{'wall s':>9}{'peak':>7}{'ttft p50':>10}"
+        f"{'ttft p99':>10}{'slow ttft':>11}{'loop lag max':>14}"
+    )
+    for chats in chat_counts:
+        for name, make_chat, clients in (
+            ("pooled", _pooled_chat, pooled),
+            ("blocking", _blocking_chat, blocking),
+        ):
+            lags: List[float] = []
+            watcher = asyncio.create_task(_watch_loop_lag(lags))
+            current = Run()
+            # The slow chat starts first, as a long prompt sent just before the others
+            slow_chats = [make_chat(clients[1], current, True)] if slow_prefill else []
+            await asyncio.gather(
+                *slow_chats, *(make_chat(clients[0], current, False) for _ in range(chats))
+            )
+            wall = time.perf_counter() - current.start
+            watcher.cancel()
+            print(
+                f"{name:<10}{chats:>7}{wall:>9.2f}{current.peak:>7}"
+                f"{percentile(current.ttft, 50) * 1000:>8.1f}ms"
+                f"{percentile(current.ttft, 99) * 1000:>8.1f}ms"
+                f"{current.slow_ttft * 1000:>9.1f}ms"
+                f"{max(lags, default=0.0) * 1000:>12.1f}ms"
+            )
+
+    for client in blocking:
+        client.close()
+    await http_client.aclose()
+    for process, _ in servers:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument(
+        "--slow-prefill",
+        type=float,
+        default=1.0,
+        help="seconds before the slow chat's first token, 0 for none",
+    )
+    parser.add_argument("--http2", action="store_true", help="multiplex the pooled streams over h2c")
+    args = parser.parse_args()
+    asyncio.run(
+        run(args.chats, args.tokens, args.token_delay, args.slow_prefill, args.http2)
+    )
@@ -0,0 +1,79 @@
+"""
+CPU cost of rendering a streamed reply: re-escaping the whole text on every
+edit (``TextFormatter.render``) versus the incremental ``StreamingFormatter``.
+
+    python -m benchmarks.formatter_bench --sizes 4096 16384 65536
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+from bot.helpers.formatting_helper import StreamingFormatter, TextFormatter
+
+SAMPLE = (
+    "Here is how to read a file in Python (see `open()` for details):\n\n"
+    "```python\n"
+    "with open(path, encoding='utf-8') as f:\n"
+    "    for line in f:  # iterate lazily\n"
+    "        print(line.rstrip('\\n'))\n"
+    "```\n\n"
+    "1. The *context manager* closes the file; 2. lines keep their `\\n`!\n"
+)
+
+
+def make_reply(size: int) -> str:
+    return (SAMPLE * (size // len(SAMPLE) + 1))[:size]
+
+
+def deltas(text: str, delta_size: int) -> List[str]:
+    return [text[i : i + delta_size] for i in range(0, len(text), delta_size)]
+
+
+def legacy(chunks: List[str], edit_every: int) -> str:
+    text = ""
+    rendered = ""
+    for index, chunk in enumerate(chunks, 1):
+        text += chunk
+        if index % edit_every == 0:
+            rendered = TextFormatter.render(text)
+    return TextFormatter.render(text) if rendered else rendered
+
+
+def streaming(chunks: List[str], edit_every: int) -> str:
+    formatter = StreamingFormatter()
+    for index, chunk in enumerate(chunks, 1):
+        formatter.feed(chunk)
+        if index % edit_every == 0:
+            formatter.render()
+    return formatter.render()
+
+
+def timed(func: Callable, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run(sizes: List[int], delta_size: int, edit_every: int, repeat: int) -> None:
+    print(f"{delta_size} chars per delta, one edit every {edit_every} deltas")
+    print(f"{'chars':>8}{'edits':>7}{'legacy ms':>12}{'streaming ms':>14}{'speedup':>9}")
+    for size in sizes:
+        chunks = deltas(make_reply(size), delta_size)
+        assert legacy(chunks, 1) == streaming(chunks, 1)
+        legacy_time = min(timed(legacy, chunks, edit_every) for _ in range(repeat))
+        streaming_time = min(timed(streaming, chunks, edit_every) for _ in range(repeat))
+        print(
+            f"{size:>8}{len(chunks) // edit_every:>7}{legacy_time * 1000:>12.1f}"
+            f"{streaming_time * 1000:>14.1f}{legacy_time / streaming_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4096, 16384, 65536])
+    parser.add_argument("--delta-size", type=int, default=4)
+    parser.add_argument("--edit-every", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    run(args.sizes, args.delta_size, args.edit_every, args.repeat)
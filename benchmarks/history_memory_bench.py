@@ -0,0 +1,105 @@
+"""
+Memory of the conversation history: the former dicts per message and per
+chat against ``History`` records, and compressed once the chats are idle.
+
+    python -m benchmarks.history_memory_bench --chats 10000 --turns 20
+"""
+
+import argparse
+import datetime
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from bot.history import History, Turn
+
+SYSTEM = "You are a helpful assistant. Answer briefly and use code blocks for code."
+WORDS = (
+    "the a to of and is in it you that for this with on are be as can what how "
+    "python function error list file model server request token memory cache"
+).split()
+
+
+def make_texts(chats: int, turns: int, words: int) -> List[List[str]]:
+    rng = random.Random(0)
+    return [
+        [" ".join(rng.choices(WORDS, k=rng.randint(words // 2, words * 2))) for _ in range(turns)]
+        for _ in range(chats)
+    ]
+
+
+def dict_layout(texts: List[List[str]]) -> Dict:
+    memory = {}
+    for chat_id, turns in enumerate(texts):
+        messages = [{"role": "system", "content": SYSTEM}]
+        for index, text in enumerate(turns):
+            messages.append({"role": "user" if index % 2 == 0 else "assistant", "content": text})
+        memory[chat_id] = {
+            "messages": messages,
+            "metadata": {
+                "created_at": datetime.datetime.now().isoformat(),
+                "model": "model",
+                "endpoint": "http://localhost:30000/v1",
+                "chat_id": chat_id,
+            },
+        }
+    return memory
+
+
+def history_layout(texts: List[List[str]], compress: bool = False) -> Dict:
+    memory = {}
+    for chat_id, turns in enumerate(texts):
+        history = History([Turn("system", SYSTEM)])
+        for index, text in enumerate(turns):
+            history.append(Turn("user" if index % 2 == 0 else "assistant", text))
+        if compress:
+            history.compress()
+        memory[chat_id] = {
+            "messages": history,
+            "metadata": {
+                "created_at": time.time(),
+                "model": "model",
+                "endpoint": "http://localhost:30000/v1",
+                "chat_id": chat_id,
+            },
+        }
+    return memory
+
+
+def measure(build: Callable, chats: int, turns: int, words: int) -> int:
+    """Bytes still allocated once ``build`` stored the chats, texts included."""
+    tracemalloc.start()
+    texts = make_texts(chats, turns, words)
+    memory = build(texts)
+    del texts
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del memory
+    return size
+
+
+def run(chats: int, turns: int, words: int) -> None:
+    texts = make_texts(chats, turns, words)
+    text_bytes = sum(len(text) for turns in texts for text in turns)
+    del texts
+    print(f"{chats} chats of {turns} turns, {text_bytes / chats:.0f} bytes of text per chat")
+    print(f"{'layout':>12}{'MiB':>9}{'per chat':>10}{'vs dicts':>10}")
+    baseline = None
+    for name, build in (
+        ("dicts", dict_layout),
+        ("records", history_layout),
+        ("compressed", lambda texts: history_layout(texts, compress=True)),
+    ):
+        size = measure(build, chats, turns, words)
+        baseline = baseline or size
+        print(f"{name:>12}{size / 2**20:>9.1f}{size / chats:>10.0f}{size / baseline:>9.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--words", type=int, default=30)
+    args = parser.parse_args()
+    run(args.chats, args.turns, args.words)
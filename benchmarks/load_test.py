@@ -0,0 +1,242 @@
+"""
+End-to-end load test: the real ``Bot`` application, polling a fake Telegram
+Bot API and streaming from a fake OpenAI-compatible server.
+
+Every simulated user sends a message, waits for the complete reply and sends
+the next one. Both fakes run on their own threads, so the CPU time of the
+main thread is the bot's own:
+
+    python -m benchmarks.load_test --users 50 --messages 3 --tokens 100 --token-delay 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import resource
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+from bot.bot import Bot
+
+from .mock_llm_server import MockLLMServer
+from .mock_telegram_server import MockTelegramServer
+from .stats import percentile
+
+CONFIG_DIR = Path(__file__).parent.parent / "config"
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak instead of current size where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Chat:
+    __slots__ = ("sent_at", "first_edit_at", "done")
+
+    def __init__(self):
+        self.sent_at = 0.0
+        self.first_edit_at: Optional[float] = None
+        self.done: Optional[asyncio.Future] = None
+
+
+class LoadTest:
+    """
+    Parameters
+    ----------
+    users : int
+        Simulated users, each in its own private chat.
+    messages : int
+        Messages sent by every user, one after the other.
+    ramp : float
+        Seconds over which the users start.
+    timeout : float
+        Seconds to wait for a complete reply before counting it as failed.
+    llm, telegram
+        The fakes, configured with their token rate, latency and failures.
+    bot_options : Dict
+        Extra ``Bot`` keyword arguments, e.g. ``edit_rate_limits``.
+    """
+
+    def __init__(
+        self,
+        users: int,
+        messages: int,
+        llm: MockLLMServer,
+        telegram: MockTelegramServer,
+        ramp: float = 0.0,
+        timeout: float = 60.0,
+        bot_options: Optional[Dict] = None,
+        trace_memory: bool = False,
+    ):
+        self.users = users
+        self.messages = messages
+        self.llm = llm
+        self.telegram = telegram
+        self.ramp = ramp
+        self.timeout = timeout
+        self.bot_options = bot_options or {}
+        self.trace_memory = trace_memory
+        self._chats: Dict[int, _Chat] = {}
+        self._edits = 0
+        self._ttfe: List[float] = []
+        self._reply_times: List[float] = []
+        self._failed = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _on_edit(self, chat_id: int, message_id: int, text: str, at: float) -> None:
+        # Called on the fake server's thread
+        self._loop.call_soon_threadsafe(self._record_edit, chat_id, text, at)
+
+    def _record_edit(self, chat_id: int, text: str, at: float) -> None:
+        self._edits += 1
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.done is None or chat.done.done():
+            return
+        if chat.first_edit_at is None:
+            chat.first_edit_at = at
+            self._ttfe.append(at - chat.sent_at)
+        if text.count("tok") >= self.llm.tokens:
+            chat.done.set_result(at)
+
+    async def _user(self, chat_id: int) -> None:
+        await asyncio.sleep(self.ramp * chat_id / self.users)
+        chat = self._chats[chat_id] = _Chat()
+        for index in range(self.messages):
+            chat.first_edit_at = None
+            chat.done = self._loop.create_future()
+            chat.sent_at = time.perf_counter()
+            self.telegram.push_message(chat_id, f"Message {index} from user {chat_id}")
+            try:
+                finished_at = await asyncio.wait_for(chat.done, self.timeout)
+                self._reply_times.append(finished_at - chat.sent_at)
+            except asyncio.TimeoutError:
+                self._failed += 1
+
+    async def run(self) -> Dict[str, float]:
+        self._loop = asyncio.get_running_loop()
+        self.telegram.on_edit = self._on_edit
+        with open(CONFIG_DIR / "instruction_templates.yml", encoding="utf8") as f:
+            instruction_templates = yaml.safe_load(f)
+
+        bot = Bot(
+            token="123456:LOADTEST",
+            backend="openai",
+            template="llama3-instruct-default",
+            uri=self.llm.uri,
+            model="mock",
+            users=[],
+            bot_username="limestone_bench_bot",
+            dev_id=0,
+            instruction_templates=instruction_templates,
+            max_new_tokens=256,
+            streaming=True,
+            telegram_api_url=self.telegram.base_url,
+            routing={"health_check_interval": 0},
+            **self.bot_options,
+        )
+        app = bot.build_application()
+        await app.initialize()
+        await app.post_init(app)
+        await app.updater.start_polling(poll_interval=0, timeout=1)
+        await app.start()
+
+        if self.trace_memory:
+            tracemalloc.start()
+        rss_before = _rss_bytes()
+        cpu_before = time.thread_time()
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._user(chat_id) for chat_id in range(1, self.users + 1)))
+        finally:
+            elapsed = time.perf_counter() - started
+            cpu = time.thread_time() - cpu_before
+            rss_growth = _rss_bytes() - rss_before
+            traced = tracemalloc.get_traced_memory()[0] if self.trace_memory else None
+            tracemalloc.stop()
+            await app.updater.stop()
+            await app.stop()
+            await app.post_shutdown(app)
+            await app.shutdown()
+
+        report = {
+            "messages": len(self._reply_times),
+            "failed": self._failed,
+            "seconds": elapsed,
+            "ttfe_p50": percentile(self._ttfe, 50),
+            "ttfe_p99": percentile(self._ttfe, 99),
+            "reply_p50": percentile(self._reply_times, 50),
+            "reply_p99": percentile(self._reply_times, 99),
+            "edits_per_second": self._edits / elapsed,
+            "cpu_percent": 100 * cpu / elapsed,
+            "rss_growth_mb": rss_growth / 2**20,
+        }
+        if traced is not None:
+            report["traced_mb"] = traced / 2**20
+        return report
+
+
+def _print_report(report: Dict[str, float]) -> None:
+    print(f"messages        {report['messages']} done, {report['failed']} failed in {report['seconds']:.1f}s")
+    print(f"first edit      p50 {report['ttfe_p50'] * 1000:.0f} ms, p99 {report['ttfe_p99'] * 1000:.0f} ms")
+    print(f"complete reply  p50 {report['reply_p50'] * 1000:.0f} ms, p99 {report['reply_p99'] * 1000:.0f} ms")
+    print(f"edits           {report['edits_per_second']:.1f}/s")
+    print(f"bot loop cpu    {report['cpu_percent']:.1f}%")
+    print(f"rss growth      {report['rss_growth_mb']:.1f} MiB")
+    if "traced_mb" in report:
+        print(f"python heap     {report['traced_mb']:.1f} MiB allocated during the run")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    llm = MockLLMServer(
+        tokens=args.tokens,
+        token_delay=args.token_delay,
+        first_token_delay=args.first_token_delay,
+    )
+    llm.failure_rate = args.llm_failure_rate
+    llm.start_in_thread()
+    telegram = MockTelegramServer(
+        latency=args.telegram_latency,
+        flood_rate=args.flood_rate,
+        error_rate=args.edit_error_rate,
+    ).start_in_thread()
+
+    test = LoadTest(
+        args.users,
+        args.messages,
+        llm,
+        telegram,
+        ramp=args.ramp,
+        timeout=args.timeout,
+        bot_options={"edit_rate_limits": {"global_rate": args.global_rate}},
+        trace_memory=args.tracemalloc,
+    )
+    _print_report(await test.run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds to start all users")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--edit-error-rate", type=float, default=0.0)
+    parser.add_argument("--global-rate", type=float, default=30.0, help="edits per second of the bot")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace the python heap (slow)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    asyncio.run(_main(args))
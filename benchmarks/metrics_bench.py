@@ -0,0 +1,76 @@
+"""
+What the instrumentation costs on the streaming hot path.
+
+Times the metric primitives on their own, then feeds a reply through the
+streaming formatter with and without the per-delta instrumentation of
+``MyMessageHandler._stream_response``:
+
+    python -m benchmarks.metrics_bench --deltas 100000
+"""
+
+import argparse
+import time
+from typing import Callable
+
+from bot.helpers.formatting_helper import StreamingFormatter
+from bot.metrics import MetricsRegistry
+
+
+def _per_call(func: Callable[[], None], calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def _stream(deltas: int, instrumented: bool, registry: MetricsRegistry) -> float:
+    ttft = registry.histogram("bench_ttft_seconds", "")
+    active = registry.gauge("bench_active_streams", "")
+    rate = registry.histogram("bench_tokens_per_second", "")
+    formatter = StreamingFormatter()
+
+    start = time.perf_counter()
+    if instrumented:
+        active.inc()
+        requested_at = time.perf_counter()
+        first_token_at = None
+        chunks = 0
+        for _ in range(deltas):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                ttft.observe(first_token_at - requested_at)
+            chunks += 1
+            formatter.feed("tok ")
+        active.dec()
+        rate.observe((chunks - 1) / max(time.perf_counter() - first_token_at, 1e-9))
+    else:
+        for _ in range(deltas):
+            formatter.feed("tok ")
+    return time.perf_counter() - start
+
+
+def run(deltas: int, calls: int, repeat: int) -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_counter", "")
+    histogram = registry.histogram("bench_histogram", "")
+    print(f"counter.inc        {_per_call(counter.inc, calls) * 1e9:8.1f} ns")
+    print(f"histogram.observe  {_per_call(lambda: histogram.observe(0.3), calls) * 1e9:8.1f} ns")
+    print(f"registry.render    {_per_call(registry.render, 1000) * 1e6:8.1f} us")
+
+    baseline = min(_stream(deltas, False, registry) for _ in range(repeat))
+    instrumented = min(_stream(deltas, True, registry) for _ in range(repeat))
+    print(
+        f"stream {deltas} deltas: {baseline * 1000:.1f} ms plain, "
+        f"{instrumented * 1000:.1f} ms instrumented "
+        f"({(instrumented / baseline - 1) * 100:+.1f}%, "
+        f"{(instrumented - baseline) / deltas * 1e9:.0f} ns per delta)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--deltas", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.deltas, args.calls, args.repeat)
@@ -0,0 +1,487 @@
+"""
+A minimal OpenAI-compatible server that streams fake tokens at a fixed rate.
+
+It only depends on the standard library so benchmarks can run without a GPU:
+
+    python -m benchmarks.mock_llm_server --port 5005 --tokens 200 --token-delay 0.02
+
+Clients speaking HTTP/2 with prior knowledge (h2c) are served as well, which
+needs the ``h2`` package that comes with ``httpx[http2]``.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# The client preface of an HTTP/2 connection without TLS starts with this line
+H2_PREFACE_LINE = b"PRI * HTTP/2.0\r\n"
+
+
+async def read_request(
+    reader: asyncio.StreamReader, request_line: bytes = b""
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Read one HTTP/1.1 request, None when the client closed the connection.
+    ``request_line`` is the first line if the caller already read it.
+    """
+    request_line = request_line or await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+
+def run_in_thread(start, name: str) -> asyncio.AbstractEventLoop:
+    """
+    Run ``start()`` on a new event loop in a daemon thread and keep the loop
+    running, so clients that block their loop cannot stall the server.
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve() -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, name=name, daemon=True).start()
+    started.wait()
+    return loop
+
+
+def _serve_process(connection, options: Dict) -> None:
+    async def serve() -> None:
+        server = await MockLLMServer(**options).start()
+        connection.send(server.uri)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_in_process(**options) -> Tuple[multiprocessing.Process, str]:
+    """
+    Run a ``MockLLMServer(**options)`` in a daemon process, so the server
+    does not compete with the client for the GIL. Returns the process, to be
+    terminated by the caller, and the uri of the server.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_serve_process, args=(sender, options), name="mock-llm-server", daemon=True
+    )
+    process.start()
+    return process, receiver.recv()
+
+
+class Http1Response:
+    """Writes one response to an HTTP/1.1 keep-alive connection."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload).encode()
+        self.writer.write(
+            f"HTTP/1.1 {status} OK\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n".encode() + body
+        )
+        await self.writer.drain()
+
+    async def start_events(self) -> None:
+        self.writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+
+    async def send(self, data: bytes) -> None:
+        self.writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await self.writer.drain()
+
+    async def end(self) -> None:
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+
+class Http2Connection:
+    """
+    Serves the streams of one HTTP/2 connection with prior knowledge, every
+    request in its own task. Sending waits for the flow control window the
+    client opens as it reads.
+    """
+
+    def __init__(self, server: "MockLLMServer", reader, writer):
+        import h2.config
+        import h2.connection
+        import h2.settings
+
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.connection = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        self.connection.local_settings = h2.settings.Settings(
+            client=False,
+            initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 1000},
+        )
+        self._window_open = asyncio.Event()
+        self._requests: Dict[int, Tuple[Dict[str, str], bytearray]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def serve(self, preface: bytes) -> None:
+        try:
+            await self._receive(preface)
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+
+    async def _receive(self, data: bytes) -> None:
+        import h2.events
+
+        self.connection.initiate_connection()
+        await self.flush()
+        while data:
+            for event in self.connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    self._requests[event.stream_id] = (dict(event.headers), bytearray())
+                elif isinstance(event, h2.events.DataReceived):
+                    self._requests[event.stream_id][1].extend(event.data)
+                    self.connection.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id
+                    )
+                elif isinstance(event, h2.events.StreamEnded):
+                    headers, body = self._requests.pop(event.stream_id)
+                    self._tasks[event.stream_id] = asyncio.create_task(
+                        self._respond(event.stream_id, headers, bytes(body))
+                    )
+                elif isinstance(event, h2.events.StreamReset):
+                    task = self._tasks.pop(event.stream_id, None)
+                    if task is not None:
+                        task.cancel()
+                elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                    self._window_open.set()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            await self.flush()
+            data = await self.reader.read(65536)
+
+    async def flush(self) -> None:
+        self.writer.write(self.connection.data_to_send())
+        await self.writer.drain()
+
+    async def _respond(self, stream_id: int, headers: Dict[str, str], body: bytes) -> None:
+        import h2.exceptions
+
+        try:
+            await self.server._respond(
+                Http2Response(self, stream_id), headers[":method"], headers[":path"], body
+            )
+        except (ConnectionError, h2.exceptions.StreamClosedError):
+            # The client closed the stream or the connection
+            pass
+        finally:
+            self._tasks.pop(stream_id, None)
+
+    async def send_data(self, stream_id: int, data: bytes) -> None:
+        while data:
+            window = min(
+                self.connection.local_flow_control_window(stream_id),
+                self.connection.max_outbound_frame_size,
+            )
+            if window <= 0:
+                self._window_open.clear()
+                await self._window_open.wait()
+                continue
+            chunk, data = data[:window], data[window:]
+            self.connection.send_data(stream_id, chunk)
+            await self.flush()
+
+
+class Http2Response:
+    """Writes the response of one HTTP/2 stream, like ``Http1Response``."""
+
+    def __init__(self, connection: Http2Connection, stream_id: int):
+        self.connection = connection
+        self.stream_id = stream_id
+
+    def _headers(self, status: int, content_type: str) -> None:
+        self.connection.connection.send_headers(
+            self.stream_id, [(":status", str(status)), ("content-type", content_type)]
+        )
+
+    async def json(self, status: int, payload: Dict) -> None:
+        self._headers(status, "application/json")
+        await self.send(json.dumps(payload).encode())
+        await self.end()
+
+    async def start_events(self) -> None:
+        self._headers(200, "text/event-stream")
+        await self.connection.flush()
+
+    async def send(self, data: bytes) -> None:
+        await self.connection.send_data(self.stream_id, data)
+
+    async def end(self) -> None:
+        self.connection.connection.end_stream(self.stream_id)
+        await self.connection.flush()
+
+
+class MockLLMServer:
+    """
+    Serves ``POST /v1/chat/completions`` with HTTP/1.1 keep-alive or h2c,
+    answering ``stream=true`` requests with server-sent events, and
+    ``GET /v1/models`` for health checks.
+
+    Parameters
+    ----------
+    tokens : int
+        Number of tokens in every reply.
+    token_delay : float
+        Seconds between two streamed tokens.
+    first_token_delay : float
+        Simulated prefill time before the first token.
+    prefill_delay : float
+        Additional prefill seconds per prompt token that misses the simulated
+        prefix cache. Like a radix cache, a message is only a hit if every
+        message before it was a hit as well; usage reports the cached tokens
+        in ``prompt_tokens_details``.
+
+    Attributes
+    ----------
+    fail_requests : int
+        The next this many chat requests are answered with a 500 error.
+    failure_rate : float
+        Share of the other chat requests answered with a 500 error.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tokens: int = 64,
+        token_delay: float = 0.01,
+        first_token_delay: float = 0.0,
+        prefill_delay: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.prefill_delay = prefill_delay
+        self._prefix_cache = set()
+        self.active_streams = 0
+        self.peak_streams = 0
+        self.requests = 0
+        self.connections = 0
+        self.fail_requests = 0
+        self.failure_rate = 0.0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def uri(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "MockLLMServer":
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, backlog=1024
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "MockLLMServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def start_in_thread(self) -> "MockLLMServer":
+        """
+        Run the server on its own event loop in a daemon thread, so clients
+        that block their loop cannot stall the server as well.
+        """
+        run_in_thread(self.start, "mock-llm-server")
+        return self
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        try:
+            request_line = await reader.readline()
+            if request_line == H2_PREFACE_LINE:
+                await Http2Connection(self, reader, writer).serve(request_line)
+                return
+            while True:
+                request = await read_request(reader, request_line)
+                request_line = b""
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self._respond(Http1Response(writer), method, path, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, response, method: str, path: str, body: bytes) -> None:
+        """Answer one request through an ``Http1Response`` or ``Http2Response``"""
+        self.requests += 1
+        if method == "POST" and path.endswith("/chat/completions"):
+            if self.fail_requests or random.random() < self.failure_rate:
+                self.fail_requests = max(self.fail_requests - 1, 0)
+                await response.json(500, {"error": "injected failure"})
+            else:
+                await self._chat_completions(response, json.loads(body or b"{}"))
+        elif method == "GET" and path.endswith("/models"):
+            await response.json(
+                200, {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+            )
+        else:
+            await response.json(404, {"error": f"{method} {path}"})
+
+    @staticmethod
+    def _sse_event(data: str) -> bytes:
+        return f"data: {data}\n\n".encode()
+
+    def _prefill(self, messages) -> Tuple[int, int]:
+        """Returns the prompt tokens and how many of them were cached"""
+        prompt_tokens = cached_tokens = 0
+        hit = True
+        prefix = hashlib.blake2b(digest_size=16)
+        for message in messages:
+            prefix.update(json.dumps(message, sort_keys=True).encode())
+            key = prefix.digest()
+            tokens = len(message.get("content") or "") // 4 + 4
+            prompt_tokens += tokens
+            hit = hit and key in self._prefix_cache
+            if hit:
+                cached_tokens += tokens
+            self._prefix_cache.add(key)
+        return prompt_tokens, cached_tokens
+
+    async def _chat_completions(self, response, request: Dict):
+        model = request.get("model", "mock")
+        created = int(time.time())
+        prompt_tokens, cached_tokens = self._prefill(request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.tokens,
+            "total_tokens": prompt_tokens + self.tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        delay = self.first_token_delay + self.prefill_delay * (prompt_tokens - cached_tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if not request.get("stream"):
+            await asyncio.sleep(self.token_delay * self.tokens)
+            await response.json(
+                200,
+                {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": " ".join(["tok"] * self.tokens),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        await response.start_events()
+        self.active_streams += 1
+        self.peak_streams = max(self.peak_streams, self.active_streams)
+        try:
+            for index in range(self.tokens):
+                finish_reason = "stop" if index == self.tokens - 1 else None
+                chunk = {
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": "tok "},
+                            "finish_reason": finish_reason,
+                        }
+                    ],
+                }
+                await response.send(self._sse_event(json.dumps(chunk)))
+                await asyncio.sleep(self.token_delay)
+            if (request.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                await response.send(self._sse_event(json.dumps(chunk)))
+            await response.send(self._sse_event("[DONE]"))
+            await response.end()
+        finally:
+            self.active_streams -= 1
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = MockLLMServer(
+        args.host,
+        args.port,
+        args.tokens,
+        args.token_delay,
+        args.first_token_delay,
+        args.prefill_delay,
+    )
+    await server.start()
+    print(f"Mock LLM server listening on {server.uri}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--prefill-delay", type=float, default=0.0)
+    asyncio.run(_serve(parser.parse_args()))
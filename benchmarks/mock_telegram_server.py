@@ -0,0 +1,219 @@
+"""
+A minimal fake of the Telegram Bot API, enough to run the bot end to end.
+
+Updates are pushed with ``push_message`` and handed out by long-polling
+``getUpdates``; sent and edited messages are recorded with timestamps.
+It only depends on the standard library.
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from .mock_llm_server import read_request, run_in_thread
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Limestone",
+    "username": "limestone_bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class MockTelegramServer:
+    """
+    Serves ``/bot<token>/<method>`` like api.telegram.org.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds added to every API call except ``getUpdates``.
+    flood_rate : float
+        Share of ``editMessageText`` calls answered with a 429 flood error.
+    retry_after : int
+        The ``retry_after`` of injected flood errors.
+    error_rate : float
+        Share of ``editMessageText`` calls answered with a 400 error.
+
+    Attributes
+    ----------
+    calls : Dict[str, int]
+        The number of calls per API method.
+    on_edit : Optional[Callable[[int, int, str, float], None]]
+        Called with chat id, message id, text and time of every edit.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        flood_rate: float = 0.0,
+        retry_after: int = 1,
+        error_rate: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.calls: Dict[str, int] = {}
+        self.on_edit: Optional[Callable[[int, int, str, float], None]] = None
+        self._updates: List[Dict] = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        """The value for ``ApplicationBuilder.base_url``."""
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> "MockTelegramServer":
+        self._loop = asyncio.get_running_loop()
+        self._new_updates = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, backlog=1024
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> "MockTelegramServer":
+        """Run the server on its own event loop in a daemon thread."""
+        run_in_thread(self.start, "mock-telegram-server")
+        return self
+
+    def push_message(self, chat_id: int, text: str) -> None:
+        """Queue a private text message from the user ``chat_id``, thread safe."""
+        self._loop.call_soon_threadsafe(self._push_message, chat_id, text)
+
+    def _push_message(self, chat_id: int, text: str) -> None:
+        self._update_id += 1
+        self._updates.append(
+            {
+                "update_id": self._update_id,
+                "message": {
+                    "message_id": self._next_message_id(),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+                    "text": text,
+                },
+            }
+        )
+        self._new_updates.set()
+
+    def _next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                _, path, headers, body = request
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                self.calls[method] = self.calls.get(method, 0) + 1
+                status, payload = await self._dispatch(method, self._parse(headers, body))
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    "Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse(headers: Dict[str, str], body: bytes) -> Dict:
+        if not body:
+            return {}
+        if headers.get("content-type", "").startswith("application/json"):
+            return json.loads(body)
+        # python-telegram-bot sends form fields with JSON encoded values
+        params = {}
+        for key, value in parse_qsl(body.decode()):
+            if key == "text":
+                params[key] = value
+                continue
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _message(self, chat_id: int, message_id: int, text: str) -> Dict:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def _dispatch(self, method: str, params: Dict):
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "sendMessage":
+            message = self._message(params["chat_id"], self._next_message_id(), params["text"])
+            return 200, {"ok": True, "result": message}
+        if method == "editMessageText":
+            if random.random() < self.flood_rate:
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            if random.random() < self.error_rate:
+                return 400, {
+                    "ok": False,
+                    "error_code": 400,
+                    "description": "Bad Request: injected failure",
+                }
+            if self.on_edit is not None:
+                self.on_edit(params["chat_id"], params["message_id"], params["text"], time.perf_counter())
+            message = self._message(params["chat_id"], params["message_id"], params["text"])
+            message["edit_date"] = int(time.time())
+            return 200, {"ok": True, "result": message}
+        # sendChatAction, deleteMessage, deleteWebhook, setMyCommands, ...
+        return 200, {"ok": True, "result": True}
+
+    async def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = params.get("offset") or 0
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), params.get("timeout") or 0)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[: params.get("limit") or 100]
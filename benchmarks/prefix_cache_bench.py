@@ -0,0 +1,100 @@
+"""
+How much of each prompt a server side prefix cache can reuse.
+
+Simulates long chats against mock replicas that charge prefill time only for
+prompt tokens missing from their prefix cache, once with the default sliding
+window and least-outstanding routing, and once in prefix cache mode (chunked
+truncation and sticky routing):
+
+    python -m benchmarks.prefix_cache_bench --chats 20 --turns 30 --replicas 2
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+from bot.backends import (
+    EndpointRouter,
+    OpenAIBackend,
+    PoolSettings,
+    create_http_client,
+    parse_endpoints,
+)
+from bot.context_manager import ContextManager
+
+from .mock_llm_server import MockLLMServer
+from .stats import percentile
+
+SYSTEM = "You are a helpful assistant. " * 40
+MODES = {
+    "sliding": ("sliding_window", "least_outstanding"),
+    "prefix_cache": ("prefix_cache", "sticky"),
+}
+
+
+async def _chat(
+    chat_id: int,
+    turns: int,
+    manager: ContextManager,
+    router: EndpointRouter,
+    ttft: List[float],
+) -> None:
+    entry: Dict = {"messages": [{"role": "system", "content": SYSTEM}], "metadata": {}}
+    for turn in range(turns):
+        entry["messages"].append(
+            {"role": "user", "content": f"Question {turn} of chat {chat_id}. " * 20}
+        )
+        messages = await manager.build(entry, "mock")
+        start = time.perf_counter()
+        reply = []
+        async for chunk in router.stream_chat(messages, "mock", route_key=chat_id):
+            if not reply:
+                ttft.append(time.perf_counter() - start)
+            reply.append(chunk)
+        entry["messages"].append({"role": "assistant", "content": "".join(reply)})
+
+
+async def run(chats: int, turns: int, replicas: int, max_tokens: int, prefill_delay: float) -> None:
+    print(f"{'mode':>14} {'cache hit':>10} {'ttft p50':>10} {'ttft p99':>10}")
+    for mode, (policy, routing) in MODES.items():
+        servers = [
+            await MockLLMServer(tokens=32, token_delay=0, prefill_delay=prefill_delay).start()
+            for _ in range(replicas)
+        ]
+        http_client = create_http_client(PoolSettings(http2=False))
+        router = EndpointRouter(
+            parse_endpoints([server.uri for server in servers]),
+            lambda uri: OpenAIBackend(uri, http_client, report_usage=True),
+            http_client,
+            policy=routing,
+            health_check_interval=0,
+        )
+        manager = ContextManager.from_config(
+            {"policy": policy, "max_tokens": max_tokens}, reserve_tokens=256, summarize=None
+        )
+
+        ttft: List[float] = []
+        await asyncio.gather(*(_chat(i, turns, manager, router, ttft) for i in range(chats)))
+
+        stats = router.backend_stats()
+        hit_ratio = stats["cached_tokens"] / max(stats["prompt_tokens"], 1)
+        print(
+            f"{mode:>14} {hit_ratio:>9.1%} "
+            f"{percentile(ttft, 50) * 1000:>8.1f}ms {percentile(ttft, 99) * 1000:>8.1f}ms"
+        )
+        await router.aclose()
+        await http_client.aclose()
+        for server in servers:
+            await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--prefill-delay", type=float, default=0.00005)
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, args.turns, args.replicas, args.max_tokens, args.prefill_delay))
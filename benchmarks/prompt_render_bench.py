@@ -0,0 +1,82 @@
+"""
+CPU cost per turn of building a raw completion prompt: formatting the whole
+template for every message on each turn versus the compiled templates and
+the incremental ``PromptRenderer``.
+
+    python -m benchmarks.prompt_render_bench --turns 10 50 200
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import yaml
+
+from bot.prompt_templates import PromptRenderer, compile_templates
+
+TEMPLATES = "config/instruction_templates.yml"
+SYSTEM = "You are a helpful assistant. " * 20
+TURN = "Could you explain how this part of the code works and why? " * 8
+
+
+def legacy(messages: List[Dict[str, str]], data: Dict) -> str:
+    """Formats every part of the template anew on every turn."""
+    template = data["prompt_template"]
+    parts = [template["header"].format(system_prompt=messages[0]["content"])]
+    for message in messages[1:]:
+        if message["role"] == "user":
+            parts.append(template["user"].format(input=message["content"]))
+        else:
+            parts.append(template["output"].format(output=message["content"]))
+    parts.append(template["output"].split("{output}")[0])
+    return "".join(parts)
+
+
+def chat(turns: int) -> List[List[Dict[str, str]]]:
+    """The messages sent on each turn of a chat."""
+    messages = [{"role": "system", "content": SYSTEM}]
+    snapshots = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"{turn}: {TURN}"})
+        snapshots.append(list(messages))
+        messages.append({"role": "assistant", "content": f"{turn}: {TURN * 2}"})
+    return snapshots
+
+
+def run(turns_list: List[int], template_name: str, repeat: int) -> None:
+    with open(TEMPLATES, encoding="utf8") as f:
+        data = yaml.safe_load(f)
+    template = compile_templates(data)[template_name]
+    print(f"template {template_name}, microseconds per turn")
+    print(f"{'turns':>6}{'legacy':>10}{'compiled':>10}{'incremental':>13}{'speedup':>9}")
+    for turns in turns_list:
+        snapshots = chat(turns)
+        legacy_time = compiled_time = incremental_time = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for messages in snapshots:
+                legacy(messages, data[template_name])
+            legacy_time = min(legacy_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            compiled = [template.render(messages) for messages in snapshots]
+            compiled_time = min(compiled_time, time.perf_counter() - start)
+
+            renderer = PromptRenderer()
+            start = time.perf_counter()
+            incremental = [renderer.render(0, messages, template) for messages in snapshots]
+            incremental_time = min(incremental_time, time.perf_counter() - start)
+            assert compiled == incremental
+        print(
+            f"{turns:>6}{legacy_time / turns * 1e6:>10.1f}{compiled_time / turns * 1e6:>10.1f}"
+            f"{incremental_time / turns * 1e6:>13.1f}{legacy_time / incremental_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--template", default="ChatML")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.turns, args.template, args.repeat)
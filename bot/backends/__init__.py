@@ -0,0 +1,28 @@
+from .base import ChatBackend
+from .g4f_backend import G4FBackend
+from .openai_backend import OpenAIBackend
+from .pool import PoolSettings, create_http_client
+from .raw_backend import (
+    RAW_BACKENDS,
+    ExLlamaBackend,
+    LlamaCppBackend,
+    RawCompletionBackend,
+    SGLangBackend,
+)
+from .router import Endpoint, EndpointRouter, parse_endpoints
+
+__all__ = [
+    "RAW_BACKENDS",
+    "ChatBackend",
+    "Endpoint",
+    "EndpointRouter",
+    "ExLlamaBackend",
+    "G4FBackend",
+    "LlamaCppBackend",
+    "OpenAIBackend",
+    "PoolSettings",
+    "RawCompletionBackend",
+    "SGLangBackend",
+    "create_http_client",
+    "parse_endpoints",
+]
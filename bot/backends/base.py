@@ -0,0 +1,56 @@
+from typing import AsyncIterator, Dict, Hashable, List, Optional
+
+
+class ChatBackend:
+    """
+    Common interface of the LLM backends used by the message handler.
+
+    Implementations must never block the event loop: every network call is
+    awaited, so one slow stream cannot stall the other chats.
+    """
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        route_key: Optional[Hashable] = None,
+        prompt: Optional[str] = None,
+        stop: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Generate a reply for the conversation.
+
+        Parameters
+        ----------
+        messages : List[Dict[str, str]]
+            The conversation in OpenAI ``messages`` format.
+        model : str
+            The model name passed to the backend.
+        stream : bool
+            If False the whole reply is yielded as a single chunk.
+        route_key : Optional[Hashable]
+            Identifies the conversation, so backends with several replicas
+            can send its requests to the same one.
+        prompt : Optional[str]
+            The conversation rendered with the instruction template, only
+            given to raw completion backends.
+        stop : Optional[List[str]]
+            Strings ending a turn of that template.
+
+        Returns
+        -------
+        AsyncIterator[str]
+            The text deltas of the reply.
+        """
+        raise NotImplementedError
+
+    def health_url(self, uri: str) -> str:
+        """The url probed by the health checks of the router."""
+        return f"{uri.rstrip('/')}/models"
+
+    def start(self) -> None:
+        """Start background tasks, if any, on the running event loop."""
+
+    async def aclose(self) -> None:
+        """Release resources owned by the backend (not the shared HTTP pool)."""
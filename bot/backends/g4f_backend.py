@@ -0,0 +1,34 @@
+from typing import AsyncIterator, Dict, Hashable, List, Optional
+
+from g4f.client import AsyncClient
+
+from .base import ChatBackend
+
+
+class G4FBackend(ChatBackend):
+    """Backend for the g4f provider client, used when no backend is configured."""
+
+    def __init__(self):
+        self.client = AsyncClient()
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        route_key: Optional[Hashable] = None,
+    ) -> AsyncIterator[str]:
+        # g4f providers expect plain dicts, not history records
+        messages = [dict(message) for message in messages]
+        if not stream:
+            response = await self.client.chat.completions.create(
+                model=model, messages=messages, stream=False
+            )
+            yield response.choices[0].message.content or ""
+            return
+
+        async for chunk in self.client.chat.completions.create(
+            model=model, messages=messages, stream=True
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,105 @@
+import time
+from typing import AsyncIterator, Dict, Hashable, List, Optional
+
+import httpx
+import openai
+
+from .base import ChatBackend
+
+
+class OpenAIBackend(ChatBackend):
+    """
+    Backend for OpenAI-compatible chat-completions servers (SGLang, vLLM, ...).
+
+    The ``AsyncOpenAI`` client is cheap to build because it borrows the shared
+    ``httpx.AsyncClient``, so pooled keep-alive connections survive settings
+    updates.
+
+    Attributes
+    ----------
+    stats : Dict[str, float]
+        ``requests``, ``first_tokens`` and ``ttft_seconds`` (their summed time
+        to first token), and with ``report_usage`` the ``prompt_tokens`` and
+        the ``cached_tokens`` served from the server's prefix cache.
+
+    ``sampling`` holds request parameters such as ``temperature``, ``top_p``
+    or ``seed``; the server's defaults apply to everything it leaves out.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        http_client: httpx.AsyncClient,
+        api_key: Optional[str] = "0",
+        max_retries: int = 2,
+        report_usage: bool = False,
+        sampling: Optional[Dict] = None,
+    ):
+        self.uri = uri
+        self.sampling = sampling or {}
+        # Asks for a final usage chunk, which SGLang and vLLM extend with
+        # prompt_tokens_details.cached_tokens
+        self.report_usage = report_usage
+        self.client = openai.AsyncOpenAI(
+            base_url=uri,
+            api_key=api_key,
+            http_client=http_client,
+            timeout=http_client.timeout,
+            max_retries=max_retries,
+        )
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "first_tokens": 0,
+            "ttft_seconds": 0.0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+        }
+
+    def _record_usage(self, usage) -> None:
+        if usage is None:
+            return
+        self.stats["prompt_tokens"] += usage.prompt_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.stats["cached_tokens"] += getattr(details, "cached_tokens", None) or 0
+
+    def _record_first_token(self, start: float) -> None:
+        self.stats["first_tokens"] += 1
+        self.stats["ttft_seconds"] += time.monotonic() - start
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        route_key: Optional[Hashable] = None,
+    ) -> AsyncIterator[str]:
+        options = dict(self.sampling)
+        if stream and self.report_usage:
+            options["stream_options"] = {"include_usage": True}
+        self.stats["requests"] += 1
+        start = time.monotonic()
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=stream,
+            **options,
+        )
+
+        if not stream:
+            self._record_first_token(start)
+            self._record_usage(response.usage)
+            yield response.choices[0].message.content or ""
+            return
+
+        # Closing the stream returns the connection to the pool even if the
+        # consumer stops early
+        async with response:
+            first = True
+            async for chunk in response:
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        self._record_first_token(start)
+                    yield chunk.choices[0].delta.content
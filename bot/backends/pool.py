@@ -0,0 +1,97 @@
+import importlib.util
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSettings:
+    """
+    Connection pool and timeout settings shared by every backend client.
+
+    Attributes
+    ----------
+    max_connections : int
+        Upper bound of open connections across all backend endpoints.
+    max_keepalive_connections : int
+        Idle connections kept alive for reuse between requests.
+    keepalive_expiry : float
+        Seconds an idle connection stays in the pool.
+    connect_timeout, read_timeout, write_timeout, pool_timeout : float
+        Timeouts in seconds. ``read_timeout`` is the longest gap allowed
+        between two streamed chunks, not the length of the whole generation.
+    http2 : bool
+        Negotiate HTTP/2 when the server offers it (needs the ``h2`` package).
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 10.0,
+        http2: bool = True,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.http2 = http2
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "PoolSettings":
+        """Build settings from the optional ``backend_pool`` block of config.yml"""
+        config = config or {}
+        unknown = set(config) - set(cls().__dict__)
+        if unknown:
+            raise ValueError(f"Unknown backend_pool settings: {sorted(unknown)}")
+        return cls(**config)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def http2_available() -> bool:
+    """HTTP/2 support in httpx is provided by the optional ``h2`` package."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client(settings: PoolSettings) -> httpx.AsyncClient:
+    """
+    Create the non-blocking HTTP client whose connection pool is shared by all
+    backend requests.
+
+    HTTP/2 is only negotiated over TLS (ALPN), so plain ``http://`` endpoints
+    keep using pooled HTTP/1.1 keep-alive connections.
+    """
+    http2 = settings.http2 and http2_available()
+    if settings.http2 and not http2:
+        logger.warning("HTTP/2 requested but the 'h2' package is missing, using HTTP/1.1")
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=settings.limits,
+        timeout=settings.timeout,
+    )
@@ -0,0 +1,217 @@
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .base import ChatBackend
+
+logger = logging.getLogger(__name__)
+
+
+class RawCompletionBackend(ChatBackend):
+    """
+    Base of the backends for native text completion servers, which take the
+    prompt rendered with the instruction template instead of messages.
+
+    The response is parsed line by line as it arrives, as server-sent events
+    (``data: {...}``) or as newline-delimited JSON, so neither the stream nor
+    the whole reply is buffered. A subclass sets the ``PATH`` appended to a
+    bare server uri, builds the request body and reads the text of events.
+
+    ``stop`` holds the strings that end a turn of the template. They are
+    passed to the server so it stops there instead of writing the next turn.
+
+    Attributes
+    ----------
+    stats : Dict[str, float]
+        ``requests``, ``first_tokens`` and ``ttft_seconds`` (their summed time
+        to first token).
+    """
+
+    PATH = "/generate"
+    HEALTH_PATH = "/health"
+
+    def __init__(
+        self,
+        uri: str,
+        http_client: httpx.AsyncClient,
+        sampling: Optional[Dict] = None,
+        max_new_tokens: int = 1024,
+    ):
+        parsed = urlparse(uri)
+        # A bare server address gets the default path of the server
+        self.base = f"{parsed.scheme}://{parsed.netloc}"
+        self.url = uri if parsed.path.strip("/") else self.base + self.PATH
+        self.http_client = http_client
+        self.sampling = sampling or {}
+        self.max_new_tokens = max_new_tokens
+        self.stats: Dict[str, float] = {"requests": 0, "first_tokens": 0, "ttft_seconds": 0.0}
+
+    def health_url(self, uri: str) -> str:
+        return self.base + self.HEALTH_PATH
+
+    def request(self, prompt: str, stop: List[str], stream: bool) -> Dict:
+        """The JSON body of a completion request."""
+        raise NotImplementedError
+
+    def reader(self) -> Callable[[Dict], Optional[str]]:
+        """
+        Returns the function giving the new text of each event of one
+        response, or of a whole response when not streaming.
+        """
+        raise NotImplementedError
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        route_key: Optional[Hashable] = None,
+        prompt: Optional[str] = None,
+        stop: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        if prompt is None:
+            raise ValueError(f"{type(self).__name__} needs a prompt rendered with a prompt_template")
+        self.stats["requests"] += 1
+        start = time.monotonic()
+        body = self.request(prompt, stop or [], stream)
+        read = self.reader()
+
+        if not stream:
+            response = await self.http_client.post(self.url, json=body)
+            response.raise_for_status()
+            self._record_first_token(start)
+            yield read(response.json()) or ""
+            return
+
+        # Leaving the block closes the response, which aborts the generation
+        # when the consumer stops early
+        async with self.http_client.stream("POST", self.url, json=body) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                response.raise_for_status()
+            first = True
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    line = line[5:].strip()
+                    if line == "[DONE]":
+                        return
+                elif not line.startswith("{"):
+                    # Blank event separators and other SSE fields
+                    continue
+                delta = read(json.loads(line))
+                if delta:
+                    if first:
+                        first = False
+                        self._record_first_token(start)
+                    yield delta
+
+    def _record_first_token(self, start: float) -> None:
+        self.stats["first_tokens"] += 1
+        self.stats["ttft_seconds"] += time.monotonic() - start
+
+
+class SGLangBackend(RawCompletionBackend):
+    """
+    SGLang's native ``/generate`` endpoint.
+
+    Skips the chat template and OpenAI layers of the server and asks it not
+    to return log probabilities. SGLang streams the whole text so far in
+    every event, only the new part is yielded. A server started with
+    ``--incremental-streaming-output`` (``--stream-output`` in older
+    releases) sends only the new text, set ``incremental_output`` for it: a
+    repeated token such as "ha", "ha" can not be told apart from cumulative
+    text. An event that does not extend the text in cumulative mode switches
+    the response to incremental text rather than losing it.
+    """
+
+    PATH = "/generate"
+
+    def __init__(self, *args, incremental_output: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.incremental_output = incremental_output
+
+    def request(self, prompt: str, stop: List[str], stream: bool) -> Dict:
+        return {
+            "text": prompt,
+            "sampling_params": {"max_new_tokens": self.max_new_tokens, "stop": stop, **self.sampling},
+            "stream": stream,
+            "return_logprob": False,
+        }
+
+    def reader(self) -> Callable[[Dict], Optional[str]]:
+        streamed = ""
+        incremental = self.incremental_output
+
+        def read(event: Dict) -> Optional[str]:
+            nonlocal streamed, incremental
+            text = event.get("text") or ""
+            if not incremental and not text.startswith(streamed):
+                logger.warning(
+                    "%s streams incremental text, set incremental_output in raw_backend", self.url
+                )
+                incremental = True
+                return text
+            if incremental:
+                return text
+            delta = text[len(streamed) :]
+            streamed = text
+            return delta
+
+        return read
+
+
+class LlamaCppBackend(RawCompletionBackend):
+    """
+    The ``/completion`` endpoint of the llama.cpp server.
+
+    ``cache_prompt`` lets the server reuse the KV cache of the common prefix
+    with the previous request of its slot, which is most of a chat's prompt.
+    """
+
+    PATH = "/completion"
+
+    def request(self, prompt: str, stop: List[str], stream: bool) -> Dict:
+        return {
+            "prompt": prompt,
+            "n_predict": self.max_new_tokens,
+            "stop": stop,
+            "stream": stream,
+            "cache_prompt": True,
+            **self.sampling,
+        }
+
+    def reader(self) -> Callable[[Dict], Optional[str]]:
+        return lambda event: event.get("content")
+
+
+class ExLlamaBackend(RawCompletionBackend):
+    """
+    ExLlama style ``/generate`` servers, which take ``prompt`` with
+    ``max_new_tokens`` and ``stop_strings`` and stream the new ``text`` as
+    newline-delimited JSON or server-sent events.
+    """
+
+    PATH = "/generate"
+
+    def request(self, prompt: str, stop: List[str], stream: bool) -> Dict:
+        return {
+            "prompt": prompt,
+            "max_new_tokens": self.max_new_tokens,
+            "stop_strings": stop,
+            "stream": stream,
+            **self.sampling,
+        }
+
+    def reader(self) -> Callable[[Dict], Optional[str]]:
+        return lambda event: event.get("text")
+
+
+RAW_BACKENDS = {
+    "sglang_generate": SGLangBackend,
+    "llamacpp_completion": LlamaCppBackend,
+    "exllama_generate": ExLlamaBackend,
+}
@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional, Union
+
+import httpx
+
+from ..helpers.hash_ring import HashRing
+from ..metrics import REGISTRY
+from .base import ChatBackend
+
+logger = logging.getLogger(__name__)
+
+BACKEND_SECONDS = REGISTRY.histogram(
+    "backend_request_seconds", "Duration of backend requests until the stream ends"
+)
+
+EndpointConfig = Union[str, Dict, List[Union[str, Dict]]]
+
+# Client errors another replica would answer the same way; a request timeout
+# and rate limiting are the replica's fault and still fail over
+_RETRIED_CLIENT_STATUS = (408, 429)
+
+
+def parse_endpoints(uri: EndpointConfig) -> List[Dict]:
+    """
+    Normalize the ``uri`` setting, which is either one URI or a list of URIs
+    and ``{uri, weight}`` mappings, to a list of ``{uri, weight}`` dicts.
+    """
+    items = uri if isinstance(uri, list) else [uri]
+    endpoints = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"uri": item}
+        if not item.get("uri"):
+            raise ValueError(f"Endpoint without uri: {item}")
+        weight = float(item.get("weight", 1))
+        if weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive: {item}")
+        endpoints.append({"uri": item["uri"], "weight": weight})
+    if not endpoints:
+        raise ValueError("At least one backend uri is required")
+    return endpoints
+
+
+def is_client_error(error: Exception) -> bool:
+    """
+    Whether ``error`` is a 4xx answer to the request itself, raised as
+    ``openai.APIStatusError`` or ``httpx.HTTPStatusError``.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    return isinstance(status, int) and 400 <= status < 500 and status not in _RETRIED_CLIENT_STATUS
+
+
+class Endpoint:
+    """
+    One backend replica with its load and health statistics.
+
+    Attributes
+    ----------
+    outstanding : int
+        Requests currently streaming from the endpoint.
+    latency : Optional[float]
+        Exponentially weighted moving average of the time to first token.
+    failures : int
+        Consecutive failed requests or health checks.
+    open_until : float
+        While in the future the circuit is open and the endpoint is avoided.
+    """
+
+    def __init__(self, uri: str, weight: float, backend: ChatBackend):
+        self.uri = uri
+        self.weight = weight
+        self.backend = backend
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.open_until <= time.monotonic()
+
+    def record_latency(self, seconds: float, alpha: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += alpha * (seconds - self.latency)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, threshold: int, cooldown: float) -> None:
+        self.failures += 1
+        if self.failures >= threshold:
+            # Open the circuit; after the cooldown one request tests it again
+            self.open_until = time.monotonic() + cooldown
+
+
+class EndpointRouter(ChatBackend):
+    """
+    Spreads requests over several replicas of an OpenAI-compatible backend.
+
+    Policies
+    --------
+    least_outstanding
+        The endpoint with the fewest streaming requests per unit of weight.
+    latency
+        The endpoint with the lowest expected wait, its time to first token
+        EWMA times its queue, per unit of weight.
+    sticky
+        Consistent hashing of the ``route_key`` (the chat id), so every turn
+        of a chat reaches the replica holding its cached prompt prefix. Keys
+        of an unavailable replica move to the next one on the ring only.
+
+    Endpoints failing ``failure_threshold`` times in a row are skipped for
+    ``cooldown`` seconds (circuit breaking), and a background task probes
+    ``GET {uri}/models`` to open or close circuits before users hit them.
+    A stream that fails before its first token is retried on another
+    endpoint; once text was yielded the error is raised. Client errors such
+    as a 400 for an oversized prompt are raised at once and do not count
+    against the endpoint, every replica would refuse the request alike.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``requests``, ``retries`` and ``failures``.
+    """
+
+    POLICIES = ("least_outstanding", "latency", "sticky")
+
+    def __init__(
+        self,
+        endpoints: List[Dict],
+        create_backend: Callable[[str], ChatBackend],
+        http_client: httpx.AsyncClient,
+        policy: str = "least_outstanding",
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 5.0,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        ewma_alpha: float = 0.3,
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown routing policy '{policy}'")
+        self.create_backend = create_backend
+        self.http_client = http_client
+        self.policy = policy
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.endpoints: List[Endpoint] = []
+        self._by_uri: Dict[str, Endpoint] = {}
+        # Stats of endpoints removed by a reload, so the exported totals never drop
+        self._retired_stats: Dict[str, float] = {}
+        self._ring = HashRing()
+        self._health_checker: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0, "failures": 0}
+        self.update_endpoints(endpoints)
+
+    def update_endpoints(self, endpoints: List[Dict]) -> None:
+        """
+        Replace the endpoint list. Endpoints whose URI is unchanged keep their
+        client and statistics, so in-flight streams are not affected.
+        """
+        current = {endpoint.uri: endpoint for endpoint in self.endpoints}
+        updated = []
+        for config in endpoints:
+            endpoint = current.get(config["uri"])
+            if endpoint is None:
+                endpoint = Endpoint(config["uri"], config["weight"], self.create_backend(config["uri"]))
+            endpoint.weight = config["weight"]
+            updated.append(endpoint)
+        kept = {id(endpoint) for endpoint in updated}
+        for endpoint in self.endpoints:
+            if id(endpoint) not in kept:
+                self._add_stats(self._retired_stats, endpoint)
+        ring = HashRing()
+        for endpoint in updated:
+            ring.add(endpoint.uri, endpoint.weight)
+        self._ring = ring
+        self._by_uri = {endpoint.uri: endpoint for endpoint in updated}
+        self.endpoints = updated
+
+    def _score(self, endpoint: Endpoint) -> float:
+        if self.policy == "latency" and endpoint.latency is not None:
+            return endpoint.latency * (endpoint.outstanding + 1) / endpoint.weight
+        return (endpoint.outstanding + 1) / endpoint.weight
+
+    def choose(
+        self, exclude: Optional[List[Endpoint]] = None, key: Optional[Hashable] = None
+    ) -> Optional[Endpoint]:
+        """
+        Pick the endpoint for the next request.
+
+        Parameters
+        ----------
+        exclude : Optional[List[Endpoint]]
+            Endpoints that already failed this request.
+        key : Optional[Hashable]
+            The routing key of the sticky policy.
+
+        Returns
+        -------
+        Optional[Endpoint]
+            The best available endpoint. If every circuit is open, the one
+            that reopens first, so a single replica is never refused. None if
+            all endpoints were excluded.
+        """
+        candidates = [e for e in self.endpoints if not exclude or e not in exclude]
+        if not candidates:
+            return None
+        if self.policy == "sticky" and key is not None:
+            for uri in self._ring.walk(key):
+                endpoint = self._by_uri.get(uri)
+                if endpoint in candidates and endpoint.available:
+                    return endpoint
+        available = [e for e in candidates if e.available]
+        if not available:
+            return min(candidates, key=lambda e: e.open_until)
+        best = min(self._score(e) for e in available)
+        # Random choice among ties spreads an idle cluster evenly
+        return random.choice([e for e in available if self._score(e) == best])
+
+    def backend_stats(self) -> Dict[str, float]:
+        """
+        Sums the ``stats`` of the endpoint backends, such as the time to first
+        token and the prompt tokens served from the prefix cache. Endpoints
+        removed by a reload still count.
+        """
+        totals = dict(self._retired_stats)
+        for endpoint in self.endpoints:
+            self._add_stats(totals, endpoint)
+        return totals
+
+    @staticmethod
+    def _add_stats(totals: Dict[str, float], endpoint: Endpoint) -> None:
+        for key, value in getattr(endpoint.backend, "stats", {}).items():
+            totals[key] = totals.get(key, 0) + value
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        route_key: Optional[Hashable] = None,
+        prompt: Optional[str] = None,
+        stop: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        self.start()
+        # Only raw completion backends take the rendered prompt
+        extra = {} if prompt is None else {"prompt": prompt, "stop": stop}
+        self.stats["requests"] += 1
+        tried: List[Endpoint] = []
+        last_error: Optional[Exception] = None
+
+        while True:
+            endpoint = self.choose(exclude=tried, key=route_key)
+            if endpoint is None:
+                if last_error is None:
+                    raise RuntimeError("no backend endpoint available")
+                raise last_error
+            tried.append(endpoint)
+
+            endpoint.outstanding += 1
+            start = time.monotonic()
+            started = False
+            try:
+                async with aclosing(endpoint.backend.stream_chat(messages, model, stream, **extra)) as chunks:
+                    async for chunk in chunks:
+                        if not started:
+                            started = True
+                            endpoint.record_latency(time.monotonic() - start, self.ewma_alpha)
+                            endpoint.record_success()
+                        yield chunk
+                endpoint.record_success()
+                return
+            except Exception as e:
+                if is_client_error(e):
+                    raise
+                self.stats["failures"] += 1
+                endpoint.record_failure(self.failure_threshold, self.cooldown)
+                if started:
+                    raise
+                logger.warning("Backend %s failed before the first token: %s", endpoint.uri, e)
+                last_error = e
+                self.stats["retries"] += 1
+            finally:
+                endpoint.outstanding -= 1
+                BACKEND_SECONDS.observe(time.monotonic() - start)
+
+    def start(self) -> None:
+        if self._health_checker is None and self.health_check_interval:
+            self._health_checker = asyncio.create_task(self._check_health())
+
+    async def aclose(self) -> None:
+        if self._health_checker is not None:
+            self._health_checker.cancel()
+            try:
+                await self._health_checker
+            except asyncio.CancelledError:
+                pass
+            self._health_checker = None
+        for endpoint in self.endpoints:
+            await endpoint.backend.aclose()
+
+    async def _probe(self, endpoint: Endpoint) -> None:
+        try:
+            response = await self.http_client.get(
+                endpoint.backend.health_url(endpoint.uri), timeout=self.health_check_timeout
+            )
+            response.raise_for_status()
+        except Exception as e:
+            if endpoint.available:
+                logger.warning("Health check of %s failed: %s", endpoint.uri, e)
+            endpoint.record_failure(self.failure_threshold, self.cooldown)
+        else:
+            endpoint.record_success()
+
+    async def _check_health(self) -> None:
+        while True:
+            await asyncio.gather(*(self._probe(e) for e in self.endpoints))
+            await asyncio.sleep(self.health_check_interval)
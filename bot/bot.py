@@ -1,5 +1,9 @@
+import asyncio
 from functools import partial
 
+from telegram import Message, Update
+from telegram.constants import ParseMode
+
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -9,12 +13,45 @@ from telegram.ext import (
 
 import logging
 
+from .backends import PoolSettings
+from .config_watcher import ConfigWatcher
+from .conversation_store import ConversationStore
+from .storage import WriteBehindStorage
+from .edit_scheduler import EditScheduler
+from .error_reporter import ErrorReporter
 from .message_handler import MyMessageHandler
 from .command_handler import Commands
 from .helpers.error_helper import ErrorHelper
+from .metrics import REGISTRY, MetricsServer
+from .runtime_config import RuntimeConfig, split_users
+from .webhook import WebhookApp, check_webhook, serve as serve_webhook, webhook_path
 
 logger = logging.getLogger(__name__)
 
+
+class AllowedUsersFilter(filters.MessageFilter):
+    """
+    Passes messages of the allowed users, or of everyone if the list is
+    empty. Unlike ``filters.User`` it takes usernames and ids together and
+    can be replaced at runtime.
+    """
+
+    def __init__(self, users: list):
+        super().__init__(name="AllowedUsersFilter")
+        self.set_users(users)
+
+    def set_users(self, users: list) -> None:
+        self.user_ids, self.usernames = split_users(users)
+
+    def filter(self, message: Message) -> bool:
+        if not self.user_ids and not self.usernames:
+            return True
+        user = message.from_user
+        return user is not None and (
+            user.id in self.user_ids
+            or (user.username is not None and user.username.lower() in self.usernames)
+        )
+
 class Bot:
     def __init__(
         self,
@@ -29,6 +66,25 @@ class Bot:
         instruction_templates: dict,
         max_new_tokens: int,
         streaming: bool,
+        backend_pool: dict = None,
+        routing: dict = None,
+        edit_rate_limits: dict = None,
+        new_dialog_timeout: float = None,
+        conversation_limits: dict = None,
+        context: dict = None,
+        storage: dict = None,
+        concurrent_messages: str = "serialize",
+        prefix_cache: bool = False,
+        metrics: dict = None,
+        telegram_api_url: str = None,
+        webhook: dict = None,
+        sampling: dict = None,
+        raw_backend: dict = None,
+        response_cache: dict = None,
+        admission: dict = None,
+        error_reports: dict = None,
+        chat_modes: dict = None,
+        config_dir: str = None,
     ):
         self.token = token
         self.backend = backend
@@ -41,10 +97,101 @@ class Bot:
         self.max_new_tokens = max_new_tokens
         self.streaming = streaming
         self.model = model
+        self.backend_pool = backend_pool
+        self.routing = routing
+        self.edit_rate_limits = edit_rate_limits or {}
+        self.new_dialog_timeout = new_dialog_timeout
+        self.conversation_limits = conversation_limits or {}
+        self.context = context
+        self.storage = storage
+        self.concurrent_messages = concurrent_messages
+        self.prefix_cache = prefix_cache
+        self.metrics = metrics or {}
+        self.metrics_server = None
+        self.telegram_api_url = telegram_api_url
+        self.webhook = webhook or {}
+        check_webhook(self.webhook)
+        self.sampling = sampling
+        self.raw_backend = raw_backend
+        self.response_cache = response_cache
+        self.admission = admission
+        self.error_reports = error_reports
+        self.error_reporter = None
+        self.chat_modes = chat_modes or {}
+        # Files reloaded while running, None disables reloading
+        self.config_dir = config_dir
+        self.config_watcher = None
+        self.loop = None
 
     def run(self) -> None:
         logger.info("Starting up bot...")
-        app = ApplicationBuilder().token(self.token).concurrent_updates(True).build()
+        app = self.build_application()
+
+        if self.webhook.get("url"):
+            asyncio.run(self._run_webhook(app))
+            return
+
+        # start the bot
+        logger.info("Pooling...")
+        app.run_polling()
+
+    async def _run_webhook(self, app) -> None:
+        """Receive updates on an ASGI webhook instead of long polling."""
+        url = self.webhook["url"]
+        ingress = WebhookApp(
+            app,
+            path=webhook_path(self.webhook),
+            secret_token=self.webhook.get("secret_token"),
+            max_concurrent_updates=self.webhook.get("max_concurrent_updates", 256),
+            retry_after=self.webhook.get("retry_after", 1),
+        )
+        async with app:
+            await app.post_init(app)
+            await app.bot.set_webhook(
+                url,
+                secret_token=self.webhook.get("secret_token") or None,
+                max_connections=self.webhook.get("max_connections", 40),
+                allowed_updates=Update.ALL_TYPES,
+            )
+            await app.start()
+            logger.info(f"Receiving updates on {url}")
+            try:
+                await serve_webhook(
+                    ingress,
+                    host=self.webhook.get("listen", "0.0.0.0"),
+                    port=self.webhook.get("port", 8443),
+                    cert=self.webhook.get("cert"),
+                    key=self.webhook.get("key"),
+                )
+            finally:
+                await ingress.drain()
+                await app.stop()
+        await app.post_shutdown(app)
+
+    def build_application(self):
+        """Create the application with all handlers, without starting it."""
+        builder = (
+            ApplicationBuilder()
+            .token(self.token)
+            .concurrent_updates(True)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if self.telegram_api_url:
+            # A self-hosted Bot API server, or the fake one of the load test
+            builder = builder.base_url(self.telegram_api_url)
+        app = builder.build()
+
+        # One scheduler keeps the edits of all streaming chats inside the flood limits
+        self.edit_scheduler = EditScheduler(app.bot, **self.edit_rate_limits)
+
+        # Errors reach the developer as one digest per window, not one message each
+        self.error_reporter = ErrorReporter.from_config(
+            self.error_reports,
+            lambda text: app.bot.send_message(
+                chat_id=self.dev_id, text=text, parse_mode=ParseMode.HTML
+            ),
+        )
 
         self.message_handling = MyMessageHandler(
             template=self.template,
@@ -55,16 +202,29 @@ class Bot:
             streaming=self.streaming,
             URI=self.uri,
             MODEL=self.model,
+            edit_scheduler=self.edit_scheduler,
+            pool_settings=PoolSettings.from_config(self.backend_pool),
+            routing=self.routing,
+            conversation_memory=ConversationStore(
+                ttl=self.new_dialog_timeout,
+                storage=WriteBehindStorage.from_config(self.storage),
+                **self.conversation_limits,
+            ),
+            context=self.context,
+            max_new_tokens=self.max_new_tokens,
+            concurrent_messages=self.concurrent_messages,
+            prefix_cache=self.prefix_cache,
+            sampling=self.sampling,
+            raw_backend=self.raw_backend,
+            response_cache=self.response_cache,
+            admission=self.admission,
+            users=self.users,
         )
 
+        self._register_metrics()
+
         # add handlers
-        user_filter = filters.ALL
-        if len(self.users) > 0:
-            usernames = [x for x in self.users if isinstance(x, str)]
-            user_ids = [x for x in self.users if isinstance(x, int)]
-            user_filter = filters.User(username=usernames) | filters.User(
-                user_id=user_ids
-            )
+        self.user_filter = user_filter = AllowedUsersFilter(self.users)
 
         # Commands
         app.add_handler(CommandHandler("start", Commands.start_command))
@@ -80,6 +240,13 @@ class Bot:
             )
         )
 
+        app.add_handler(
+            CommandHandler(
+                "stats",
+                partial(Commands.stats_command, registry=REGISTRY, dev_id=self.dev_id),
+            )
+        )
+
         # Messages
         app.add_handler(
             MessageHandler(
@@ -104,9 +271,124 @@ class Bot:
 
         # Error handling
         app.add_error_handler(
-            partial(ErrorHelper.error_handler, message_handler=self.message_handling)
+            partial(
+                ErrorHelper.error_handler,
+                message_handler=self.message_handling,
+                error_reporter=self.error_reporter,
+            )
         )
+        return app
 
-        # start the bot
-        logger.info("Pooling...")
-        app.run_polling()
+    def _register_metrics(self) -> None:
+        handler = self.message_handling
+        memory = handler.conversation_memory
+        REGISTRY.register_stats("edit_scheduler", lambda: self.edit_scheduler.stats)
+        REGISTRY.register_stats("conversations", lambda: memory.stats)
+        REGISTRY.register_stats("chat_turns", lambda: handler.chat_coordinator.stats)
+        REGISTRY.register_stats("prompt_renderer", lambda: handler.prompt_renderer.stats)
+        if self.error_reporter is not None:
+            REGISTRY.register_stats("error_reports", lambda: self.error_reporter.stats)
+        if memory.storage is not None:
+            REGISTRY.register_stats("storage", lambda: memory.storage.stats)
+        if handler.response_cache is not None:
+            REGISTRY.register_stats("response_cache", lambda: handler.response_cache.stats)
+        scheduler = handler.generation_scheduler
+        if scheduler is not None:
+            REGISTRY.register_stats("admission", lambda: scheduler.stats)
+            REGISTRY.gauge("running_generations", "Replies holding a generation slot").set_function(
+                lambda: scheduler.running
+            )
+            REGISTRY.gauge("queued_generations", "Replies waiting for a generation slot").set_function(
+                lambda: scheduler.waiting
+            )
+        # The client is replaced when the config changes, always read the current one
+        REGISTRY.register_stats("router", lambda: getattr(handler.client, "stats", {}))
+        REGISTRY.register_stats(
+            "backend",
+            lambda: handler.client.backend_stats() if hasattr(handler.client, "backend_stats") else {},
+        )
+        REGISTRY.gauge("pending_edits", "Messages waiting for an edit").set_function(
+            lambda: self.edit_scheduler.pending
+        )
+        REGISTRY.gauge("queued_turns", "Messages waiting for the reply before them").set_function(
+            lambda: handler.chat_coordinator.waiting
+        )
+        REGISTRY.gauge("conversations_in_memory", "Chats held in memory").set_function(
+            lambda: len(memory)
+        )
+        REGISTRY.gauge("conversation_bytes", "Approximate size of the chats in memory").set_function(
+            lambda: memory.total_bytes
+        )
+
+    def apply_config(self, config: dict) -> RuntimeConfig:
+        """
+        Validate the reloadable settings of a parsed config.yml and apply
+        them to new replies; replies in progress keep their settings.
+
+        Raises
+        ------
+        ValueError
+            If the config is invalid, the running config is kept.
+        """
+        current = self.message_handling.runtime
+        runtime = RuntimeConfig.from_config(
+            config,
+            self.instruction_templates,
+            version=current.version + 1,
+            raw_prompt=self.message_handling.raw_prompt,
+        )
+        changes = current.changes(runtime)
+        if not changes:
+            return current
+        self.message_handling.apply_runtime(runtime)
+        if "allowed_telegram_usernames" in changes:
+            self.user_filter.set_users(list(runtime.users))
+        logger.info(f"Applied config version {runtime.version}, changed: {', '.join(changes)}")
+        return runtime
+
+    def apply_instruction_templates(self, instruction_templates: dict) -> None:
+        """
+        Compile reloaded instruction templates and use them for new chats.
+
+        Raises
+        ------
+        ValueError
+            If a template is invalid or the running template is gone, the
+            running templates are kept.
+        """
+        self.message_handling.set_instruction_templates(instruction_templates)
+        self.instruction_templates = instruction_templates
+        logger.info(f"Reloaded {len(instruction_templates)} instruction templates")
+
+    def apply_chat_modes(self, chat_modes: dict) -> None:
+        if not isinstance(chat_modes, dict):
+            raise ValueError("chat personalities must be a mapping")
+        self.chat_modes = chat_modes
+        logger.info(f"Reloaded {len(chat_modes)} chat personalities")
+
+    async def _post_init(self, app) -> None:
+        # Background tasks need the running event loop
+        self.loop = asyncio.get_running_loop()
+        self.message_handling.start()
+        if self.error_reporter is not None:
+            self.error_reporter.start()
+        if self.metrics.get("port") is not None:
+            self.metrics_server = MetricsServer(
+                REGISTRY, self.metrics.get("host", "127.0.0.1"), self.metrics["port"]
+            )
+            await self.metrics_server.start()
+        if self.config_dir is not None:
+            self.config_watcher = ConfigWatcher(self, self.config_dir)
+            self.config_watcher.start()
+
+    async def _post_shutdown(self, app) -> None:
+        if self.config_watcher is not None:
+            await self.config_watcher.stop()
+        if self.error_reporter is not None:
+            await self.error_reporter.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.message_handling.conversation_memory.stop()
+        await self.edit_scheduler.stop()
+        # Drain the shared backend connection pool
+        await self.message_handling.aclose()
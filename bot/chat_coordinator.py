@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTurn:
+    """
+    One message being answered in a chat.
+
+    Attributes
+    ----------
+    superseded : bool
+        Set when a newer message of the same chat took over. If the turn was
+        generating, its task has been cancelled as well.
+    """
+
+    __slots__ = ("chat_id", "task", "superseded")
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+
+    def allow_cancel(self) -> None:
+        """Let a newer message cancel the current task from now on."""
+        self.task = asyncio.current_task()
+
+    def forbid_cancel(self) -> None:
+        """Protect the rest of the turn, such as saving the reply, from cancellation."""
+        self.task = None
+
+
+class ChatCoordinator:
+    """
+    Runs the turns of a chat one at a time while different chats keep running
+    in parallel, even with ``concurrent_updates`` enabled.
+
+    Modes
+    -----
+    serialize
+        A new message waits until the previous reply is finished.
+    cancel
+        A new message cancels the reply in progress, including its backend
+        request, and is answered as soon as the cancelled turn has cleaned up.
+        Only the part of a turn between ``allow_cancel`` and ``forbid_cancel``
+        is cancelled; turns superseded elsewhere should only record their
+        message.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``turns``, ``queued`` (turns that had to wait) and ``cancelled``
+        (superseded generations that were stopped early).
+    """
+
+    MODES = ("serialize", "cancel")
+
+    def __init__(self, mode: str = "serialize"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown concurrent_messages mode '{mode}'")
+        self.mode = mode
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = {}  # turns holding or waiting for each lock
+        self._current: Dict[int, ChatTurn] = {}  # the turn holding the lock
+        self._latest: Dict[int, ChatTurn] = {}  # the newest turn, running or waiting
+        self.stats: Dict[str, int] = {"turns": 0, "queued": 0, "cancelled": 0}
+
+    @property
+    def waiting(self) -> int:
+        """The number of turns queued behind another turn of their chat."""
+        return sum(self._users.values()) - len(self._current)
+
+    @asynccontextmanager
+    async def turn(self, chat_id: int) -> AsyncIterator[ChatTurn]:
+        """
+        Wait for the chat to be free and hold it for one turn.
+
+        Parameters
+        ----------
+        chat_id : int
+            The chat of the message.
+        """
+        turn = ChatTurn(chat_id)
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+
+        previous = self._latest.get(chat_id)
+        if self.mode == "cancel" and previous is not None and not previous.superseded:
+            previous.superseded = True
+            if previous is self._current.get(chat_id) and previous.task is not None:
+                previous.task.cancel()
+            self.stats["cancelled"] += 1
+            logger.info(f"Cancelled a superseded reply in chat {chat_id}")
+        self._latest[chat_id] = turn
+        if lock.locked():
+            self.stats["queued"] += 1
+
+        try:
+            async with lock:
+                self._current[chat_id] = turn
+                self.stats["turns"] += 1
+                try:
+                    yield turn
+                finally:
+                    if self._current.get(chat_id) is turn:
+                        del self._current[chat_id]
+        finally:
+            if self._latest.get(chat_id) is turn:
+                del self._latest[chat_id]
+            self._users[chat_id] -= 1
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                del self._locks[chat_id]
@@ -1,3 +1,5 @@
+import html
+
 from telegram import Update
 from telegram.ext import (
     ContextTypes,
@@ -8,6 +10,7 @@ from telegram.constants import (
 
 from .helpers.formatting_helper import TextFormatter
 from .message_handler import MyMessageHandler
+from .metrics import MetricsRegistry
 
 import logging
 
@@ -31,6 +34,9 @@ class Commands:
 
     wipe_history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         Handles the /wipe command.
+
+    stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
+        Handles the /stats command.
     """
 
     @staticmethod
@@ -110,11 +116,42 @@ class Commands:
         # Get the user ID
         user_id = update.message.chat.id
 
-        # Check if the user has chat history
-        if user_id in message_handling.conversation_memory:
+        # Check if the user has chat history, saved history counts as well
+        if await message_handling.conversation_memory.load(user_id) is not None:
             # Delete the user's chat history
             del message_handling.conversation_memory[user_id]
             logger.info("Chat history wiped.")
             await update.message.reply_text("Your chat history has been wiped.")
         else:
             await update.message.reply_text("You have no chat history to wipe.")
+
+    @staticmethod
+    async def stats_command(
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        registry: MetricsRegistry,
+        dev_id: int,
+    ) -> None:
+        """
+        Handles the /stats command, only answered for the developer.
+
+        Parameters
+        ----------
+        update : Update
+            The update object containing the message.
+        context : ContextTypes.DEFAULT_TYPE
+            The context object.
+        registry : MetricsRegistry
+            The metrics to summarize.
+        dev_id : int
+            The only user allowed to see the metrics.
+        """
+        if not update.message or update.effective_user.id != dev_id:
+            logger.info("Ignored /stats from a user other than the developer")
+            return
+        summary = registry.summary() or "No metrics recorded yet"
+        # Telegram messages are limited to 4096 characters, cut before escaping
+        # so no entity is split
+        await update.message.reply_text(
+            f"<pre>{html.escape(summary[:4000])}</pre>", parse_mode=ParseMode.HTML
+        )
@@ -16,6 +16,24 @@ URI = config_yaml["uri"]
 MODEL = config_yaml["model"]
 USERS = config_yaml["allowed_telegram_usernames"]  # if empty all users are allowed
 STREAMING = config_yaml["enable_message_streaming"]
+BACKEND_POOL = config_yaml.get("backend_pool", {})  # optional connection pool tuning
+ROUTING = config_yaml.get("routing", {})  # optional load balancing over several uris
+EDIT_RATE_LIMITS = config_yaml.get("edit_rate_limits", {})  # optional Telegram edit budgets
+NEW_DIALOG_TIMEOUT = config_yaml.get("new_dialog_timeout")  # idle seconds before a chat is forgotten
+CONVERSATION_LIMITS = config_yaml.get("conversation_memory", {})  # optional memory bounds
+CONTEXT = config_yaml.get("context", {})  # optional context window management
+STORAGE = config_yaml.get("storage", {})  # optional persistent conversation history
+CONCURRENT_MESSAGES = config_yaml.get("concurrent_messages", "serialize")  # serialize or cancel
+PREFIX_CACHE = config_yaml.get("prefix_cache", False)  # prompts and routing shaped for prefix caching
+METRICS = config_yaml.get("metrics", {})  # optional Prometheus endpoint
+TELEGRAM_API_URL = config_yaml.get("telegram_api_url")  # optional self-hosted Bot API server
+WEBHOOK = config_yaml.get("webhook", {})  # optional webhook instead of long polling
+SHARDING = config_yaml.get("sharding", {})  # optional worker processes behind one ingress
+SAMPLING = config_yaml.get("sampling", {})  # optional request parameters, e.g. temperature
+RAW_BACKEND = config_yaml.get("raw_backend", {})  # optional options of the native completion backends
+RESPONSE_CACHE = config_yaml.get("response_cache", {})  # optional cache of replies to repeated prompts
+ADMISSION = config_yaml.get("admission", {})  # optional limit of concurrent generations
+ERROR_REPORTS = config_yaml.get("error_reports", {})  # optional tuning of the developer's error digests
 
 
 def reload_config():
@@ -1,45 +1,71 @@
-import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileSystemEvent
-from bot.bot import Bot
-from bot.config import reload_config
 import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import yaml
+
+from bot.file_watcher import FileWatcher
+from bot.logging_watcher import LoggingWatcher
+
+if TYPE_CHECKING:
+    from bot.bot import Bot
 
 logger = logging.getLogger(__name__)
 
 
-class ConfigFileHandler(FileSystemEventHandler):
-    def __init__(self, bot: Bot) -> None:
+class ConfigWatcher:
+    """
+    Reloads the files of the config directory while the bot runs: the
+    reloadable settings of config.yml, logging.yml, instruction_templates.yml
+    and chat_personalities.yml.
+
+    All of them share one ``FileWatcher`` on the bot's event loop, so a
+    reload is applied there directly. An invalid file is logged and the
+    running settings are kept.
+    """
+
+    def __init__(self, bot: "Bot", config_dir, interval: float = 1.0, debounce: float = 0.5) -> None:
         self.bot = bot
-        self.last_modified: float = time.time()
+        self.config_dir = Path(config_dir)
+        self.logging_watcher = LoggingWatcher(self.config_dir / "logging.yml")
+        self.watcher = FileWatcher(self.config_dir, interval=interval, debounce=debounce)
+        self.watcher.register("config.yml", self.reload_config)
+        self.watcher.register("logging.yml", self.reload_logging)
+        self.watcher.register("instruction_templates.yml", self.reload_instruction_templates)
+        self.watcher.register("chat_personalities.yml", self.reload_chat_modes)
 
-    def on_modified(self, event: FileSystemEvent) -> None:
-        if not event.is_directory and event.src_path.endswith("config.yml"):
-            current = time.time()
-            if current - self.last_modified < 1:  # Throttle to 1 second
-                return
-            self.last_modified = current
+    def _load(self, name: str):
+        with open(self.config_dir / name, "r", encoding="utf8") as f:
+            return yaml.safe_load(f)
 
-            try:
-                new_config: dict = reload_config()
-                self.bot.message_handling.update_client_settings(
-                    new_config["uri"], new_config["model"]
-                )
-                logger.info("Config reloaded successfully")
-            except Exception as e:
-                logger.error(f"Config reload failed: {str(e)}")
+    def reload_config(self) -> None:
+        try:
+            self.bot.apply_config(self._load("config.yml"))
+        except Exception as e:
+            logger.error(f"Config reload failed, keeping the running config: {str(e)}")
 
+    def reload_logging(self) -> None:
+        try:
+            self.logging_watcher.reload_config()
+            logger.info("Logging configuration reloaded successfully")
+        except Exception as e:
+            logger.error(f"Logging config reload failed: {str(e)}")
 
-class ConfigWatcher:
-    def __init__(self, bot: Bot) -> None:
-        self.observer = Observer()
-        self.event_handler: ConfigFileHandler = ConfigFileHandler(bot)
+    def reload_instruction_templates(self) -> None:
+        try:
+            self.bot.apply_instruction_templates(self._load("instruction_templates.yml"))
+        except Exception as e:
+            logger.error(f"Instruction templates reload failed, keeping the running ones: {str(e)}")
+
+    def reload_chat_modes(self) -> None:
+        try:
+            self.bot.apply_chat_modes(self._load("chat_personalities.yml"))
+        except Exception as e:
+            logger.error(f"Chat personalities reload failed, keeping the running ones: {str(e)}")
 
     def start(self) -> None:
-        self.observer.schedule(self.event_handler, path="config/", recursive=False)
-        self.observer.start()
+        self.watcher.start()
         logger.info("Config watcher started")
 
-    def stop(self) -> None:
-        self.observer.stop()
-        self.observer.join()
+    async def stop(self) -> None:
+        await self.watcher.stop()
@@ -0,0 +1,316 @@
+import logging
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+Summarizer = Callable[[Messages], Awaitable[str]]
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local tokenizer when one is available and falls back
+    to a length based estimate otherwise.
+
+    The tokenizer is looked up in this order: a ``tokenizer.json`` file loaded
+    with the ``tokenizers`` package, ``tiktoken``'s ``cl100k_base`` encoding,
+    then roughly four characters per token. Counts are cached per text since
+    the same history is counted again on every turn.
+    """
+
+    def __init__(self, tokenizer_path: Optional[str] = None, cache_size: int = 8192):
+        self.name = "estimate"
+        self._encode: Optional[Callable[[str], int]] = None
+
+        if tokenizer_path:
+            try:
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_file(tokenizer_path)
+                self._encode = lambda text: len(
+                    tokenizer.encode(text, add_special_tokens=False).ids
+                )
+                self.name = tokenizer_path
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {tokenizer_path}: {e}")
+
+        if self._encode is None:
+            try:
+                import tiktoken
+
+                encoding = tiktoken.get_encoding("cl100k_base")
+                self._encode = lambda text: len(encoding.encode(text, disallowed_special=()))
+                self.name = "tiktoken"
+            except Exception:
+                pass
+
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    def _count(self, text: str) -> int:
+        if self._encode is not None:
+            return self._encode(text)
+        return (len(text) + 3) // 4
+
+    def count_messages(self, messages: Messages) -> int:
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+class TruncationPolicy:
+    """Decides which part of a chat is sent when it exceeds the token budget."""
+
+    async def apply(self, entry: Dict, budget: int, counter: TokenCounter) -> Messages:
+        """
+        Parameters
+        ----------
+        entry : Dict
+            The chat from the conversation memory (``messages`` and ``metadata``).
+        budget : int
+            The number of prompt tokens available.
+        counter : TokenCounter
+            Used to measure messages.
+
+        Returns
+        -------
+        Messages
+            The messages to send, at most ``budget`` tokens when possible.
+        """
+        raise NotImplementedError
+
+
+def split_system(messages: Messages):
+    if messages and messages[0]["role"] == "system":
+        return messages[0], messages[1:]
+    return None, messages
+
+
+def sliding_window(messages: Messages, budget: int, counter: TokenCounter) -> Messages:
+    """
+    Keeps the system prompt and as many of the latest messages as fit in the
+    budget. The latest message is always kept, and the window starts with a
+    user message.
+    """
+    system, history = split_system(messages)
+    used = counter.count_messages([system]) if system else 0
+
+    start = len(history)
+    while start > 0:
+        cost = counter.count(history[start - 1]["content"]) + MESSAGE_OVERHEAD
+        if used + cost > budget and start < len(history):
+            break
+        used += cost
+        start -= 1
+
+    while start < len(history) - 1 and history[start]["role"] != "user":
+        start += 1
+
+    return ([system] if system else []) + history[start:]
+
+
+class SlidingWindowPolicy(TruncationPolicy):
+    """Drops the oldest messages until the chat fits."""
+
+    async def apply(self, entry: Dict, budget: int, counter: TokenCounter) -> Messages:
+        return sliding_window(entry["messages"], budget, counter)
+
+
+class LastTurnsPolicy(TruncationPolicy):
+    """Keeps the system prompt and the last ``turns`` user/assistant exchanges."""
+
+    def __init__(self, turns: int = 8):
+        self.turns = turns
+
+    async def apply(self, entry: Dict, budget: int, counter: TokenCounter) -> Messages:
+        system, history = split_system(entry["messages"])
+        # The latest user message opens a turn that has no reply yet
+        recent = history[-(2 * self.turns + 1) :]
+        return sliding_window(([system] if system else []) + recent, budget, counter)
+
+
+class SummaryPolicy(TruncationPolicy):
+    """
+    Folds the oldest turns into a rolling summary kept in the chat metadata,
+    which is sent after the system prompt. Falls back to a sliding window if
+    the summary cannot be produced or the chat still does not fit.
+    """
+
+    PROMPT = (
+        "Summarize the conversation below for your own future reference. Keep "
+        "names, facts, decisions and open questions, and write at most a few "
+        "short paragraphs."
+    )
+
+    def __init__(self, summarize: Summarizer):
+        self.summarize = summarize
+
+    def _assemble(self, system: Optional[Dict], summary: str, history: Messages) -> Messages:
+        if summary:
+            content = f"{system['content'] if system else ''}\n\nSummary of the earlier conversation:\n{summary}"
+            return [{"role": "system", "content": content.strip()}] + history
+        return ([system] if system else []) + history
+
+    async def apply(self, entry: Dict, budget: int, counter: TokenCounter) -> Messages:
+        metadata = entry["metadata"]
+        system, history = split_system(entry["messages"])
+        summary = metadata.get("summary", "")
+        start = metadata.get("summarized", 0)
+
+        messages = self._assemble(system, summary, history[start:])
+        while counter.count_messages(messages) > budget and start < len(history) - 1:
+            # Fold the older half of what is left, keeping the latest message
+            end = start + max(1, (len(history) - 1 - start) // 2)
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in history[start:end])
+            if summary:
+                transcript = f"Earlier summary: {summary}\n\n{transcript}"
+            try:
+                summary = await self.summarize(
+                    [
+                        {"role": "system", "content": self.PROMPT},
+                        {"role": "user", "content": transcript},
+                    ]
+                )
+            except Exception as e:
+                logger.warning(f"Summarizing the conversation failed: {e}")
+                break
+            start = end
+            messages = self._assemble(system, summary, history[start:])
+
+        metadata["summary"] = summary
+        metadata["summarized"] = start
+        return sliding_window(messages, budget, counter)
+
+
+class PrefixCachePolicy(TruncationPolicy):
+    """
+    Keeps the prompt prefix byte-identical from turn to turn, so a server side
+    prefix cache (SGLang's RadixAttention, vLLM's automatic prefix caching)
+    can reuse it.
+
+    The system prompt and the turns are sent verbatim. The start of the
+    window is kept in the chat metadata and only moves when the chat no longer
+    fits, then by whole turns until ``chunk_ratio`` of the budget is free. The
+    cached prefix is thus invalidated once per chunk instead of on every turn
+    as with a sliding window.
+    """
+
+    def __init__(self, chunk_ratio: float = 0.5):
+        if not 0 < chunk_ratio < 1:
+            raise ValueError("chunk_ratio must be between 0 and 1")
+        self.chunk_ratio = chunk_ratio
+
+    async def apply(self, entry: Dict, budget: int, counter: TokenCounter) -> Messages:
+        metadata = entry["metadata"]
+        system, history = split_system(entry["messages"])
+        start = min(metadata.get("window_start", 0), max(len(history) - 1, 0))
+
+        used = counter.count_messages(([system] if system else []) + history[start:])
+        if used > budget:
+            target = budget * (1 - self.chunk_ratio)
+            while start < len(history) - 1 and (used > target or history[start]["role"] != "user"):
+                used -= counter.count(history[start]["content"]) + MESSAGE_OVERHEAD
+                start += 1
+            metadata["window_start"] = start
+
+        # Only trims further if the latest message alone exceeds the budget
+        return sliding_window(([system] if system else []) + history[start:], budget, counter)
+
+
+class ContextManager:
+    """
+    Trims a chat to the context window of the model before it is sent.
+
+    The full history stays in the conversation memory, only the request is
+    trimmed. Chats that fit are passed through without copying.
+
+    Parameters
+    ----------
+    policy : TruncationPolicy
+        What to drop or fold when the chat is too long.
+    max_tokens : int
+        Default context window.
+    reserve_tokens : int
+        Tokens kept free for the reply.
+    model_limits : Dict[str, int]
+        Context windows of specific models, overriding ``max_tokens``.
+    """
+
+    def __init__(
+        self,
+        policy: TruncationPolicy,
+        counter: TokenCounter,
+        max_tokens: int = 8192,
+        reserve_tokens: int = 1024,
+        model_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.policy = policy
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.model_limits = model_limits or {}
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[Dict], reserve_tokens: int, summarize: Summarizer
+    ) -> "ContextManager":
+        """
+        Build the manager from the optional ``context`` block of config.yml.
+
+        Parameters
+        ----------
+        config : Optional[Dict]
+            ``policy`` (sliding_window, last_turns, summary or prefix_cache),
+            ``max_tokens``, ``last_turns``, ``chunk_ratio``, ``tokenizer`` and
+            ``models`` (per-model windows).
+        reserve_tokens : int
+            Tokens kept free for the reply.
+        summarize : Summarizer
+            Generates a reply for the summary policy.
+        """
+        config = config or {}
+        policy_name = config.get("policy", "sliding_window")
+        if policy_name == "sliding_window":
+            policy = SlidingWindowPolicy()
+        elif policy_name == "last_turns":
+            policy = LastTurnsPolicy(config.get("last_turns", 8))
+        elif policy_name == "summary":
+            policy = SummaryPolicy(summarize)
+        elif policy_name == "prefix_cache":
+            policy = PrefixCachePolicy(config.get("chunk_ratio", 0.5))
+        else:
+            raise ValueError(f"Unknown context policy '{policy_name}'")
+
+        return cls(
+            policy,
+            TokenCounter(config.get("tokenizer")),
+            max_tokens=config.get("max_tokens", 8192),
+            reserve_tokens=config.get("reserve_tokens", reserve_tokens),
+            model_limits=config.get("models"),
+        )
+
+    def budget(self, model: str) -> int:
+        return self.model_limits.get(model, self.max_tokens) - self.reserve_tokens
+
+    async def build(self, entry: Dict, model: str) -> Messages:
+        """
+        Returns the messages of a chat that fit in the prompt budget of the model.
+
+        Parameters
+        ----------
+        entry : Dict
+            The chat from the conversation memory.
+        model : str
+            The model the request is sent to.
+        """
+        budget = self.budget(model)
+        messages = entry["messages"]
+        metadata = entry["metadata"]
+        if (
+            self.counter.count_messages(messages) <= budget
+            and not metadata.get("summary")
+            and not metadata.get("window_start")
+        ):
+            return messages
+        return await self.policy.apply(entry, budget, self.counter)
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, MutableMapping, Optional
+
+from .history import History
+from .storage import WriteBehindStorage
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore(MutableMapping):
+    """
+    A bounded replacement for the ``conversation_memory`` dict.
+
+    Chats are kept in least recently used order, so both limits are enforced
+    by popping from the front in O(1):
+
+    - ``ttl``: a chat idle for longer than this many seconds is dropped and
+      its next message starts a new dialog (``new_dialog_timeout``).
+    - ``max_chats`` and ``max_bytes``: when exceeded, the least recently used
+      chats are evicted. The chat that was just written is never evicted.
+
+    Expired chats are removed by a background sweeper and are also treated as
+    missing when looked up before the sweeper reaches them.
+
+    With a ``storage`` the store is the hot tier of a persistent history:
+    changed chats are written behind in batches, ``load`` brings a saved chat
+    back on its first access, and evicted chats stay on disk. Expired and
+    deleted chats are removed from the storage as well.
+
+    Messages are kept as compact ``History`` records. With ``compress_after``
+    the sweeper also compresses chats idle for that many seconds with the
+    ``compression`` codec (zlib, or zstd with the zstandard package); they
+    are unpacked on their next access.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``expired``, ``evicted`` and ``compressed`` chat counts.
+    """
+
+    def __init__(
+        self,
+        max_chats: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = 600,
+        sweep_interval: float = 60,
+        storage: Optional[WriteBehindStorage] = None,
+        compress_after: Optional[float] = None,
+        compression: str = "zlib",
+    ):
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.storage = storage
+        self.compress_after = compress_after
+        self.compression = compression
+
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._last_access: Dict[int, float] = {}
+        self._sizes: Dict[int, int] = {}
+        self.total_bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+        self.stats: Dict[str, int] = {"expired": 0, "evicted": 0, "compressed": 0}
+
+    def __getitem__(self, chat_id: int) -> Dict:
+        if self._is_expired(chat_id):
+            self._forget(chat_id)
+            self.stats["expired"] += 1
+        entry = self._entries[chat_id]
+        self._touch(chat_id)
+        if entry["messages"].compressed:
+            entry["messages"].thaw()
+            self._account(chat_id)
+        return entry
+
+    def __setitem__(self, chat_id: int, entry: Dict) -> None:
+        self._entries[chat_id] = self._compact(entry)
+        self._touch(chat_id)
+        self.resize(chat_id)
+
+    def __delitem__(self, chat_id: int) -> None:
+        if chat_id not in self._entries:
+            raise KeyError(chat_id)
+        self._forget(chat_id)
+
+    def __contains__(self, chat_id: object) -> bool:
+        # Membership tests must not refresh the idle timer
+        return chat_id in self._entries and not self._is_expired(chat_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def load(self, chat_id: int) -> Optional[Dict]:
+        """
+        Bring a saved chat into memory if it is not there yet.
+
+        Parameters
+        ----------
+        chat_id : int
+            The chat to load.
+
+        Returns
+        -------
+        Optional[Dict]
+            The chat, or None if it has no (unexpired) history.
+        """
+        if self._is_expired(chat_id):
+            self._forget(chat_id)
+            self.stats["expired"] += 1
+        if chat_id in self._entries or self.storage is None:
+            return self._entries.get(chat_id)
+
+        entry = await self.storage.load(chat_id)
+        if chat_id in self._entries:
+            # Another update of the chat loaded it meanwhile
+            return self._entries[chat_id]
+        if entry is None:
+            return None
+
+        updated_at = entry.pop("updated_at", None)
+        if self.ttl is not None and updated_at is not None and time.time() - updated_at > self.ttl:
+            self.storage.delete(chat_id)
+            self.stats["expired"] += 1
+            return None
+
+        self._entries[chat_id] = self._compact(entry)
+        self._touch(chat_id)
+        self._account(chat_id)
+        return entry
+
+    def resize(self, chat_id: int) -> None:
+        """
+        Recount the size of a chat after its messages changed, schedule it to
+        be saved and evict other chats if the store is over its limits.
+
+        Parameters
+        ----------
+        chat_id : int
+            The chat that was modified.
+        """
+        if self.storage is not None:
+            self.storage.save(chat_id, self._entries[chat_id])
+        self._account(chat_id)
+
+    def expire(self) -> int:
+        """
+        Drop every chat idle for longer than ``ttl``.
+
+        Returns
+        -------
+        int
+            The number of expired chats.
+        """
+        if self.ttl is None:
+            return 0
+        expired = 0
+        # The front of the LRU order is the longest idle chat
+        while self._entries:
+            chat_id = next(iter(self._entries))
+            if not self._is_expired(chat_id):
+                break
+            self._forget(chat_id)
+            expired += 1
+        self.stats["expired"] += expired
+        return expired
+
+    def compress_idle(self) -> int:
+        """
+        Compress every chat idle for longer than ``compress_after``.
+
+        Returns
+        -------
+        int
+            The number of newly compressed chats.
+        """
+        if self.compress_after is None:
+            return 0
+        compressed = 0
+        now = time.monotonic()
+        for chat_id, entry in self._entries.items():
+            if now - self._last_access[chat_id] < self.compress_after:
+                break
+            if entry["messages"].compress(self.compression):
+                self._account(chat_id, evict=False)
+                compressed += 1
+        self.stats["compressed"] += compressed
+        return compressed
+
+    async def release(self, chat_ids: List[int]) -> None:
+        """
+        Write chats to the storage and drop them from memory, so another
+        process can take them over with the complete history.
+
+        Parameters
+        ----------
+        chat_ids : List[int]
+            The chats to hand over.
+        """
+        for chat_id in chat_ids:
+            if chat_id in self._entries:
+                self._drop(chat_id)
+        if self.storage is not None:
+            await self.storage.flush()
+
+    def start(self) -> None:
+        """Start the background sweeper and writer on the running event loop."""
+        if (self.ttl is not None or self.compress_after is not None) and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+        if self.storage is not None:
+            self.storage.start()
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        if self.storage is not None:
+            await self.storage.stop()
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            expired = self.expire()
+            compressed = self.compress_idle()
+            if compressed:
+                logger.info(f"Compressed {compressed} idle conversations")
+            if self.storage is not None and self.ttl is not None:
+                # Chats that expired while they were only on disk
+                await self.storage.flush()
+                expired += await self.storage.delete_older_than(time.time() - self.ttl)
+            if expired:
+                logger.info(f"Expired {expired} idle conversations")
+
+    def _account(self, chat_id: int, evict: bool = True) -> None:
+        size = self._entry_size(self._entries[chat_id])
+        self.total_bytes += size - self._sizes.get(chat_id, 0)
+        self._sizes[chat_id] = size
+        if evict:
+            self._evict(keep=chat_id)
+
+    def _touch(self, chat_id: int) -> None:
+        self._entries.move_to_end(chat_id)
+        self._last_access[chat_id] = time.monotonic()
+
+    def _is_expired(self, chat_id: object) -> bool:
+        last_access = self._last_access.get(chat_id)
+        return (
+            self.ttl is not None
+            and last_access is not None
+            and time.monotonic() - last_access > self.ttl
+        )
+
+    def _evict(self, keep: int) -> None:
+        while (
+            len(self._entries) > self.max_chats or self.total_bytes > self.max_bytes
+        ) and len(self._entries) > 1:
+            chat_id = next(iter(self._entries))
+            if chat_id == keep:
+                # The only chat over the limit is the one in use, keep it
+                break
+            self._drop(chat_id)
+            self.stats["evicted"] += 1
+
+    def _drop(self, chat_id: int) -> None:
+        # Memory only, an evicted chat can be loaded again
+        del self._entries[chat_id]
+        del self._last_access[chat_id]
+        self.total_bytes -= self._sizes.pop(chat_id, 0)
+
+    def _forget(self, chat_id: int) -> None:
+        self._drop(chat_id)
+        if self.storage is not None:
+            self.storage.delete(chat_id)
+
+    @staticmethod
+    def _compact(entry: Dict) -> Dict:
+        if not isinstance(entry["messages"], History):
+            entry["messages"] = History(entry["messages"])
+        return entry
+
+    @staticmethod
+    def _entry_size(entry: Dict) -> int:
+        # Approximate: the message strings dominate the footprint of a chat
+        return entry["messages"].nbytes
@@ -0,0 +1,263 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Bot, Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EDIT_SECONDS = REGISTRY.histogram(
+    "telegram_edit_seconds", "Latency of edit_message_text calls"
+)
+EDIT_WAIT_SECONDS = REGISTRY.histogram(
+    "telegram_edit_wait_seconds", "Time edits waited for the rate limits"
+)
+
+EditKey = Tuple[int, int]
+
+
+class _PendingEdit:
+    __slots__ = ("chat_id", "message_id", "text", "submitted_at", "waiters")
+
+    def __init__(self, chat_id: int, message_id: int, text: str):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.submitted_at = time.monotonic()
+        self.waiters: List[asyncio.Future] = []
+
+
+class EditScheduler:
+    """
+    Sends ``edit_message_text`` calls for every streaming chat while staying
+    inside Telegram's flood limits.
+
+    Only the newest text of a message is kept, so edits submitted while the
+    chat is throttled are merged. A chat is edited at most once per
+    ``chat_interval`` seconds (``group_interval`` for groups, whose chat ids
+    are negative) and the whole bot at most ``global_rate`` times per second.
+    A ``RetryAfter`` from Telegram pauses that chat for the requested time and
+    the edit is retried. Edits that would not change the text are skipped.
+
+    Attributes
+    ----------
+    stats : Dict[str, float]
+        ``edits_sent``, ``edits_coalesced``, ``edits_skipped``,
+        ``retry_after`` and ``throttle_delay`` (seconds edits spent waiting
+        in total).
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+        global_rate: float = 30.0,
+    ):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.global_interval = 1 / global_rate
+
+        self._pending: Dict[EditKey, _PendingEdit] = {}
+        self._last_text: Dict[EditKey, str] = {}
+        self._in_flight: Set[EditKey] = set()
+        self._chat_ready: Dict[int, float] = {}  # monotonic time of the next allowed edit
+        self._global_ready = 0.0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._sends: Set[asyncio.Task] = set()
+
+        self.stats: Dict[str, float] = {
+            "edits_sent": 0,
+            "edits_coalesced": 0,
+            "edits_skipped": 0,
+            "retry_after": 0,
+            "throttle_delay": 0.0,
+        }
+
+    @property
+    def pending(self) -> int:
+        """The number of messages with an edit waiting to be sent."""
+        return len(self._pending)
+
+    def submit(self, chat_id: int, message_id: int, text: str) -> None:
+        """
+        Queue the latest text of a message without waiting for it to be sent.
+
+        Parameters
+        ----------
+        chat_id : int
+            The chat of the message.
+        message_id : int
+            The message to edit.
+        text : str
+            The full MarkdownV2 text of the message.
+        """
+        self._queue(chat_id, message_id, text)
+
+    async def flush(self, chat_id: int, message_id: int, text: str) -> Optional[Message]:
+        """
+        Queue the final text of a message and wait until it is sent.
+
+        Telegram errors other than flood control are raised here. Afterwards
+        the scheduler forgets the message.
+
+        Returns
+        -------
+        Optional[Message]
+            The edited message, or None if the text was already up to date.
+        """
+        key = (chat_id, message_id)
+        edit = self._queue(chat_id, message_id, text)
+        try:
+            if edit is None:
+                return None
+            waiter = asyncio.get_running_loop().create_future()
+            edit.waiters.append(waiter)
+            return await waiter
+        finally:
+            if key not in self._pending and key not in self._in_flight:
+                self._last_text.pop(key, None)
+
+    async def stop(self) -> None:
+        """Cancel the worker; queued edits are dropped."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def _queue(self, chat_id: int, message_id: int, text: str) -> Optional[_PendingEdit]:
+        key = (chat_id, message_id)
+        edit = self._pending.get(key)
+
+        if edit is not None:
+            # The chat is still throttled, the newer text replaces the queued one
+            edit.text = text
+            self.stats["edits_coalesced"] += 1
+            return edit
+
+        if key not in self._in_flight and self._last_text.get(key) == text:
+            self.stats["edits_skipped"] += 1
+            return None
+
+        edit = self._pending[key] = _PendingEdit(chat_id, message_id, text)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return edit
+
+    def _interval(self, chat_id: int) -> float:
+        return self.group_interval if chat_id < 0 else self.chat_interval
+
+    async def _run(self) -> None:
+        while True:
+            ready = [key for key in self._pending if key not in self._in_flight]
+            if not ready:
+                # Drop rate limit state of chats that may be edited again anyway
+                now = time.monotonic()
+                self._chat_ready = {
+                    chat_id: ready_at
+                    for chat_id, ready_at in self._chat_ready.items()
+                    if ready_at > now
+                }
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Linear scan: there is at most one pending edit per streaming message
+            now = time.monotonic()
+            key = min(
+                ready,
+                key=lambda k: (self._chat_ready.get(k[0], 0.0), self._pending[k].submitted_at),
+            )
+            ready_at = max(self._chat_ready.get(key[0], 0.0), self._global_ready)
+            if ready_at > now:
+                # Sleep until the edit is due, new submissions may be due earlier
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), ready_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            edit = self._pending.pop(key)
+            self._chat_ready[edit.chat_id] = now + self._interval(edit.chat_id)
+            self._global_ready = now + self.global_interval
+            self.stats["throttle_delay"] += now - edit.submitted_at
+            EDIT_WAIT_SECONDS.observe(now - edit.submitted_at)
+            self._in_flight.add(key)
+            send = asyncio.create_task(self._send(edit))
+            self._sends.add(send)
+            send.add_done_callback(self._sends.discard)
+
+    async def _send(self, edit: _PendingEdit) -> None:
+        key = (edit.chat_id, edit.message_id)
+        started_at = time.perf_counter()
+        try:
+            message = await self.bot.edit_message_text(
+                edit.text,
+                chat_id=edit.chat_id,
+                message_id=edit.message_id,
+                parse_mode=ParseMode.MARKDOWN_V2,
+            )
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, datetime.timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning("Flood control in chat %s, retrying in %ss", edit.chat_id, retry_after)
+            self.stats["retry_after"] += 1
+            self._chat_ready[edit.chat_id] = time.monotonic() + retry_after
+            self._requeue(edit)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self._last_text[key] = edit.text
+                self.stats["edits_skipped"] += 1
+                self._resolve(edit, None)
+            else:
+                self._fail(edit, e)
+        except Exception as e:
+            self._fail(edit, e)
+        else:
+            self._last_text[key] = edit.text
+            self.stats["edits_sent"] += 1
+            self._resolve(edit, message)
+        finally:
+            EDIT_SECONDS.observe(time.perf_counter() - started_at)
+            self._in_flight.discard(key)
+            self._wakeup.set()
+
+    def _requeue(self, edit: _PendingEdit) -> None:
+        key = (edit.chat_id, edit.message_id)
+        newer = self._pending.get(key)
+        if newer is None:
+            self._pending[key] = edit
+        else:
+            # A newer text arrived meanwhile, it answers the older waiters too
+            newer.waiters.extend(edit.waiters)
+            self.stats["edits_coalesced"] += 1
+
+    @staticmethod
+    def _resolve(edit: _PendingEdit, message: Optional[Message]) -> None:
+        for waiter in edit.waiters:
+            if not waiter.done():
+                waiter.set_result(message)
+
+    @staticmethod
+    def _fail(edit: _PendingEdit, error: Exception) -> None:
+        if not edit.waiters:
+            logger.error(
+                "Editing message %s in chat %s failed: %s", edit.message_id, edit.chat_id, error
+            )
+        for waiter in edit.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
@@ -0,0 +1,167 @@
+import asyncio
+import html
+import logging
+import traceback
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ERRORS = REGISTRY.counter("errors", "Exceptions raised while handling an update")
+
+# Telegram's limit on the length of a message
+MAX_MESSAGE_LENGTH = 4096
+
+Fingerprint = Tuple[str, str, str, int]
+
+
+def fingerprint(error: BaseException) -> Fingerprint:
+    """
+    The exception type and the innermost frame it was raised in. Messages
+    often carry ids or urls, so they are left out and an outage reported by
+    many chats counts as one error.
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    if not frames:
+        return type(error).__qualname__, "", "", 0
+    frame = frames[-1]
+    return type(error).__qualname__, frame.filename, frame.name, frame.lineno or 0
+
+
+class _ErrorGroup:
+    __slots__ = ("count", "summary", "traceback", "context")
+
+    def __init__(self, error: BaseException, context: str):
+        self.count = 0
+        self.summary = f"{type(error).__name__}: {error}"
+        # The end of the traceback, where it was raised, matters most
+        self.traceback = "".join(traceback.format_exception(error))[-1500:]
+        self.context = context
+
+
+class ErrorReporter:
+    """
+    Sends the developer one digest of the errors of each ``window`` seconds
+    instead of a message per exception.
+
+    ``report`` only counts the error under its fingerprint, so it is cheap
+    enough for an outage with hundreds of failing replies; a background task
+    sends the digest with the count, one traceback and the context of the
+    first occurrence of every fingerprint, most frequent first, cut to fit
+    in one Telegram message.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``reported`` errors and ``digests`` sent.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable],
+        window: float = 60.0,
+        max_groups: int = 100,
+        source: str = "",
+    ):
+        self.send = send
+        self.window = window
+        self.max_groups = max_groups
+        # Names the process in the digest when several report, e.g. shard workers
+        self.source = source
+        self._groups: "OrderedDict[Fingerprint, _ErrorGroup]" = OrderedDict()
+        self._dropped = 0
+        self._pending = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"reported": 0, "digests": 0}
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[Dict], send: Callable[[str], Awaitable]
+    ) -> Optional["ErrorReporter"]:
+        """
+        Build the reporter from the optional ``error_reports`` block of
+        config.yml, None if ``enabled`` is false.
+        """
+        config = dict(config or {})
+        if not config.pop("enabled", True):
+            return None
+        return cls(send, **config)
+
+    def report(self, error: BaseException, context: str = "") -> None:
+        """Count an error for the next digest."""
+        ERRORS.inc()
+        self.stats["reported"] += 1
+        key = fingerprint(error)
+        group = self._groups.get(key)
+        if group is None:
+            if len(self._groups) >= self.max_groups:
+                self._dropped += 1
+                return
+            group = self._groups[key] = _ErrorGroup(error, context)
+        group.count += 1
+        self._pending.set()
+
+    def digest(self) -> Optional[str]:
+        """Take the errors counted so far as an HTML message, None if there are none."""
+        if not self._groups and not self._dropped:
+            return None
+        groups = sorted(self._groups.values(), key=lambda group: group.count, reverse=True)
+        dropped = self._dropped
+        self._groups = OrderedDict()
+        self._dropped = 0
+
+        total = sum(group.count for group in groups) + dropped
+        source = f" in {html.escape(self.source)}" if self.source else ""
+        text = f"<b>{total} errors{source} in the last {self.window:g}s</b>\n"
+        tail = f"\n… and {dropped} errors of other kinds not tracked" if dropped else ""
+        budget = MAX_MESSAGE_LENGTH - len(tail)
+        for index, group in enumerate(groups):
+            section = (
+                f"\n<b>{group.count}×</b> <code>{html.escape(group.summary[:300])}</code>\n"
+                + (f"{html.escape(group.context[:300])}\n" if group.context else "")
+                + f"<pre>{html.escape(group.traceback)}</pre>\n"
+            )
+            more = f"\n… and {len(groups) - index} more kinds of errors"
+            if len(text) + len(section) + len(more) > budget:
+                # Keep the count and summary, drop the traceback
+                section = f"\n<b>{group.count}×</b> <code>{html.escape(group.summary[:300])}</code>\n"
+                if len(text) + len(section) + len(more) > budget:
+                    text += more
+                    break
+            text += section
+        return text + tail
+
+    def start(self) -> None:
+        """Start sending digests from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Telegram is shutting down too, keep what was not sent in the log
+        text = self.digest()
+        if text is not None:
+            logger.error(f"Unsent error digest: {text}")
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            # Collect the errors of a whole window into one message
+            await asyncio.sleep(self.window)
+            self._pending.clear()
+            text = self.digest()
+            if text is None:
+                continue
+            try:
+                await self.send(text)
+                self.stats["digests"] += 1
+            except Exception as e:
+                logger.error(f"Sending the error digest failed: {e}")
@@ -0,0 +1,89 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatcher:
+    """
+    Calls a reload callback when one of a few files changes, from a task on
+    the running event loop instead of an observer thread.
+
+    The watched files are polled with ``os.stat`` every ``interval`` seconds,
+    which costs a few microseconds per file. A change is only reported once
+    the file has been quiet for ``debounce`` seconds, so an editor writing a
+    file in several steps triggers a single reload of the complete file.
+
+    Callbacks take no arguments and may be coroutine functions. A failing
+    callback is logged and the watcher carries on.
+    """
+
+    def __init__(self, directory, interval: float = 1.0, debounce: float = 0.5):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.debounce = debounce
+        self._callbacks: Dict[str, Callable] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._changed_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, callback: Callable) -> None:
+        """Call ``callback`` whenever the file ``name`` of the directory changes."""
+        self._callbacks[name] = callback
+        self._signatures[name] = self._signature(name)
+
+    def _signature(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.directory / name)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def poll(self) -> None:
+        """Check the files once and run the callbacks of settled changes."""
+        now = time.monotonic()
+        for name in self._callbacks:
+            signature = self._signature(name)
+            if signature != self._signatures[name]:
+                self._signatures[name] = signature
+                self._changed_at[name] = now
+
+        for name, changed_at in list(self._changed_at.items()):
+            if now - changed_at < self.debounce:
+                continue
+            del self._changed_at[name]
+            if self._signatures[name] is None:
+                # Deleted, or replaced and not written yet
+                continue
+            try:
+                result = self._callbacks[name]()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Reloading {name} failed: {e}")
+
+    def start(self) -> None:
+        """Start watching on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Watching {', '.join(self._callbacks)} in {self.directory}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            # Poll faster while a change is settling
+            await asyncio.sleep(min(self.interval, self.debounce) if self._changed_at else self.interval)
+            await self.poll()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from .metrics import REGISTRY
+from .runtime_config import split_users
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SECONDS = REGISTRY.histogram(
+    "generation_queue_seconds", "Time a reply waited for a free generation slot"
+)
+
+# Priority classes, served in this order
+DEVELOPER, PRIORITY, OTHERS = range(3)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "future", "on_position", "position")
+
+    def __init__(self, user_id: int, future: asyncio.Future, on_position):
+        self.user_id = user_id
+        self.future = future
+        self.on_position: Optional[Callable[[int], None]] = on_position
+        self.position = 0
+
+
+class GenerationScheduler:
+    """
+    Admission control for backend generations.
+
+    At most ``max_concurrent`` replies are generated at once; the others
+    wait for a slot instead of piling onto the backend, which keeps its
+    latency flat during a burst. Waiting replies are served by priority
+    class: the developer first, then ``priority_users``, then everyone else.
+    Within a class the users take turns, so one user with many queued
+    messages, e.g. in a group, does not hold back the others.
+
+    Waiters are told their position through ``on_position`` whenever it
+    changed, at most every ``position_interval`` seconds.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``granted`` slots, ``queued`` replies that had to wait, and
+        ``abandoned`` ones cancelled while waiting.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        dev_id: Optional[int] = None,
+        priority_users: Optional[List] = None,
+        position_interval: float = 1.0,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.dev_id = dev_id
+        self._priority_ids, self._priority_names = split_users(priority_users)
+        self.position_interval = position_interval
+        self.running = 0
+        # Per class: the queue of each waiting user, in turn order
+        self._classes: List["OrderedDict[int, Deque[_Waiter]]"] = [
+            OrderedDict() for _ in range(OTHERS + 1)
+        ]
+        self._notifier: Optional[asyncio.Task] = None
+        self._positions_changed = asyncio.Event()
+        self.stats: Dict[str, int] = {"granted": 0, "queued": 0, "abandoned": 0}
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[Dict], dev_id: Optional[int] = None, users: Optional[List] = None
+    ) -> Optional["GenerationScheduler"]:
+        """
+        Build the scheduler from the optional ``admission`` block of
+        config.yml, None leaves generations unlimited. The allowed users of
+        the bot are the priority users unless ``priority_users`` is given.
+        """
+        config = dict(config or {})
+        if not config.get("max_concurrent"):
+            return None
+        if not config.get("priority_users"):
+            config["priority_users"] = users
+        return cls(dev_id=dev_id, **config)
+
+    @property
+    def waiting(self) -> int:
+        """The number of replies waiting for a slot."""
+        return sum(len(queue) for users in self._classes for queue in users.values())
+
+    def priority(self, user_id: int, username: Optional[str] = None) -> int:
+        if self.dev_id is not None and user_id == self.dev_id:
+            return DEVELOPER
+        if user_id in self._priority_ids or (
+            username is not None and username.lower() in self._priority_names
+        ):
+            return PRIORITY
+        return OTHERS
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Wait for a generation slot and hold it.
+
+        Parameters
+        ----------
+        user_id : int
+            The user the reply is for.
+        username : Optional[str]
+            Their username, for ``priority_users`` given by name.
+        on_position : Optional[Callable[[int], None]]
+            Called with the 1-based queue position while waiting.
+        """
+        if self.running < self.max_concurrent and not self.waiting:
+            self.running += 1
+        else:
+            await self._wait(user_id, self.priority(user_id, username), on_position)
+        self.stats["granted"] += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._grant()
+
+    async def _wait(self, user_id: int, priority: int, on_position) -> None:
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future(), on_position)
+        self._classes[priority].setdefault(user_id, deque()).append(waiter)
+        self.stats["queued"] += 1
+        self._position_update()
+        queued_at = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just before the cancellation, pass the slot on
+                self.running -= 1
+                self._grant()
+            else:
+                self._remove(priority, waiter)
+                self.stats["abandoned"] += 1
+                self._position_update()
+            raise
+        QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+
+    def resize(self, max_concurrent: int) -> None:
+        """Change the number of concurrent generations, waiting ones may start."""
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self._grant()
+
+    def _grant(self) -> None:
+        while self.running < self.max_concurrent:
+            waiter = self._pop_next()
+            if waiter is None:
+                return
+            self.running += 1
+            waiter.future.set_result(None)
+            self._position_update()
+
+    def _pop_next(self) -> Optional[_Waiter]:
+        for users in self._classes:
+            if users:
+                user_id, queue = next(iter(users.items()))
+                waiter = queue.popleft()
+                # The user goes to the back of the line with the rest
+                del users[user_id]
+                if queue:
+                    users[user_id] = queue
+                return waiter
+        return None
+
+    def _remove(self, priority: int, waiter: _Waiter) -> None:
+        users = self._classes[priority]
+        queue = users.get(waiter.user_id)
+        if queue is None:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del users[waiter.user_id]
+
+    def _order(self) -> List[_Waiter]:
+        """The waiters in the order they would be served."""
+        order = []
+        for users in self._classes:
+            queues = list(users.values())
+            depth = 0
+            while queues:
+                order.extend(queue[depth] for queue in queues)
+                depth += 1
+                queues = [queue for queue in queues if len(queue) > depth]
+        return order
+
+    def _position_update(self) -> None:
+        if self._notifier is None:
+            self._notifier = asyncio.create_task(self._notify_positions())
+        self._positions_changed.set()
+
+    async def _notify_positions(self) -> None:
+        while True:
+            await self._positions_changed.wait()
+            self._positions_changed.clear()
+            for position, waiter in enumerate(self._order(), start=1):
+                if waiter.position != position and waiter.on_position is not None:
+                    waiter.position = position
+                    try:
+                        waiter.on_position(position)
+                    except Exception as e:
+                        logger.error(f"Queue position update failed: {e}")
+            await asyncio.sleep(self.position_interval)
+
+    async def stop(self) -> None:
+        if self._notifier is not None:
+            self._notifier.cancel()
+            try:
+                await self._notifier
+            except asyncio.CancelledError:
+                pass
+            self._notifier = None
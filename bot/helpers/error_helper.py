@@ -1,11 +1,8 @@
-import html
-import json
-import traceback
+from typing import Optional
+
 from telegram import Update
-from telegram.constants import (
-    ParseMode,
-)
 
+from bot.error_reporter import ErrorReporter
 from bot.message_handler import MyMessageHandler
 
 
@@ -15,25 +12,21 @@ class ErrorHelper:
         update: Update,
         context: str,
         message_handler: MyMessageHandler,
+        error_reporter: Optional[ErrorReporter] = None,
     ):
         message_handler.logger.error(
             "Exception while handling an update:", exc_info=context.error
         )
 
-        tb_list = traceback.format_exception(None, context.error, None)
-        tb_string = "".join(tb_list)
-
-        update_str = update.to_dict() if isinstance(update, Update) else str(update)
-        message = (
-            f"An exception was raised while handling an update\n"
-            "<pre>update = "
-            f"{html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}"
-            "</pre>\n\n"
-            f"<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n"
-            f"<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n"
-            f"<pre>{html.escape(tb_string)}</pre>"
-        )
+        if error_reporter is None:
+            return
 
-        await context.bot.send_message(
-            chat_id=message_handler.DEV_ID, text=message, parse_mode=ParseMode.HTML
-        )
+        # Only what identifies the update, the log has the rest
+        if isinstance(update, Update):
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            user_id = update.effective_user.id if update.effective_user else None
+            description = f"update {update.update_id}, chat {chat_id}, user {user_id}"
+        else:
+            description = str(update)
+        # Sent later in a digest with the other errors of its window
+        error_reporter.report(context.error, description)
@@ -1,4 +1,5 @@
 import re
+from typing import List, Optional
 
 
 class TextFormatter:
@@ -17,8 +18,13 @@ class TextFormatter:
         Escapes characters in code blocks in the text.
     escape(text: str) -> str
         Escapes characters in the text for markdown rendering.
+    render(text: str) -> str
+        Escapes the text and closes open code blocks or inline code.
     """
 
+    # List of characters to escape
+    CHARS_TO_ESCAPE = r"\_*~#+-={}!.|()<>[]"
+
     @staticmethod
     def has_open_code_block(text: str) -> bool:
         """
@@ -95,15 +101,327 @@ class TextFormatter:
             The escaped text.
         """
 
-        # List of characters to escape
-        chars_to_escape = r"\_*~#+-={}!.|()<>[]"
-
         # Escape characters in code blocks
         text = TextFormatter.escape_code_blocks(text)
 
         # Escape the characters using regex
         escaped_text = re.sub(
-            r"([{}])".format(re.escape(chars_to_escape)), r"\\\1", text
+            r"([{}])".format(re.escape(TextFormatter.CHARS_TO_ESCAPE)), r"\\\1", text
         )
 
         return escaped_text
+
+    @staticmethod
+    def render(text: str) -> str:
+        """
+        Escapes the text and closes an open code block or inline code, so a
+        partial reply can be sent as MarkdownV2.
+
+        Parameters
+        ----------
+        text : str
+            The text to render.
+
+        Returns
+        -------
+        str
+            The rendered text.
+        """
+        if TextFormatter.has_open_code_block(text):
+            return TextFormatter.escape(text) + "```"
+        if TextFormatter.has_open_inline_code(text):
+            return TextFormatter.escape(text) + "`"
+        return TextFormatter.escape(text)
+
+
+class StreamingFormatter:
+    """
+    An incremental version of ``TextFormatter.render`` for streamed replies.
+
+    Deltas are escaped once when they arrive and the escaped prefix is kept,
+    while the code fence and inline code state is tracked on the fly, so an
+    edit only processes the new text instead of the whole reply. The rendered
+    output is identical to ``TextFormatter.render`` on the accumulated text.
+
+    The only text held back is a trailing run of backticks, since the next
+    delta may extend it into a code fence. The content of an open code block
+    is kept escaped both ways because it is rendered as plain text until its
+    closing fence arrives.
+
+    Methods
+    -------
+    feed(delta: str) -> None
+        Appends a streamed delta.
+    render() -> str
+        Returns the MarkdownV2 text of everything fed so far.
+    """
+
+    _BACKTICK_RUNS = re.compile(r"(`+)")
+    _PLAIN = str.maketrans({c: "\\" + c for c in TextFormatter.CHARS_TO_ESCAPE})
+    # Code block content: escape_code_blocks doubles "\" and escapes "`", then
+    # the global escape runs over the result
+    _CODE = str.maketrans(
+        {
+            **{c: "\\" + c for c in TextFormatter.CHARS_TO_ESCAPE},
+            "\\": "\\\\\\\\",
+            "`": "\\\\`",
+        }
+    )
+
+    def __init__(self):
+        self._raw: List[str] = []
+        self._done: List[str] = []  # escaped output that can no longer change
+        self._block_plain: List[str] = []  # open code block, rendered unclosed
+        self._block_code: List[str] = []  # open code block, rendered closed
+        self._in_block = False
+        self._inline_count = 0
+        self._pending_ticks = 0
+        self._rendered: Optional[str] = ""
+
+    @property
+    def text(self) -> str:
+        """The raw text fed so far."""
+        if len(self._raw) > 1:
+            self._raw = ["".join(self._raw)]
+        return self._raw[0] if self._raw else ""
+
+    @property
+    def in_code_block(self) -> bool:
+        """Same as ``TextFormatter.has_open_code_block(self.text)``."""
+        return self._in_block != bool(self._pending_ticks // 3 % 2)
+
+    @property
+    def in_inline_code(self) -> bool:
+        """Same as ``TextFormatter.has_open_inline_code(self.text)``."""
+        return (self._inline_count + (self._pending_ticks == 1)) % 2 == 1
+
+    def feed(self, delta: str) -> None:
+        """
+        Appends a streamed delta.
+
+        Parameters
+        ----------
+        delta : str
+            The new text.
+        """
+        if not delta:
+            return
+        self._raw.append(delta)
+        self._rendered = None
+
+        for part in self._BACKTICK_RUNS.split(delta):
+            if not part:
+                continue
+            if part[0] == "`":
+                self._pending_ticks += len(part)
+                continue
+            if self._pending_ticks:
+                self._apply_backticks(self._pending_ticks)
+                self._pending_ticks = 0
+            self._append(part)
+
+    def render(self) -> str:
+        """
+        Returns the MarkdownV2 text of everything fed so far.
+
+        Returns
+        -------
+        str
+            The escaped text with open code blocks and inline code closed.
+        """
+        if self._rendered is not None:
+            return self._rendered
+
+        self._compact()
+        state = self
+        if self._pending_ticks:
+            # Settle the held back backticks on a throwaway copy
+            state = self._copy()
+            state._apply_backticks(self._pending_ticks)
+            state._compact()
+
+        text = state._done[0] if state._done else ""
+        if state._in_block:
+            text += "".join(state._block_plain) + "```"
+        elif state._inline_count % 2 == 1:
+            text += "`"
+
+        self._rendered = text
+        return text
+
+    def _append(self, text: str) -> None:
+        if self._in_block:
+            self._block_plain.append(text.translate(self._PLAIN))
+            self._block_code.append(text.translate(self._CODE))
+        else:
+            self._done.append(text.translate(self._PLAIN))
+
+    def _apply_backticks(self, count: int) -> None:
+        # Mirrors str.count("```") and the lazy fence regex: fences are taken
+        # from the start of the run, leftover backticks follow them
+        if count == 1:
+            self._inline_count += 1
+        for _ in range(count // 3):
+            if self._in_block:
+                self._done.extend(self._block_code)
+                self._block_plain.clear()
+                self._block_code.clear()
+            self._done.append("```")
+            self._in_block = not self._in_block
+        if count % 3:
+            self._append("`" * (count % 3))
+
+    def _compact(self) -> None:
+        for parts in (self._done, self._block_plain, self._block_code):
+            if len(parts) > 1:
+                parts[:] = ["".join(parts)]
+
+    def _copy(self) -> "StreamingFormatter":
+        clone = StreamingFormatter.__new__(StreamingFormatter)
+        clone._done = list(self._done)
+        clone._block_plain = list(self._block_plain)
+        clone._block_code = list(self._block_code)
+        clone._in_block = self._in_block
+        clone._inline_count = self._inline_count
+        return clone
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram counts message length in UTF-16 code units, only characters
+    # outside the BMP take two
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+class StreamingPager:
+    """
+    Splits a streamed reply into Telegram messages of at most ``limit``
+    characters.
+
+    Deltas go into the formatter of the current page. Once its rendered text
+    would exceed the limit, the page is cut, preferably at a paragraph, line
+    or word boundary, and frozen; the rest continues on a new page. A code
+    block or inline code open at the cut is closed on the frozen page and
+    reopened, with its language, on the next one. Only the current page is
+    rendered on each edit, so the cost of an edit does not grow with the
+    length of the reply.
+
+    Methods
+    -------
+    feed(delta: str) -> None
+        Appends a streamed delta.
+    render() -> str
+        Returns the MarkdownV2 text of the current page.
+    take_full_pages() -> List[str]
+        Returns the rendered pages frozen since the last call.
+    """
+
+    def __init__(self, limit: int = 4096):
+        self.limit = limit
+        self.page = StreamingFormatter()
+        self.pages = 1
+        self._raw: List[str] = []
+        self._page_chars = 0
+        self._reopened = 0  # length of the fence reopened at the top of the page
+        self._full_pages: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """The raw text of the whole reply, without reopened fences."""
+        if len(self._raw) > 1:
+            self._raw = ["".join(self._raw)]
+        return self._raw[0] if self._raw else ""
+
+    def feed(self, delta: str) -> None:
+        """
+        Appends a streamed delta.
+
+        Parameters
+        ----------
+        delta : str
+            The new text.
+        """
+        if not delta:
+            return
+        self._raw.append(delta)
+        self.page.feed(delta)
+        self._page_chars += len(delta)
+        # Escaping at most quadruples a character, so short pages always fit
+        while self._page_chars * 4 > self.limit and _utf16_len(self.page.render()) > self.limit:
+            self._split()
+
+    def render(self) -> str:
+        """
+        Returns the MarkdownV2 text of the current page.
+
+        Returns
+        -------
+        str
+            The escaped text of the current page.
+        """
+        return self.page.render()
+
+    def take_full_pages(self) -> List[str]:
+        """
+        Returns the rendered pages frozen since the last call, in order.
+
+        Returns
+        -------
+        List[str]
+            The final MarkdownV2 text of each finished page.
+        """
+        pages, self._full_pages = self._full_pages, []
+        return pages
+
+    def _split(self) -> None:
+        raw = self.page.text
+        cut = self._cut(raw)
+        head = StreamingFormatter()
+        head.feed(raw[:cut])
+        self._full_pages.append(head.render())
+
+        reopen = ""
+        if head.in_code_block:
+            # Reopen with the language of the fence, e.g. "```python\n"
+            fence = raw.rfind("```", 0, cut)
+            line_end = raw.find("\n", fence, cut)
+            reopen = raw[fence : line_end + 1] if line_end != -1 else "```\n"
+        elif head.in_inline_code:
+            reopen = "`"
+
+        self.page = StreamingFormatter()
+        self.page.feed(reopen + raw[cut:])
+        self._page_chars = len(reopen) + len(raw) - cut
+        self._reopened = len(reopen)
+        self.pages += 1
+
+    def _fits(self, raw: str) -> bool:
+        formatter = StreamingFormatter()
+        formatter.feed(raw)
+        return _utf16_len(formatter.render()) <= self.limit
+
+    def _cut(self, raw: str) -> int:
+        # The longest prefix that fits, the rendered length grows with it
+        low, high = self._reopened + 1, len(raw)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._fits(raw[:middle]):
+                low = middle
+            else:
+                high = middle - 1
+        longest = low
+
+        # Prefer a natural boundary in the second half of the page
+        for separator in ("\n\n", "\n", " "):
+            position = raw.rfind(separator, self._reopened, longest)
+            if position != -1 and position >= longest // 2:
+                cut = position + len(separator)
+                if cut <= longest and self._fits(raw[:cut]):
+                    return cut
+
+        # Never cut through a run of backticks, it may be a fence
+        cut = longest
+        while cut > self._reopened + 1 and raw[cut - 1] == "`" and raw[cut : cut + 1] == "`":
+            cut -= 1
+        return cut
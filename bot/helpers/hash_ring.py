@@ -0,0 +1,71 @@
+import bisect
+import hashlib
+from typing import Dict, Hashable, Iterator, List, Optional
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    A consistent hash ring mapping keys such as chat ids to nodes.
+
+    Every node is placed at ``replicas * weight`` points of the ring, so
+    adding or removing a node only moves the keys of that node and load is
+    spread in proportion to the weights.
+    """
+
+    def __init__(self, replicas: int = 100):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._weights: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._weights
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._weights)
+
+    def add(self, node: str, weight: float = 1.0) -> None:
+        if node in self._weights:
+            self.remove(node)
+        self._weights[node] = weight
+        for index in range(max(1, round(self.replicas * weight))):
+            point = _hash(f"{node}#{index}")
+            position = bisect.bisect(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, node)
+
+    def remove(self, node: str) -> None:
+        if self._weights.pop(node, None) is None:
+            return
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def walk(self, key: Hashable) -> Iterator[str]:
+        """
+        Yield every node once, starting with the owner of ``key`` followed by
+        the nodes that take over its keys if it is unavailable.
+        """
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, _hash(str(key)))
+        seen = set()
+        for offset in range(len(self._points)):
+            owner = self._owners[(start + offset) % len(self._points)]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+                if len(seen) == len(self._weights):
+                    return
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Returns the node owning ``key``, None if the ring is empty."""
+        return next(self.walk(key), None)
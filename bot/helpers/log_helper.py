@@ -0,0 +1,36 @@
+import logging
+
+# Knuth's multiplicative hash spreads consecutive chat ids evenly
+_GOLDEN = 2654435761
+_RANGE = 2**32
+
+
+def chat_sampled(chat_id: int, rate: float) -> bool:
+    """
+    Whether a chat belongs to the sampled ``rate`` share of chats. The
+    choice only depends on the chat id, so a sampled chat logs every turn.
+    """
+    if rate >= 1:
+        return True
+    return (chat_id * _GOLDEN) % _RANGE < rate * _RANGE
+
+
+class ChatSampleFilter(logging.Filter):
+    """
+    Keeps the records of a ``rate`` share of the chats, for the hot-path
+    records logged with ``extra={"chat_id": ...}``; records without a chat
+    id always pass. Configured in logging.yml:
+
+        filters:
+          sampled_chats:
+            (): bot.helpers.log_helper.ChatSampleFilter
+            rate: 0.1
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        chat_id = getattr(record, "chat_id", None)
+        return chat_id is None or chat_sampled(chat_id, self.rate)
@@ -1,6 +1,12 @@
+import asyncio
+import logging
+
 from telegram import Update, Message
+from telegram.error import TelegramError
 from typing import Tuple
 
+logger = logging.getLogger(__name__)
+
 
 class MessageHelper:
     """
@@ -18,6 +24,16 @@ class MessageHelper:
         placeholder_message = await update.message.reply_text("...")
         return placeholder_message
 
+    @staticmethod
+    async def send_continuation_message(message: Message) -> Message:
+        """
+        Sends a placeholder for the next part of a reply too long for one message.
+
+        :param message: The previous, full message of the reply.
+        :return: The sent placeholder message object.
+        """
+        return await message.reply_text("...", do_quote=False)
+
     @staticmethod
     async def send_typing_action(update: Update) -> None:
         """
@@ -27,6 +43,24 @@ class MessageHelper:
         """
         await update.message.chat.send_action(action="typing")
 
+    @staticmethod
+    async def keep_typing(update: Update, interval: float = 4.0) -> None:
+        """
+        Sends a typing action every ``interval`` seconds until cancelled, as
+        Telegram shows one for at most five seconds.
+
+        :param update: The update object containing the message.
+        :param interval: Seconds between the typing actions.
+        """
+        while True:
+            try:
+                await MessageHelper.send_typing_action(update)
+            except TelegramError as e:
+                # Only cosmetic, the reply goes on without it
+                logger.debug("Typing action failed: %s", e)
+                return
+            await asyncio.sleep(interval)
+
     @staticmethod
     def get_message_info(update: Update) -> Tuple[str, int, str]:
         """
@@ -0,0 +1,184 @@
+import json
+import logging
+import sys
+import zlib
+from collections.abc import Mapping, MutableSequence
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _zstd_codec():
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+
+CODECS = {"zlib": lambda: (lambda data: zlib.compress(data, 6), zlib.decompress), "zstd": _zstd_codec}
+_codecs: Dict[str, Tuple] = {}
+
+
+def get_codec(name: str) -> Tuple:
+    """The (compress, decompress) functions of a codec, zstd needs the zstandard package."""
+    if name not in _codecs:
+        if name not in CODECS:
+            raise ValueError(f"Unknown compression '{name}'")
+        try:
+            _codecs[name] = CODECS[name]()
+        except ImportError:
+            logger.warning(f"{name} compression needs the 'zstandard' package, using zlib")
+            _codecs[name] = get_codec("zlib")
+    return _codecs[name]
+
+
+class Turn(Mapping):
+    """
+    One message of a chat in two slots instead of a dict.
+
+    It reads like the OpenAI message dict it replaces (``turn["role"]``,
+    ``turn["content"]``, ``dict(turn)``, equality with dicts), so the history
+    is sent to the backend as is. The role is interned, every turn of a
+    role shares one string.
+    """
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    @classmethod
+    def of(cls, message) -> "Turn":
+        if isinstance(message, Turn):
+            return message
+        return cls(message["role"], message["content"])
+
+    def __getitem__(self, key: str) -> str:
+        if key == "content":
+            return self.content
+        if key == "role":
+            return self.role
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: str) -> None:
+        if key == "content":
+            self.content = value
+        elif key == "role":
+            self.role = sys.intern(value)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("role", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.content!r})"
+
+
+TURN_SIZE = sys.getsizeof(Turn("user", ""))
+
+
+class History(MutableSequence):
+    """
+    The messages of a chat as ``Turn`` records, in OpenAI ``messages`` order.
+
+    The history is itself the ``messages`` list of a request: indexing gives
+    the records and slicing a list of them, nothing is converted or copied.
+    Dicts appended or assigned become records.
+
+    ``compress`` packs an idle chat into a single compressed blob, which is
+    much smaller than its turns and compresses far better than each turn
+    alone; the first access unpacks it again.
+    """
+
+    __slots__ = ("_turns", "_packed")
+
+    def __init__(self, messages: Iterable = ()):
+        self._turns: List[Turn] = [Turn.of(message) for message in messages]
+        # (codec, compressed JSON of [[role, content], ...]) while compressed
+        self._packed: Optional[Tuple[str, bytes]] = None
+
+    @property
+    def turns(self) -> List[Turn]:
+        if self._packed is not None:
+            self.thaw()
+        return self._turns
+
+    @property
+    def compressed(self) -> bool:
+        return self._packed is not None
+
+    def __getitem__(self, index):
+        return self.turns[index]
+
+    def __setitem__(self, index, message) -> None:
+        if isinstance(index, slice):
+            self.turns[index] = [Turn.of(item) for item in message]
+        else:
+            self.turns[index] = Turn.of(message)
+
+    def __delitem__(self, index) -> None:
+        del self.turns[index]
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self.turns)
+
+    def insert(self, index: int, message) -> None:
+        self.turns.insert(index, Turn.of(message))
+
+    def append(self, message) -> None:
+        self.turns.append(Turn.of(message))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (History, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"History({self.turns!r})"
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory of the turns or of the compressed blob."""
+        if self._packed is not None:
+            return sys.getsizeof(self._packed[1])
+        return sum(TURN_SIZE + sys.getsizeof(turn.content) for turn in self._turns)
+
+    def compress(self, codec: str = "zlib", min_bytes: int = 256) -> bool:
+        """
+        Pack the turns into one compressed blob.
+
+        Returns
+        -------
+        bool
+            False if the chat was already compressed, smaller than
+            ``min_bytes`` or did not get smaller.
+        """
+        if self._packed is not None:
+            return False
+        size = self.nbytes
+        if size < min_bytes:
+            return False
+        payload = json.dumps(
+            [[turn.role, turn.content] for turn in self._turns], ensure_ascii=False
+        ).encode()
+        blob = get_codec(codec)[0](payload)
+        if sys.getsizeof(blob) >= size:
+            return False
+        self._packed = (codec, blob)
+        self._turns = []
+        return True
+
+    def thaw(self) -> None:
+        """Unpack a compressed history, done by the first access anyway."""
+        if self._packed is None:
+            return
+        codec, blob = self._packed
+        self._turns = [Turn(role, content) for role, content in json.loads(get_codec(codec)[1](blob))]
+        self._packed = None
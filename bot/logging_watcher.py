@@ -1,51 +1,97 @@
-import time
+import copy
 import logging
 import logging.config
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
 import yaml
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# The listener of the running configuration, replaced on every reload
+_listener: Optional["_RoutingListener"] = None
 
-class LoggingConfigHandler(FileSystemEventHandler):
-    def __init__(self):
-        self.last_modified = time.time()
-        self.config_path = Path("config/logging.yml")
 
-    def on_modified(self, event):
-        if not event.is_directory and event.src_path.endswith("logging.yml"):
-            current = time.time()
-            if current - self.last_modified < 1:  # Throttle to 1 second
-                return
-            self.last_modified = current
+class _RoutingQueueHandler(QueueHandler):
+    """Queues a record together with the handlers it was configured for."""
 
-            try:
-                self.reload_config()
-                logger.info("Logging configuration reloaded successfully")
-            except Exception as e:
-                logger.error(f"Logging config reload failed: {str(e)}")
+    def __init__(self, log_queue: queue.SimpleQueue, handlers: Tuple[logging.Handler, ...]):
+        super().__init__(log_queue)
+        self.handlers = handlers
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the arguments now, they may change once the caller moves
+        # on; formatting, e.g. to JSON, is left to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait((self.handlers, record))
+
+
+class _RoutingListener(QueueListener):
+    def handle(self, item) -> None:
+        handlers, record = item
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
 
-    def reload_config(self):
-        with open(self.config_path) as f:
-            config = yaml.safe_load(f)
-            logging.config.dictConfig(config)
+
+def _queue_handlers() -> "_RoutingListener":
+    """
+    Move every configured handler behind one queue and a listener thread, so
+    formatting and writing a record never blocks the event loop. Each logger
+    keeps its own set of handlers.
+    """
+    log_queue = queue.SimpleQueue()
+    loggers = [logging.getLogger()] + [
+        candidate
+        for candidate in logging.Logger.manager.loggerDict.values()
+        if isinstance(candidate, logging.Logger)
+    ]
+    queued: Dict[Tuple[logging.Handler, ...], _RoutingQueueHandler] = {}
+    for candidate in loggers:
+        if not candidate.handlers:
+            continue
+        handlers = tuple(candidate.handlers)
+        if handlers not in queued:
+            queued[handlers] = _RoutingQueueHandler(log_queue, handlers)
+        for handler in handlers:
+            candidate.removeHandler(handler)
+        candidate.addHandler(queued[handlers])
+    return _RoutingListener(log_queue)
 
 
 class LoggingWatcher:
-    def __init__(self):
-        self.observer = Observer()
+    """
+    Applies config/logging.yml. The bot's config watcher calls
+    ``reload_config`` again whenever the file changes.
+
+    The configured handlers run on a listener thread behind a queue; a
+    reload first drains the queue into the old handlers.
+    """
+
+    def __init__(self, config_path=Path("config/logging.yml")):
+        self.config_path = Path(config_path)
+
+    def reload_config(self):
+        global _listener
         # Ensure logs directory exists
         Path("logs").mkdir(parents=True, exist_ok=True)
-        self.event_handler = LoggingConfigHandler()
-        self.event_handler.reload_config()  # Load initial config
+        with open(self.config_path) as f:
+            config = yaml.safe_load(f)
+        stop_logging()
+        logging.config.dictConfig(config)
+        _listener = _queue_handlers()
+        _listener.start()
 
-    def start(self):
-        self.observer.schedule(self.event_handler, path="config/", recursive=False)
-        self.observer.start()
-        logger.info("Logging watcher started")
 
-    def stop(self):
-        self.observer.stop()
-        self.observer.join()
+def stop_logging() -> None:
+    """Write the queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,25 +1,56 @@
+from contextlib import nullcontext
 from typing import AsyncGenerator, Optional, List
+import asyncio
 import time
 import logging
-import openai
-import datetime
-from g4f.client import AsyncClient
 from typing import Dict
-from telegram import Update, Message
+from telegram import Message, Update, User
 
 from telegram.ext import (
     ContextTypes,
 )
 
-from telegram.constants import (
-    ParseMode,
+from .backends import (
+    RAW_BACKENDS,
+    ChatBackend,
+    EndpointRouter,
+    G4FBackend,
+    OpenAIBackend,
+    PoolSettings,
+    create_http_client,
+    parse_endpoints,
 )
-
-from .helpers.formatting_helper import TextFormatter
+from .chat_coordinator import ChatCoordinator
+from .context_manager import ContextManager
+from .conversation_store import ConversationStore
+from .edit_scheduler import EditScheduler
+from .generation_scheduler import GenerationScheduler
+from .history import History, Turn
+from .helpers.formatting_helper import StreamingPager, TextFormatter
 from .helpers.message_helper import MessageHelper
+from .metrics import REGISTRY
+from .prompt_templates import PromptRenderer, PromptTemplate, compile_templates
+from .reply_pipeline import ReplyPipeline
+from .response_cache import ResponseCache
+from .runtime_config import RuntimeConfig
 
 logger = logging.getLogger(__name__)
 
+MESSAGES = REGISTRY.counter("messages", "Messages answered")
+BACKEND_ERRORS = REGISTRY.counter("backend_errors", "Replies that failed in the backend")
+ACTIVE_STREAMS = REGISTRY.gauge("active_streams", "Replies being generated")
+REPLY_SECONDS = REGISTRY.histogram(
+    "reply_seconds", "Time from receiving a message to its final edit"
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "time_to_first_token_seconds", "Time from the backend request to the first text"
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "tokens_per_second",
+    "Streamed deltas per second after the first one, about one token each",
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500),
+)
+
 class MyMessageHandler:
     def __init__(
         self,
@@ -30,124 +61,372 @@ class MyMessageHandler:
         MODEL: str,
         URI: str,
         backend: str,
+        edit_scheduler: EditScheduler,
         streaming: bool = True,
         api_key: Optional[str] = "0",
+        pool_settings: Optional[PoolSettings] = None,
+        routing: Optional[Dict] = None,
+        conversation_memory: Optional[ConversationStore] = None,
+        context: Optional[Dict] = None,
+        max_new_tokens: int = 1024,
+        concurrent_messages: str = "serialize",
+        prefix_cache: bool = False,
+        sampling: Optional[Dict] = None,
+        raw_backend: Optional[Dict] = None,
+        response_cache: Optional[Dict] = None,
+        admission: Optional[Dict] = None,
+        users: Optional[List] = None,
     ):
-        self.template = template
         self.DEV_ID = DEV_ID
         self.instruction_templates = instruction_templates
-        self.streaming = streaming
+        # Compiled once here and on reload, not on every turn
+        self.templates: Dict[str, PromptTemplate] = compile_templates(instruction_templates)
+        # Raw completion prompts of recent chats, extended turn by turn
+        self.prompt_renderer = PromptRenderer()
         self.BOT_USERNAME = BOT_USERNAME
-        self.MODEL = MODEL
-        self.URI = URI
+        # Settings reloaded at runtime, each reply keeps the snapshot it started with
+        self.runtime = RuntimeConfig(URI, MODEL, streaming, template, users)
         self.backend = backend
+        # Native completion servers get the prompt rendered with the template
+        self.raw_prompt = backend in RAW_BACKENDS
+        self._check_raw_template(self.templates, template)
+        self.api_key = api_key
+        self.edit_scheduler = edit_scheduler
+
+        # One non-blocking connection pool shared by every backend client
+        self.pool_settings = pool_settings or PoolSettings()
+        self.http_client = create_http_client(self.pool_settings)
+        self.routing = routing or {}
+        self.prefix_cache = prefix_cache
+        self.sampling = sampling or {}
+        # Server specific options of the raw completion backends
+        self.raw_backend = raw_backend or {}
+        self.max_new_tokens = max_new_tokens
+        if prefix_cache:
+            # Every turn of a chat goes to the replica that cached its prefix
+            self.routing = {**self.routing, "policy": "sticky"}
+            context = {**(context or {}), "policy": "prefix_cache"}
 
         # Initialize OpenAI compatible client
-        if self.backend:
-            self.client = openai.OpenAI(base_url=URI, api_key=api_key)
-        else:
-            self.client = AsyncClient()
+        self.client: ChatBackend = self._create_client(URI)
 
-        # Memory: each int is a userID which contains a list of dicts
-        self.conversation_memory: Dict[int, List[Dict[str, str]]] = {}
+        # Memory: each int is a userID which contains a list of dicts,
+        # bounded by chat count, total size and idle time
+        self.conversation_memory: ConversationStore = (
+            # An empty store is falsy, so compare with None
+            conversation_memory if conversation_memory is not None else ConversationStore()
+        )
+
+        # Serializes or cancels overlapping messages of the same chat
+        self.chat_coordinator = ChatCoordinator(concurrent_messages)
+
+        # Replays replies to repeated prompts when the sampling is deterministic
+        self.response_cache = ResponseCache.from_config(response_cache, self.sampling)
+
+        # Limits concurrent generations, queueing the rest by priority
+        self.generation_scheduler = GenerationScheduler.from_config(admission, DEV_ID, users)
+
+        # Trims each request to the context window of the model
+        self.context_manager = ContextManager.from_config(
+            context, reserve_tokens=max_new_tokens, summarize=self._summarize
+        )
 
         self.logger = logging.getLogger(__name__)
 
-    def update_client_settings(self, uri: str, model: str):
-        """Update API client with new settings"""
-        self.URI: str = uri
-        self.MODEL: str = model
-        if self.backend:
-            self.client = openai.OpenAI(base_url=uri, api_key="0")
-        else:
-            self.client = AsyncClient()
+    def apply_runtime(self, runtime: RuntimeConfig) -> None:
+        """
+        Swap in new runtime settings for the replies started from now on.
 
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        # Send placeholder message while waiting for the response
-        last_message = await MessageHelper.send_placeholder_message(update)
+        The backend client is kept and only learns about the endpoints if
+        they changed; unchanged endpoints keep their clients and load
+        statistics, and all of them keep the pooled connections.
+        """
+        if runtime.endpoints != self.runtime.endpoints and isinstance(self.client, EndpointRouter):
+            self.client.update_endpoints(runtime.endpoints)
+        self.runtime = runtime
 
-        # Send a typing action while waiting for the response
-        await MessageHelper.send_typing_action(update)
+    def set_instruction_templates(self, instruction_templates: Dict) -> None:
+        """
+        Compile reloaded instruction templates and use them for new chats.
 
-        # Get basic info of the incoming message
-        message_type, chat_id, message = MessageHelper.get_message_info(update)
+        Raises
+        ------
+        ValueError
+            If a template is invalid or the running one is missing.
+        """
+        templates = compile_templates(instruction_templates)
+        if self.runtime.template not in templates:
+            raise ValueError(f"the running template '{self.runtime.template}' is missing")
+        self._check_raw_template(templates, self.runtime.template)
+        self.instruction_templates = instruction_templates
+        self.templates = templates
 
-        # Print a log for debugging if debugging is enabled
-        logger.debug(f'User ({chat_id}) in {message_type}: "{message}"')
+    def _check_raw_template(self, templates: Dict[str, PromptTemplate], name: str) -> None:
+        # Otherwise every message would fail when its prompt is rendered
+        if self.raw_prompt and name in templates and not templates[name].raw:
+            raise ValueError(
+                f"template '{name}' has no prompt_template, which the {self.backend} backend needs"
+            )
 
-        self.update_conversation_memory(chat_id, message=message)
+    def render_prompt(
+        self, chat_id: int, messages: List[Dict[str, str]], runtime: RuntimeConfig
+    ) -> str:
+        """The raw completion prompt of a chat, for backends without a chat API"""
+        return self.prompt_renderer.render(chat_id, messages, self.templates[runtime.template])
+
+    def _prompt_args(
+        self, messages: List[Dict[str, str]], runtime: RuntimeConfig, chat_id: Optional[int] = None
+    ) -> Dict:
+        """The ``prompt`` and ``stop`` arguments of raw completion backends"""
+        if not self.raw_prompt:
+            return {}
+        template = self.templates[runtime.template]
+        if chat_id is None:
+            prompt = template.render(messages)
+        else:
+            prompt = self.render_prompt(chat_id, messages, runtime)
+        return {"prompt": prompt, "stop": template.stop}
+
+    def _create_client(self, uri) -> ChatBackend:
+        if self.backend in RAW_BACKENDS:
+            backend_class = RAW_BACKENDS[self.backend]
+            return EndpointRouter(
+                parse_endpoints(uri),
+                lambda endpoint: backend_class(
+                    endpoint,
+                    self.http_client,
+                    sampling=self.sampling,
+                    max_new_tokens=self.max_new_tokens,
+                    **self.raw_backend,
+                ),
+                self.http_client,
+                **self.routing,
+            )
+        if self.backend:
+            endpoints = parse_endpoints(uri)
+            # With replicas a failed request moves on to the next endpoint
+            # instead of waiting for the client's own retries
+            max_retries = 0 if len(endpoints) > 1 else 2
+            return EndpointRouter(
+                endpoints,
+                lambda endpoint: OpenAIBackend(
+                    endpoint,
+                    self.http_client,
+                    api_key=self.api_key,
+                    max_retries=max_retries,
+                    report_usage=self.prefix_cache,
+                    sampling=self.sampling,
+                ),
+                self.http_client,
+                **self.routing,
+            )
+        return G4FBackend()
 
-        response_generator: AsyncGenerator = self.client.chat.completions.create(
-            model=self.MODEL,
-            messages=self.conversation_memory[chat_id]["messages"],
-            stream=self.streaming,
-        )
+    def start(self) -> None:
+        """Start the background tasks of the memory and the backend client"""
+        self.conversation_memory.start()
+        self.client.start()
 
-        # Make a string placeholder for the final response
-        response_string: str = ""
-        response_cache: str = ""
+    async def aclose(self) -> None:
+        """Close the backend client and the shared connection pool"""
+        if self.generation_scheduler is not None:
+            await self.generation_scheduler.stop()
+        await self.client.aclose()
+        await self.http_client.aclose()
 
-        # saving the time of the last update which is now for the first iteration
-        last_update_time: float = time.time()
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        received_at = time.perf_counter()
+
+        # The placeholder and the typing action are sent while the backend
+        # request starts, not before it
+        placeholder = asyncio.create_task(MessageHelper.send_placeholder_message(update))
+        typing = asyncio.create_task(MessageHelper.keep_typing(update))
+        try:
+            await self._handle_turn(update, placeholder, typing, received_at)
+        finally:
+            typing.cancel()
+
+    async def _handle_turn(
+        self,
+        update: Update,
+        placeholder: "asyncio.Task[Message]",
+        typing: asyncio.Task,
+        received_at: float,
+    ) -> None:
+        # Get basic info of the incoming message
+        message_type, chat_id, message = MessageHelper.get_message_info(update)
 
-        # Iterate through the generator and send the response
-        async for chunk in response_generator:
-            response = chunk.choices[0].delta.content or ""
-            if not self.streaming:
-                response_string = response
-                await self._edit_response_text(context, response_string, last_message)
-            else:
-                response_cache: str = ""
-                # If the response is a string, add it to the cache
-                response_cache += (
-                    response if response is not None else ""
-                )  # if isinstance(response, str) else ""
-
-                # Cache the response
-                response_string += response_cache
-
-                # If not enough time elapsed, continue caching
-                if time.time() - last_update_time > 0.5:
-                    # the _edit_response_text alters the place holder message with the real output
-                    last_message = await self._edit_response_text(
-                        context, response_string, last_message
+        # Print a log for debugging if debugging is enabled, formatted only then
+        log_extra = {"chat_id": chat_id}
+        logger.debug('User (%s) in %s: "%s"', chat_id, message_type, message, extra=log_extra)
+
+        # One reply at a time per chat, other chats keep running in parallel
+        async with self.chat_coordinator.turn(chat_id) as turn:
+            # A config reload from now on only affects the next replies
+            runtime = self.runtime
+
+            # Resume a saved conversation on its first message since startup
+            await self.conversation_memory.load(chat_id)
+            self.update_conversation_memory(chat_id, message=message, runtime=runtime)
+
+            # Escapes every delta once and splits the reply into messages
+            # Telegram accepts, only the last one is edited while streaming
+            pager = StreamingPager()
+            # Filled with the placeholder once it is sent
+            pages: List[Message] = []
+
+            if not turn.superseded:
+                try:
+                    turn.allow_cancel()
+                    await self._stream_response(
+                        chat_id, placeholder, pages, pager, runtime, update.effective_user, typing
                     )
+                except asyncio.CancelledError:
+                    if not turn.superseded:
+                        raise
+                    # A newer message stopped this reply, keep what was already shown
+                    asyncio.current_task().uncancel()
+                finally:
+                    turn.forbid_cancel()
+
+            typing.cancel()
+            if not pages:
+                pages.append(await placeholder)
+            if pager.text or not turn.superseded:
+                # send the final text, the scheduler skips it if identical to the already sent message
+                await self.edit_scheduler.flush(
+                    pages[-1].chat_id, pages[-1].message_id, pager.render()
+                )
+            else:
+                # Superseded before anything was generated
+                await pages[0].delete()
 
-                    # Update the last update time
-                    last_update_time = time.time()
+            response_string = pager.text
+            logger.debug(
+                'Sent (%s) in %s: "%s"', chat_id, message_type, response_string, extra=log_extra
+            )
 
+            # First check if the chat_id is already in the database, and save the response
+            self.update_conversation_memory(
+                chat_id, response_string=response_string, runtime=runtime
+            )
+
+            # Print the database to the console for debugging if enabled, the
+            # lookup touches the store so it is skipped otherwise
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(
-                    f"Response Cache: {response_cache}, Open Block: {TextFormatter.has_open_code_block(response_string)}, Open Inline: {TextFormatter.has_open_inline_code(response_string)}"
+                    "Conversation: %s", self.conversation_memory[chat_id], extra=log_extra
                 )
 
-        # edit the message if its not identical to the already sent message
-        if last_message.text != response_string and self.streaming:
-            await self._edit_response_text(context, response_string, last_message)
+        MESSAGES.inc()
+        REPLY_SECONDS.observe(time.perf_counter() - received_at)
 
-        logger.debug(f'Sent ({chat_id}) in {message_type}: "{response_string}"')
+    async def _stream_response(
+        self,
+        chat_id: int,
+        placeholder: "asyncio.Task[Message]",
+        pages: List[Message],
+        pager: StreamingPager,
+        runtime: RuntimeConfig,
+        user: Optional[User] = None,
+        typing: Optional[asyncio.Task] = None,
+    ) -> None:
+        """
+        Stream the reply of the backend into the pager and the last message of
+        ``pages`` through a ``ReplyPipeline``. ``pages`` starts with the
+        ``placeholder`` once it is sent; ``typing`` stops at the first delta.
+        """
+        pipeline = ReplyPipeline(
+            pager, pages, placeholder, self.edit_scheduler, streaming=runtime.streaming
+        )
 
-        # First check if the chat_id is already in the database, and save the response
-        self.update_conversation_memory(chat_id, response_string=response_string)
+        messages = await self.context_manager.build(
+            self.conversation_memory[chat_id], runtime.model
+        )
 
-        # Print the database to the console for debugging if enabled
-        logger.debug(self.conversation_memory[chat_id])
+        cache_key = cached = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.key(messages, runtime.model, self.sampling)
+            cached = self.response_cache.get(cache_key)
 
-    async def _edit_response_text(
-        self, context: str, response_string: str, placeholder_message
-    ) -> Message:
-        if TextFormatter.has_open_code_block(response_string):
-            text = TextFormatter.escape(response_string) + "```"
-        elif TextFormatter.has_open_inline_code(response_string):
-            text = TextFormatter.escape(response_string) + "`"
+        if cached is not None:
+            response_generator: AsyncGenerator = self.response_cache.replay(cached)
         else:
-            text = TextFormatter.escape(response_string)
+            response_generator = self.client.stream_chat(
+                model=runtime.model,
+                messages=messages,
+                stream=runtime.streaming,
+                route_key=chat_id,
+                **self._prompt_args(messages, runtime, chat_id),
+            )
 
-        return await context.bot.edit_message_text(
-            text,
-            chat_id=placeholder_message.chat_id,
-            message_id=placeholder_message.message_id,
-            parse_mode=ParseMode.MARKDOWN_V2,
-        )
+        # Cached replies do not need the backend and skip the queue
+        slot = nullcontext()
+        if self.generation_scheduler is not None and cached is None:
+
+            def show_position(position: int) -> None:
+                # Positions before the placeholder exists are not shown
+                if pipeline.shown():
+                    self.edit_scheduler.submit(
+                        pages[0].chat_id,
+                        pages[0].message_id,
+                        TextFormatter.escape(f"Queued, position {position}..."),
+                    )
+
+            slot = self.generation_scheduler.slot(
+                user.id if user else chat_id, user.username if user else None, show_position
+            )
+
+        async with slot:
+            requested_at = time.perf_counter()
+            first_token_at = None
+            chunks = 0
+            # Checked once per reply instead of building a record per delta
+            trace = logger.isEnabledFor(logging.DEBUG)
+            log_extra = {"chat_id": chat_id}
+
+            def on_delta(delta: str) -> None:
+                # Called by the reader stage as soon as a delta arrives
+                nonlocal first_token_at, chunks
+                if first_token_at is None and cached is None:
+                    first_token_at = time.perf_counter()
+                    TIME_TO_FIRST_TOKEN.observe(first_token_at - requested_at)
+                if typing is not None:
+                    typing.cancel()
+                chunks += 1
+                if trace:
+                    logger.debug("Response delta: %r", delta, extra=log_extra)
+
+            ACTIVE_STREAMS.inc()
+            try:
+                await pipeline.run(response_generator, on_delta)
+            except Exception:
+                BACKEND_ERRORS.inc()
+                raise
+            finally:
+                ACTIVE_STREAMS.dec()
+
+        if cached is not None:
+            # A replay says nothing about the backend's speed
+            return
+        if cache_key is not None:
+            # Only complete replies get here, cancelled and failed ones raised
+            self.response_cache.put(cache_key, pager.text)
+        if chunks > 1:
+            elapsed = time.perf_counter() - first_token_at
+            if elapsed > 0:
+                TOKENS_PER_SECOND.observe((chunks - 1) / elapsed)
+
+    async def _summarize(self, messages: List[Dict[str, str]]) -> str:
+        """Generate a conversation summary for the context manager"""
+        runtime = self.runtime
+        chunks = [
+            chunk
+            async for chunk in self.client.stream_chat(
+                messages, runtime.model, stream=False, **self._prompt_args(messages, runtime)
+            )
+        ]
+        return "".join(chunks)
 
     async def send_placeholder_message(self, update):
         placeholder_message = await update.message.reply_text("...")
@@ -167,6 +446,7 @@ class MyMessageHandler:
         chat_id: int,
         message: str = None,
         response_string: str = None,
+        runtime: Optional[RuntimeConfig] = None,
     ) -> None:
         """
         Manage the conversation memory by saving a user's message and/or updating with the assistant's response.
@@ -175,22 +455,23 @@ class MyMessageHandler:
             chat_id (int): The unique chat ID.
             message (str, optional): The user's current message to be saved. Defaults to None.
             response_string (str, optional): The assistant's response to the user's input. Defaults to None.
+            runtime (RuntimeConfig, optional): The settings of the reply. Defaults to the current ones.
         """
+        runtime = runtime or self.runtime
+
         # Initialize conversation memory for this chat_id if it doesn't exist
         if chat_id not in self.conversation_memory:
-            template_data = self.instruction_templates.get(self.template)
-            if not template_data:
-                raise ValueError(f"Template '{self.template}' not found.")
-
-            # Extract the system prompt and prompt template from the template data
-            system_prompt = template_data["system_prompt"]
+            template = self.templates.get(runtime.template)
+            if template is None:
+                raise ValueError(f"Template '{runtime.template}' not found.")
 
             self.conversation_memory[chat_id] = {
-                "messages": [{"role": "system", "content": system_prompt}],
+                # Every chat shares the template's system prompt string
+                "messages": History([Turn("system", template.system_prompt)]),
                 "metadata": {
-                    "created_at": datetime.datetime.now().isoformat(),
-                    "model": self.MODEL,
-                    "endpoint": self.URI,
+                    "created_at": time.time(),
+                    "model": runtime.model,
+                    "endpoint": runtime.uri,
                     "chat_id": chat_id,
                 },
             }
@@ -199,7 +480,7 @@ class MyMessageHandler:
 
         # Add user message (always append as a new entry)
         if message:
-            messages.append({"role": "user", "content": message})
+            messages.append(Turn("user", message))
 
         # Handle assistant response (append new or update last entry for streaming)
         if response_string:
@@ -208,7 +489,10 @@ class MyMessageHandler:
                 messages[-1]["content"] = response_string
             else:
                 # Append new assistant message after user input
-                messages.append({"role": "assistant", "content": response_string})
+                messages.append(Turn("assistant", response_string))
+
+        # Account for the new size, this may evict other idle chats
+        self.conversation_memory.resize(chat_id)
 
     async def handle_edited_message(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -217,10 +501,9 @@ class MyMessageHandler:
         edited_message = update.edited_message.text.replace(
             self.BOT_USERNAME, ""
         ).strip()
-        if self.debug:
-            self.logger.debug(
-                f'User {chat_id} in an edited message: "{edited_message}"'
-            )
+        logger.debug(
+            'User %s in an edited message: "%s"', chat_id, edited_message, extra={"chat_id": chat_id}
+        )
         await update.edited_message.reply_text(
             "Message edited, currently I dont support this feature."
         )
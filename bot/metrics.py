@@ -0,0 +1,265 @@
+import asyncio
+import bisect
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a fast Telegram edit to a long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Counter:
+    """A value that only goes up."""
+
+    __slots__ = ("name", "help", "value")
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(f"{self.name}_total", self.value)]
+
+
+class Gauge:
+    """A value that goes up and down, such as the number of active streams."""
+
+    __slots__ = ("name", "help", "_value", "_function")
+    type = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from ``function`` when scraped, e.g. a queue length."""
+        self._function = function
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets. Recording is a bisect and two
+    additions, cumulative counts are only computed when scraped.
+    """
+
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating inside its bucket, 0.0 if empty."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{bound}"}}', cumulative))
+        samples.append((f'{self.name}_bucket{{le="+Inf"}}', self.count))
+        samples.append((f"{self.name}_sum", self.sum))
+        samples.append((f"{self.name}_count", self.count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of the bot and renders them in the Prometheus text
+    format.
+
+    Components that already count events in a ``stats`` dict are exposed with
+    ``register_stats`` instead of being rewritten; their values are read
+    only when the metrics are scraped.
+    """
+
+    def __init__(self, prefix: str = "limestone"):
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        name = f"{self.prefix}_{name}"
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def register_stats(self, name: str, stats: Callable[[], Dict[str, float]]) -> None:
+        """
+        Expose the counters of a component.
+
+        Parameters
+        ----------
+        name : str
+            The metric name prefix, e.g. ``edit_scheduler``.
+        stats : Callable[[], Dict[str, float]]
+            Returns the current counters, such as ``lambda: scheduler.stats``.
+        """
+        self._stats[name] = stats
+
+    def _collect_stats(self) -> Dict[str, Dict[str, float]]:
+        collected = {}
+        for name, stats in self._stats.items():
+            try:
+                collected[name] = dict(stats())
+            except Exception as e:
+                logger.warning(f"Collecting {name} metrics failed: {e}")
+        return collected
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {_format(value)}" for name, value in metric.samples())
+        for name, stats in self._collect_stats().items():
+            for key, value in stats.items():
+                metric_name = f"{self.prefix}_{name}_{key}_total"
+                lines.append(f"# TYPE {metric_name} counter")
+                lines.append(f"{metric_name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """A short human readable overview, used by the /stats command."""
+        lines = []
+        for metric in self._metrics.values():
+            short_name = metric.name[len(self.prefix) + 1 :]
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    lines.append(
+                        f"{short_name}: n={metric.count} "
+                        f"avg={metric.sum / metric.count:.3f} "
+                        f"p50={metric.quantile(0.5):.3f} p99={metric.quantile(0.99):.3f}"
+                    )
+            else:
+                lines.append(f"{short_name}: {_format(metric.value)}")
+        for name, stats in self._collect_stats().items():
+            values = " ".join(f"{key}={_format(value)}" for key, value in stats.items())
+            lines.append(f"{name}: {values}")
+        return "\n".join(lines)
+
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.6g}"
+    return str(int(value))
+
+
+# The registry of the bot, components record into it at import time like
+# the default registry of prometheus_client
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    Serves ``GET /metrics`` on a local port from the bot's event loop, so no
+    thread or web framework is needed.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry = REGISTRY, host: str = "127.0.0.1", port: int = 9464
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # Headers are not needed, read them to leave the socket clean
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            method, path, *_ = request_line.decode("latin-1").split(" ")
+            if method == "GET" and path.split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Tuple
+
+Messages = List[Dict[str, str]]
+
+
+def _split(text: str, placeholder: str, name: str) -> Tuple[str, str]:
+    before, found, after = text.partition(placeholder)
+    if not found:
+        raise ValueError(f"template '{name}': {placeholder} is missing")
+    return before, after
+
+
+def _unescape(text: str) -> str:
+    # Unquoted YAML keeps "\n" as two characters
+    return text.replace("\\n", "\n")
+
+
+class PromptTemplate:
+    """
+    An instruction template of instruction_templates.yml, compiled once into
+    the literal text around its placeholders.
+
+    Rendering a turn is then a concatenation of three strings instead of a
+    ``str.format`` of the whole template, and braces in a message cannot be
+    mistaken for placeholders. Three layouts are understood:
+
+    - ``prompt_template`` with ``header``, ``user`` and ``output`` parts,
+    - ``prompt_template`` as one string, split after its system prompt line,
+    - the older ``prompt_start``, ``instruction`` and ``response`` keys.
+
+    A template with only a ``system_prompt`` serves chat-completions
+    backends, ``raw`` is False then and ``render`` refuses. ``stop`` lists
+    the strings a raw completion stops at.
+    """
+
+    __slots__ = (
+        "name",
+        "system_prompt",
+        "raw",
+        "header",
+        "user",
+        "output",
+        "stop",
+        "_system_message",
+    )
+
+    def __init__(self, name: str, data: Dict):
+        if not isinstance(data, dict):
+            raise ValueError(f"template '{name}' must be a mapping")
+        self.name = name
+        template = data.get("prompt_template")
+        self.raw = True
+
+        if isinstance(template, dict):
+            parts = [template.get(part) for part in ("header", "user", "output")]
+            if not all(isinstance(part, str) for part in parts):
+                raise ValueError(f"template '{name}': prompt_template needs header, user and output")
+            header, user, output = parts
+        elif isinstance(template, str):
+            before_input, after_input = _split(template, "{input}", name)
+            between, after_output = _split(after_input, "{output}", name)
+            # The header ends with the line of the system prompt, the user
+            # turn with the line of the input
+            end = 0
+            if "{system_prompt}" in before_input:
+                end = before_input.find("\n", before_input.find("{system_prompt}")) + 1
+            cut = between.find("\n") + 1
+            header = before_input[:end]
+            user = before_input[end:] + "{input}" + between[:cut]
+            output = between[cut:] + "{output}" + after_output
+        elif "instruction" in data and "response" in data:
+            header = "{system_prompt}"
+            user = _unescape(data["instruction"]) + "{input}"
+            output = _unescape(data["response"]) + "{output}"
+        else:
+            header = user = output = None
+            self.raw = False
+
+        self.system_prompt = data.get("system_prompt") or data.get("prompt_start")
+        if not isinstance(self.system_prompt, str):
+            raise ValueError(f"template '{name}' needs a system_prompt")
+        self._system_message = {"role": "system", "content": self.system_prompt}
+
+        if self.raw:
+            self.header = _split(header, "{system_prompt}", name) if "{system_prompt}" in header else (header, "")
+            self.user = _split(user, "{input}", name)
+            output_prefix, output_suffix = _split(output, "{output}", name)
+            if not output_suffix.strip():
+                # Most templates leave the end of a reply to the model, a
+                # finished one in the history ends like a user turn
+                output_suffix = self.user[1] or output_suffix
+            self.output = (output_prefix, output_suffix)
+            # Where a reply ends: its end of turn marker, or the start of
+            # the next user turn for templates without one
+            stop = [output_suffix.strip(), self.user[0].strip()]
+            self.stop = [marker for index, marker in enumerate(stop) if marker and marker not in stop[:index]]
+        else:
+            self.stop = []
+
+    @property
+    def system_message(self) -> Dict[str, str]:
+        """A new chat's first message for chat-completions backends."""
+        return dict(self._system_message)
+
+    def render_turn(self, message: Dict[str, str]) -> str:
+        prefix, suffix = self.output if message["role"] == "assistant" else self.user
+        return prefix + message["content"] + suffix
+
+    def render_header(self, messages: Messages) -> str:
+        if messages and messages[0]["role"] == "system":
+            system_prompt = messages[0]["content"]
+        else:
+            system_prompt = self.system_prompt
+        return self.header[0] + system_prompt + self.header[1]
+
+    def render(self, messages: Messages) -> str:
+        """The whole prompt of a raw completion, ending where the reply starts."""
+        if not self.raw:
+            raise ValueError(f"template '{self.name}' has no prompt_template for raw completions")
+        start = 1 if messages and messages[0]["role"] == "system" else 0
+        parts = [self.render_header(messages)]
+        parts.extend(self.render_turn(message) for message in messages[start:])
+        parts.append(self.output[0])
+        return "".join(parts)
+
+
+def compile_templates(instruction_templates: Dict) -> Dict[str, PromptTemplate]:
+    """
+    Compile every template of instruction_templates.yml.
+
+    Raises
+    ------
+    ValueError
+        Listing every invalid template.
+    """
+    if not isinstance(instruction_templates, dict):
+        raise ValueError("instruction templates must be a mapping")
+    compiled, errors = {}, []
+    for name, data in instruction_templates.items():
+        try:
+            compiled[name] = PromptTemplate(name, data)
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        raise ValueError("Invalid instruction templates: " + "; ".join(errors))
+    return compiled
+
+
+class _Rendered:
+    __slots__ = ("template", "turns", "offsets", "text")
+
+    def __init__(self, template: PromptTemplate):
+        self.template = template
+        # (role, content) of the rendered messages and where each one ends
+        self.turns: List[Tuple[str, str]] = []
+        self.offsets: List[int] = []
+        self.text = ""
+
+
+class PromptRenderer:
+    """
+    Renders the raw completion prompt of each chat incrementally.
+
+    The rendered text of a chat's messages is kept, so the next turn only
+    renders the messages added since; the cached prefix is compared message
+    by message, and a changed or dropped message, e.g. after the context
+    manager trimmed the history, renders again from that message on. The
+    ``max_chats`` most recently rendered chats are kept.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``rendered`` messages and ``reused`` ones taken from the cache.
+    """
+
+    def __init__(self, max_chats: int = 1024):
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Hashable, _Rendered]" = OrderedDict()
+        self.stats: Dict[str, int] = {"rendered": 0, "reused": 0}
+
+    def render(self, key: Hashable, messages: Messages, template: PromptTemplate) -> str:
+        """The prompt of ``messages``, ending where the reply starts."""
+        if not template.raw:
+            raise ValueError(f"template '{template.name}' has no prompt_template for raw completions")
+        rendered = self._chats.get(key)
+        header = template.render_header(messages)
+        if rendered is None or rendered.template is not template or not rendered.text.startswith(header):
+            rendered = _Rendered(template)
+            rendered.text = header
+        self._chats[key] = rendered
+        self._chats.move_to_end(key)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+        start = 1 if messages and messages[0]["role"] == "system" else 0
+        turns = rendered.turns
+        kept = 0
+        # Strings compare by identity first, so unchanged messages are cheap
+        while (
+            kept < len(turns)
+            and start + kept < len(messages)
+            and turns[kept][0] == messages[start + kept]["role"]
+            and turns[kept][1] == messages[start + kept]["content"]
+        ):
+            kept += 1
+        if kept < len(turns):
+            end = rendered.offsets[kept - 1] if kept else len(header)
+            rendered.text = rendered.text[:end]
+            del turns[kept:], rendered.offsets[kept:]
+        self.stats["reused"] += kept
+
+        new = messages[start + kept :]
+        if new:
+            parts = [template.render_turn(message) for message in new]
+            end = len(rendered.text)
+            for part in parts:
+                end += len(part)
+                rendered.offsets.append(end)
+            rendered.text += "".join(parts)
+            turns.extend((message["role"], message["content"]) for message in new)
+            self.stats["rendered"] += len(new)
+        return rendered.text + template.output[0]
+
+    def forget(self, key: Hashable) -> None:
+        self._chats.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._chats)
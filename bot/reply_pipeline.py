@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Deque, List, Optional
+
+from telegram import Message
+
+from .edit_scheduler import EditScheduler
+from .helpers.formatting_helper import StreamingPager
+from .helpers.message_helper import MessageHelper
+
+# Marks the end of the stream in the delta queue
+_END = None
+
+
+class ReplyPipeline:
+    """
+    Moves a reply from the backend stream to its Telegram messages in
+    stages that do not wait for each other:
+
+    - the reader drains the backend stream into a bounded queue of deltas,
+    - the accumulator feeds every queued delta into the ``pager`` at once,
+    - the sender renders the current page and hands it to the edit
+      scheduler at most every ``edit_interval`` seconds, and sends the full
+      pages with their continuation messages in order.
+
+    A slow ``edit_message_text`` only holds up the sender, the backend socket
+    is read at full speed meanwhile. The sender renders only the latest
+    snapshot when it is ready to send, the deltas in between are never
+    rendered on their own. Until the ``placeholder`` is sent the deltas
+    wait in the pager; ``pages`` starts with it from then on.
+
+    Without ``streaming`` the same stages run but the sender only sends full
+    pages, the caller sends the final text of the last page either way.
+    """
+
+    def __init__(
+        self,
+        pager: StreamingPager,
+        pages: List[Message],
+        placeholder: "asyncio.Future[Message]",
+        edit_scheduler: EditScheduler,
+        streaming: bool = True,
+        edit_interval: float = 0.5,
+        max_queued: int = 256,
+    ):
+        self.pager = pager
+        self.pages = pages
+        self.placeholder = placeholder
+        self.edit_scheduler = edit_scheduler
+        self.streaming = streaming
+        self.edit_interval = edit_interval
+        self._deltas: "asyncio.Queue[Optional[str]]" = asyncio.Queue(max_queued)
+        self._full_pages: Deque[str] = deque()
+        self._version = 0  # counts the batches fed into the pager
+        self._finished = False
+        self._wake = asyncio.Event()
+        placeholder.add_done_callback(lambda _: self._wake.set())
+
+    def shown(self) -> bool:
+        """Whether the placeholder was sent, ``pages`` is empty before."""
+        if not self.pages and self.placeholder.done():
+            self.pages.append(self.placeholder.result())
+        return bool(self.pages)
+
+    async def run(
+        self, deltas: AsyncIterator[str], on_delta: Optional[Callable[[str], None]] = None
+    ) -> None:
+        """
+        Stream ``deltas`` into the pager and the messages until the stream
+        ends. ``on_delta`` is called by the reader with every delta.
+
+        Backend and Telegram errors are raised here. On cancellation the
+        backend stream is closed, which aborts the request, and the full
+        pages taken so far are still sent.
+        """
+        reader = asyncio.create_task(self._read(deltas, on_delta))
+        sender = asyncio.create_task(self._send())
+        try:
+            await self._accumulate(sender)
+            await reader
+        finally:
+            reader.cancel()
+            self._finished = True
+            self._wake.set()
+            await asyncio.gather(reader, return_exceptions=True)
+            await sender
+
+    async def _read(
+        self, deltas: AsyncIterator[str], on_delta: Optional[Callable[[str], None]]
+    ) -> None:
+        try:
+            # Closing the generator on cancellation also aborts the backend request
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    if on_delta is not None:
+                        on_delta(delta)
+                    await self._deltas.put(delta)
+        except Exception:
+            await self._deltas.put(_END)
+            raise
+        await self._deltas.put(_END)
+
+    async def _accumulate(self, sender: asyncio.Task) -> None:
+        ended = False
+        while not ended:
+            batch = [await self._deltas.get()]
+            while not self._deltas.empty():
+                batch.append(self._deltas.get_nowait())
+            for delta in batch:
+                if delta is _END:
+                    ended = True
+                    break
+                self.pager.feed(delta)
+            self._full_pages.extend(self.pager.take_full_pages())
+            self._version += 1
+            self._wake.set()
+            if sender.done():
+                # The sender failed, stop reading a reply nobody sees
+                sender.result()
+
+    async def _send(self) -> None:
+        sent = 0  # the version of the last snapshot handed to the edit scheduler
+        due = 0.0
+        while True:
+            while self._full_pages:
+                if not self.pages:
+                    # Shielded, a superseded reply still needs its placeholder
+                    self.pages.append(await asyncio.shield(self.placeholder))
+                message = self.pages[-1]
+                await self.edit_scheduler.flush(
+                    message.chat_id, message.message_id, self._full_pages.popleft()
+                )
+                self.pages.append(await MessageHelper.send_continuation_message(message))
+            if self._finished:
+                return
+
+            timeout = None
+            if self.streaming and self._version != sent and self.shown():
+                timeout = due - time.monotonic()
+                if timeout <= 0:
+                    message = self.pages[-1]
+                    self.edit_scheduler.submit(
+                        message.chat_id, message.message_id, self.pager.render()
+                    )
+                    sent = self._version
+                    due = time.monotonic() + self.edit_interval
+                    continue
+
+            # Woken by new deltas, the placeholder or the end of the reply
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
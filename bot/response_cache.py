@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def is_deterministic(sampling: Optional[Dict]) -> bool:
+    """
+    Whether the sampling settings make the backend repeat its replies:
+    greedy decoding (``temperature: 0``) or a fixed ``seed``.
+    """
+    sampling = sampling or {}
+    return sampling.get("temperature") == 0 or sampling.get("seed") is not None
+
+
+class ResponseCache:
+    """
+    Replies of recent requests, looked up by an exact match of the prompt.
+
+    The key is a hash of the normalized messages, the model and the sampling
+    settings, so it only saves work where the backend would generate the
+    same text again: identical first messages of new chats, or the same
+    question with the same system prompt. Entries are evicted in least
+    recently used order once ``max_entries`` or ``max_bytes`` is exceeded,
+    and expire ``ttl`` seconds after they were stored.
+
+    A hit is replayed as a fast stream of ``replay_chunk`` character deltas,
+    so it goes through the same formatting, paging and edits as a generated
+    reply.
+
+    Attributes
+    ----------
+    stats : Dict[str, int]
+        ``hits``, ``misses``, ``stores``, ``expired`` and ``evicted`` counts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl: Optional[float] = 3600,
+        replay_chunk: int = 32,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.replay_chunk = replay_chunk
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "expired": 0,
+            "evicted": 0,
+        }
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[Dict], sampling: Optional[Dict] = None
+    ) -> Optional["ResponseCache"]:
+        """
+        Build the cache from the optional ``response_cache`` block of
+        config.yml, None if it is disabled or the sampling is random.
+        """
+        config = dict(config or {})
+        if not config.pop("enabled", False):
+            return None
+        if not is_deterministic(sampling):
+            logger.warning(
+                "Response cache disabled: it needs sampling.temperature 0 or a sampling.seed"
+            )
+            return None
+        return cls(**config)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(messages: List[Dict[str, str]], model: str, sampling: Optional[Dict] = None) -> str:
+        """
+        Hash a request. Message contents are NFC normalized and stripped of
+        surrounding whitespace, which does not change what the model sees in
+        any meaningful way.
+        """
+        normalized = [
+            (message["role"], unicodedata.normalize("NFC", message["content"]).strip())
+            for message in messages
+        ]
+        payload = json.dumps(
+            [normalized, model, sampling or {}], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+            self._remove(key)
+            self.stats["expired"] += 1
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def put(self, key: str, text: str) -> None:
+        if not text:
+            return
+        size = sys.getsizeof(text)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (text, time.monotonic())
+        self.total_bytes += size
+        self.stats["stores"] += 1
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats["evicted"] += 1
+
+    async def replay(self, text: str) -> AsyncIterator[str]:
+        """
+        Yield a cached reply in small deltas, like a very fast backend.
+
+        Parameters
+        ----------
+        text : str
+            The cached reply.
+
+        Returns
+        -------
+        AsyncIterator[str]
+            The deltas of the reply.
+        """
+        for start in range(0, len(text), self.replay_chunk):
+            yield text[start : start + self.replay_chunk]
+            # Let other chats run between the deltas of a long reply
+            await asyncio.sleep(0)
+
+    def _remove(self, key: str) -> None:
+        text, _ = self._entries.pop(key)
+        self.total_bytes -= sys.getsizeof(text)
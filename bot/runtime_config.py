@@ -0,0 +1,112 @@
+from typing import Dict, List, Optional, Tuple
+
+from .backends import parse_endpoints
+from .prompt_templates import PromptTemplate
+
+
+def split_users(users: Optional[List]) -> Tuple[frozenset, frozenset]:
+    """
+    Split a list of allowed users into user ids and lower-cased usernames,
+    Telegram usernames being case-insensitive.
+    """
+    users = users or []
+    ids = frozenset(user for user in users if isinstance(user, int))
+    names = frozenset(user.lstrip("@").lower() for user in users if isinstance(user, str))
+    return ids, names
+
+
+class RuntimeConfig:
+    """
+    A snapshot of the settings that can change while the bot runs, never
+    modified once built.
+
+    The message handler holds the current snapshot and every reply takes a
+    reference to it when it starts, so a reload swaps it atomically: replies
+    in flight finish with the settings they started with, new ones use the
+    new snapshot. ``version`` counts the applied reloads.
+    """
+
+    __slots__ = ("version", "uri", "model", "streaming", "template", "users", "endpoints")
+
+    # config.yml keys of the reloadable settings
+    KEYS = {
+        "uri": "uri",
+        "model": "model",
+        "streaming": "enable_message_streaming",
+        "template": "template",
+        "users": "allowed_telegram_usernames",
+    }
+
+    def __init__(
+        self,
+        uri,
+        model: str,
+        streaming: bool = True,
+        template: Optional[str] = None,
+        users: Optional[List] = None,
+        version: int = 1,
+    ):
+        self.version = version
+        self.uri = uri
+        self.model = model
+        self.streaming = streaming
+        self.template = template
+        self.users = tuple(users or ())
+        self.endpoints = parse_endpoints(uri) if uri else []
+
+    @classmethod
+    def from_config(
+        cls, config: Dict, instruction_templates: Dict, version: int = 1, raw_prompt: bool = False
+    ) -> "RuntimeConfig":
+        """
+        Validate the reloadable settings of a parsed config.yml. With
+        ``raw_prompt`` the template must have a ``prompt_template``, as raw
+        completion backends take the rendered prompt.
+
+        Raises
+        ------
+        ValueError
+            Listing every invalid setting, nothing is applied then.
+        """
+        errors = []
+        try:
+            parse_endpoints(config.get("uri"))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append(f"uri: {e}")
+        if not isinstance(config.get("model"), str):
+            errors.append("model: must be a string")
+        if not isinstance(config.get("enable_message_streaming"), bool):
+            errors.append("enable_message_streaming: must be true or false")
+        template = config.get("template")
+        if template not in instruction_templates:
+            errors.append(f"template: unknown template '{template}'")
+        elif raw_prompt:
+            try:
+                if not PromptTemplate(template, instruction_templates[template]).raw:
+                    errors.append(f"template: '{template}' has no prompt_template for the raw backend")
+            except ValueError as e:
+                errors.append(f"template: {e}")
+        users = config.get("allowed_telegram_usernames")
+        if not isinstance(users, list) or not all(
+            isinstance(user, (str, int)) and not isinstance(user, bool) for user in users
+        ):
+            errors.append("allowed_telegram_usernames: must be a list of usernames and ids")
+        if errors:
+            raise ValueError("Invalid config: " + "; ".join(errors))
+
+        return cls(
+            uri=config["uri"],
+            model=config["model"],
+            streaming=config["enable_message_streaming"],
+            template=config["template"],
+            users=users,
+            version=version,
+        )
+
+    def changes(self, other: "RuntimeConfig") -> List[str]:
+        """The config.yml keys whose value differs in ``other``."""
+        return [
+            key
+            for attribute, key in self.KEYS.items()
+            if getattr(self, attribute) != getattr(other, attribute)
+        ]
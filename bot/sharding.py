@@ -0,0 +1,424 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import struct
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, TypeHandler
+
+from .bot import Bot
+from .helpers.hash_ring import HashRing
+from .webhook import WebhookApp, check_webhook, serve as serve_webhook, webhook_path
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+_HEADER = struct.Struct(">I")
+
+
+async def write_frame(writer: asyncio.StreamWriter, message: Dict) -> None:
+    """Send one length-prefixed JSON message."""
+    data = json.dumps(message, ensure_ascii=False).encode()
+    writer.write(_HEADER.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict]:
+    """Receive one message, None when the other side closed the channel."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        return json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def _start_server(handler, address: Address) -> asyncio.AbstractServer:
+    if isinstance(address, str):
+        return await asyncio.start_unix_server(handler, path=address)
+    return await asyncio.start_server(handler, *address)
+
+
+async def _connect(address: Address):
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(*address)
+
+
+def shard_ring(workers: List[str]) -> HashRing:
+    ring = HashRing()
+    for worker in workers:
+        ring.add(worker)
+    return ring
+
+
+def worker_budget(bot_kwargs: Dict, workers: int) -> Dict:
+    """
+    The ``Bot`` arguments giving one of ``workers`` workers its share of the
+    bot-wide limits: Telegram's ``global_rate`` of edits and the
+    ``admission.max_concurrent`` generations of the backend, at least one.
+    """
+    limits = dict(bot_kwargs.get("edit_rate_limits") or {})
+    # 30 edits per second is the EditScheduler default
+    limits["global_rate"] = limits.get("global_rate", 30.0) / workers
+    budget = {"edit_rate_limits": limits}
+    admission = bot_kwargs.get("admission") or {}
+    if admission.get("max_concurrent"):
+        budget["admission"] = dict(
+            admission, max_concurrent=max(1, admission["max_concurrent"] // workers)
+        )
+    return budget
+
+
+def chat_of(update: Update) -> int:
+    """The chat an update belongs to, 0 for updates without a chat."""
+    return update.effective_chat.id if update.effective_chat else 0
+
+
+class ShardWorker:
+    """
+    A worker process: runs the bot for the chats of its shard and receives
+    their updates from the ingress instead of polling Telegram.
+
+    The ingress sends ``update`` messages, and ``rebalance`` and ``stop``
+    messages which are acknowledged once done. On ``rebalance`` the worker
+    writes the chats it no longer owns to the storage and forgets them, so
+    their new owner loads the complete history, and takes its new share of
+    the bot-wide limits.
+    """
+
+    def __init__(self, bot: Bot, name: str, address: Address, workers: List[str]):
+        self.bot = bot
+        self.name = name
+        self.address = address
+        self.ring = shard_ring(workers)
+        self._stopped = asyncio.Event()
+        self._tasks = set()
+
+    async def run(self) -> None:
+        app = self.bot.build_application()
+        async with app:
+            await app.post_init(app)
+            await app.start()
+            server = await _start_server(partial(self._handle, app), self.address)
+            logger.info("Shard %s is listening on %s", self.name, self.address)
+            try:
+                await self._stopped.wait()
+            finally:
+                server.close()
+                if self._tasks:
+                    await asyncio.gather(*self._tasks, return_exceptions=True)
+                await app.stop()
+        await app.post_shutdown(app)
+
+    async def _handle(
+        self, app: Application, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        while True:
+            message = await read_frame(reader)
+            if message is None:
+                break
+            kind = message["type"]
+            if kind == "update":
+                update = Update.de_json(message["update"], app.bot)
+                task = asyncio.create_task(app.process_update(update))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            elif kind == "rebalance":
+                await self.rebalance(message["workers"], message.get("budget"))
+                await write_frame(writer, {"type": "ack"})
+            elif kind == "stop":
+                self._stopped.set()
+                await write_frame(writer, {"type": "ack"})
+                break
+        writer.close()
+
+    async def rebalance(self, workers: List[str], budget: Optional[Dict] = None) -> None:
+        # Forwarding is paused, so this only waits for the replies in flight
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if budget is not None:
+            self.apply_budget(budget)
+        self.ring = shard_ring(workers)
+        memory = self.bot.message_handling.conversation_memory
+        released = [chat_id for chat_id in memory if self.ring.get(chat_id) != self.name]
+        await memory.release(released)
+        logger.info("Shard %s handed over %d chats", self.name, len(released))
+
+    def apply_budget(self, budget: Dict) -> None:
+        """Apply a ``worker_budget`` to the running bot."""
+        self.bot.edit_scheduler.global_interval = 1 / budget["edit_rate_limits"]["global_rate"]
+        scheduler = self.bot.message_handling.generation_scheduler
+        if scheduler is not None and "admission" in budget:
+            scheduler.resize(budget["admission"]["max_concurrent"])
+
+
+def run_worker(bot_kwargs: Dict, name: str, address: Address, workers: List[str]) -> None:
+    """Entry point of a worker process."""
+    asyncio.run(ShardWorker(Bot(**bot_kwargs), name, address, workers).run())
+
+
+class _WorkerHandle:
+    def __init__(self, name: str, address: Address):
+        self.name = name
+        self.address = address
+        self.process: Optional[multiprocessing.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive() and self.writer is not None
+
+    async def connect(self, timeout: float = 60.0) -> None:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                self.reader, self.writer = await _connect(self.address)
+                return
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline or not self.process.is_alive():
+                    raise
+                await asyncio.sleep(0.2)
+
+    async def request(self, message: Dict) -> None:
+        await write_frame(self.writer, message)
+        await read_frame(self.reader)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class Supervisor:
+    """
+    Runs the bot as one ingress and ``workers`` worker processes.
+
+    The ingress receives every update by polling or webhook and forwards it
+    over a local socket to the worker owning its chat on a consistent hash
+    ring. A chat is therefore always answered by the same process, which
+    keeps its conversation memory, while formatting and escaping run on
+    several cores.
+
+    ``resize`` changes the number of workers at runtime (on SIGHUP the
+    ``sharding.workers`` setting is reloaded). Forwarding pauses, workers
+    hand the chats they lose over through the conversation storage, and only
+    the chats whose owner changed move, so a persistent ``storage`` should
+    be configured.
+
+    Parameters
+    ----------
+    bot_kwargs : Dict
+        The ``Bot`` arguments, used by the ingress and every worker.
+    workers : int
+        The number of worker processes.
+    socket_dir : str
+        Directory of the workers' Unix sockets.
+    base_port : int
+        First localhost port of the workers where Unix sockets are not
+        available.
+    """
+
+    def __init__(
+        self,
+        bot_kwargs: Dict,
+        workers: int,
+        socket_dir: str = "data/sockets",
+        base_port: int = 7700,
+        reload_workers: Optional[Callable[[], int]] = None,
+    ):
+        self.bot_kwargs = bot_kwargs
+        self.worker_count = workers
+        self.socket_dir = Path(socket_dir)
+        self.base_port = base_port
+        self.reload_workers = reload_workers
+        self.workers: Dict[str, _WorkerHandle] = {}
+        self.ring = HashRing()
+        self._forwarding = asyncio.Lock()
+        self._stopped: Optional[asyncio.Event] = None
+        self._context = multiprocessing.get_context("spawn")
+        check_webhook(bot_kwargs.get("webhook") or {})
+        if not (bot_kwargs.get("storage") or {}).get("backend"):
+            logger.warning("Sharding without storage: chats moved by a rebalance lose their history")
+
+    def _webhook_app(self, app) -> WebhookApp:
+        webhook = self.bot_kwargs["webhook"]
+        # The ingress only forwards, so its limit is of little concern
+        return WebhookApp(
+            app,
+            path=webhook_path(webhook),
+            secret_token=webhook.get("secret_token"),
+            max_concurrent_updates=webhook.get("max_concurrent_updates", 256),
+        )
+
+    def _address(self, index: int) -> Address:
+        if hasattr(asyncio, "start_unix_server"):
+            return str(self.socket_dir / f"worker-{index}.sock")
+        return ("127.0.0.1", self.base_port + index)
+
+    def _worker_kwargs(self, index: int, workers: int) -> Dict:
+        kwargs = dict(self.bot_kwargs, webhook=None, **worker_budget(self.bot_kwargs, workers))
+        # Every worker sends its own digest, named after it
+        kwargs["error_reports"] = dict(
+            self.bot_kwargs.get("error_reports") or {}, source=f"worker-{index}"
+        )
+        metrics = kwargs.get("metrics") or {}
+        if metrics.get("port") is not None:
+            # The ingress keeps the configured port, workers use the next ones
+            kwargs["metrics"] = dict(metrics, port=metrics["port"] + index + 1)
+        return kwargs
+
+    async def _start_worker(self, index: int, workers: List[str]) -> _WorkerHandle:
+        name = f"worker-{index}"
+        handle = _WorkerHandle(name, self._address(index))
+        if isinstance(handle.address, str) and os.path.exists(handle.address):
+            os.unlink(handle.address)
+        handle.process = self._context.Process(
+            target=run_worker,
+            args=(self._worker_kwargs(index, len(workers)), name, handle.address, workers),
+            name=name,
+            daemon=False,
+        )
+        handle.process.start()
+        await handle.connect()
+        return handle
+
+    async def _stop_worker(self, handle: _WorkerHandle, timeout: float = 60.0) -> None:
+        if handle.writer is not None:
+            try:
+                await asyncio.wait_for(handle.request({"type": "stop"}), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning("%s did not stop cleanly: %s", handle.name, e)
+            handle.close()
+        await asyncio.get_running_loop().run_in_executor(None, handle.process.join, timeout)
+        if handle.process.is_alive():
+            handle.process.terminate()
+
+    async def resize(self, workers: int) -> None:
+        """Start or stop workers and move the chats whose owner changed."""
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+        names = [f"worker-{index}" for index in range(workers)]
+        async with self._forwarding:
+            # Current workers release the chats they lose before anyone else
+            # serves them, then removed workers drain and exit
+            for handle in list(self.workers.values()):
+                if handle.alive and handle.name in names:
+                    await handle.request(
+                        {
+                            "type": "rebalance",
+                            "workers": names,
+                            "budget": worker_budget(self.bot_kwargs, workers),
+                        }
+                    )
+            for name in [name for name in self.workers if name not in names]:
+                await self._stop_worker(self.workers.pop(name))
+            for index, name in enumerate(names):
+                if name not in self.workers:
+                    self.workers[name] = await self._start_worker(index, names)
+            self.ring = shard_ring(names)
+            self.worker_count = workers
+        logger.info("Running %d shard workers", workers)
+
+    async def _forward(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        message = {"type": "update", "update": update.to_dict()}
+        async with self._forwarding:
+            for name in self.ring.walk(chat_of(update)):
+                handle = self.workers[name]
+                if not handle.alive:
+                    continue
+                try:
+                    await write_frame(handle.writer, message)
+                    return
+                except OSError as e:
+                    logger.error("Forwarding to %s failed: %s", name, e)
+                    handle.close()
+            logger.error("No worker available for update %s", update.update_id)
+
+    async def _watch_workers(self) -> None:
+        """Restart workers that died; their chats go to the next worker meanwhile."""
+        while True:
+            await asyncio.sleep(1)
+            names = self.ring.nodes
+            for index, name in enumerate(names):
+                handle = self.workers.get(name)
+                if handle is not None and handle.process is not None and not handle.process.is_alive():
+                    logger.error("%s exited with code %s, restarting it", name, handle.process.exitcode)
+                    handle.close()
+                    async with self._forwarding:
+                        self.workers[name] = await self._start_worker(index, names)
+                        # The next worker served the chats meanwhile, make
+                        # it hand them back
+                        for other in self.workers.values():
+                            if other.alive and other.name != name:
+                                await other.request({"type": "rebalance", "workers": names})
+
+    def _build_ingress(self) -> Application:
+        builder = ApplicationBuilder().token(self.bot_kwargs["token"])
+        if self.bot_kwargs.get("telegram_api_url"):
+            builder = builder.base_url(self.bot_kwargs["telegram_api_url"])
+        # Updates are forwarded one by one so each chat keeps its order
+        app = builder.concurrent_updates(False).build()
+        app.add_handler(TypeHandler(Update, self._forward))
+        return app
+
+    def _on_sighup(self) -> None:
+        if self.reload_workers is None:
+            return
+        try:
+            workers = self.reload_workers()
+        except Exception as e:
+            logger.error("Reloading the worker count failed: %s", e)
+            return
+        if workers != self.worker_count:
+            asyncio.create_task(self.resize(workers))
+
+    async def run(self) -> None:
+        self.socket_dir.mkdir(parents=True, exist_ok=True)
+        self._stopped = asyncio.Event()
+        await self.resize(self.worker_count)
+        watcher = asyncio.create_task(self._watch_workers())
+
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, self._on_sighup)
+        webhook = self.bot_kwargs.get("webhook") or {}
+        app = self._build_ingress()
+        try:
+            async with app:
+                await app.start()
+                if webhook.get("url"):
+                    await app.bot.set_webhook(
+                        webhook["url"],
+                        secret_token=webhook.get("secret_token") or None,
+                        max_connections=webhook.get("max_connections", 40),
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                    await serve_webhook(
+                        self._webhook_app(app),
+                        host=webhook.get("listen", "0.0.0.0"),
+                        port=webhook.get("port", 8443),
+                        cert=webhook.get("cert"),
+                        key=webhook.get("key"),
+                    )
+                else:
+                    for sig in (signal.SIGINT, signal.SIGTERM):
+                        loop.add_signal_handler(sig, self._stopped.set)
+                    await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                    logger.info("Ingress is polling...")
+                    await self._stopped.wait()
+                    await app.updater.stop()
+                await app.stop()
+        finally:
+            watcher.cancel()
+            for handle in list(self.workers.values()):
+                await self._stop_worker(handle)
+            self.workers.clear()
+
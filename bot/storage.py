@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStorage:
+    """
+    Interface of the persistent tier behind the conversation memory.
+
+    Methods are blocking and are only called from the storage thread, never
+    from the event loop.
+    """
+
+    def load(self, chat_id: int) -> Optional[Dict]:
+        """Returns the saved chat (``messages`` and ``metadata``) or None."""
+        raise NotImplementedError
+
+    def save_many(self, entries: Dict[int, Optional[Dict]]) -> None:
+        """Writes chats in one transaction, a None entry deletes the chat."""
+        raise NotImplementedError
+
+    def delete_older_than(self, timestamp: float) -> int:
+        """Deletes chats not updated since ``timestamp`` (unix time)."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStorage(ConversationStorage):
+    """Stores each chat as one row of JSON in an SQLite database in WAL mode."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Only the single storage thread uses the connection
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                chat_id INTEGER PRIMARY KEY,
+                messages TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def load(self, chat_id: int) -> Optional[Dict]:
+        row = self.connection.execute(
+            "SELECT messages, metadata, updated_at FROM conversations WHERE chat_id = ?",
+            (chat_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "messages": json.loads(row[0]),
+            "metadata": json.loads(row[1]),
+            "updated_at": row[2],
+        }
+
+    def save_many(self, entries: Dict[int, Optional[Dict]]) -> None:
+        now = time.time()
+        upserts = [
+            (
+                chat_id,
+                # History turns serialize as the message dicts they stand for
+                json.dumps(entry["messages"], ensure_ascii=False, default=dict),
+                json.dumps(entry["metadata"], ensure_ascii=False),
+                now,
+            )
+            for chat_id, entry in entries.items()
+            if entry is not None
+        ]
+        deletes = [(chat_id,) for chat_id, entry in entries.items() if entry is None]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)", upserts
+            )
+            self.connection.executemany(
+                "DELETE FROM conversations WHERE chat_id = ?", deletes
+            )
+
+    def delete_older_than(self, timestamp: float) -> int:
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM conversations WHERE updated_at < ?", (timestamp,)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class WriteBehindStorage:
+    """
+    Runs a ``ConversationStorage`` on a dedicated thread and batches writes.
+
+    ``save`` and ``delete`` only mark a chat as dirty, so the streaming hot
+    path never waits for the disk. A background task writes all dirty chats
+    in one transaction every ``flush_interval`` seconds; a chat changed many
+    times between flushes is written once.
+    """
+
+    def __init__(self, storage: ConversationStorage, flush_interval: float = 1.0):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self._dirty: Dict[int, Optional[Dict]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._flusher: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"flushes": 0, "chats_written": 0}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["WriteBehindStorage"]:
+        """
+        Build the storage from the optional ``storage`` block of config.yml,
+        None keeps conversations in memory only.
+        """
+        config = config or {}
+        backend = config.get("backend")
+        if not backend:
+            return None
+        if backend != "sqlite":
+            raise ValueError(f"Unknown storage backend '{backend}'")
+        return cls(
+            SQLiteStorage(config.get("path", "data/conversations.db")),
+            flush_interval=config.get("flush_interval", 1.0),
+        )
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def load(self, chat_id: int) -> Optional[Dict]:
+        if chat_id in self._dirty:
+            # Not written yet, the pending state is the newest
+            return self._dirty[chat_id]
+        return await self._run(self.storage.load, chat_id)
+
+    def save(self, chat_id: int, entry: Dict) -> None:
+        self._dirty[chat_id] = entry
+
+    def delete(self, chat_id: int) -> None:
+        self._dirty[chat_id] = None
+
+    async def delete_older_than(self, timestamp: float) -> int:
+        return await self._run(self.storage.delete_older_than, timestamp)
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        # Shallow copies taken on the loop, so the chats may keep changing
+        # while the storage thread serializes them
+        snapshot = {
+            chat_id: None
+            if entry is None
+            else {"messages": list(entry["messages"]), "metadata": dict(entry["metadata"])}
+            for chat_id, entry in batch.items()
+        }
+        try:
+            await self._run(self.storage.save_many, snapshot)
+        except Exception as e:
+            logger.error("Saving %d conversations failed: %s", len(batch), e)
+            # Keep newer changes, retry the rest on the next flush
+            self._dirty = {**batch, **self._dirty}
+            return
+        self.stats["flushes"] += 1
+        self.stats["chats_written"] += len(batch)
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """Write everything that is still dirty and close the storage."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        await self._run(self.storage.close)
+        self._executor.shutdown(wait=True)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
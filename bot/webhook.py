@@ -0,0 +1,197 @@
+import asyncio
+import hmac
+import json
+import logging
+from typing import Dict, Optional, Set
+from urllib.parse import urlparse
+
+from telegram import Update
+from telegram.ext import Application
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPDATES = REGISTRY.counter("webhook_updates", "Updates accepted from the webhook")
+REJECTED = REGISTRY.counter("webhook_rejected", "Updates refused because the bot was saturated")
+IN_FLIGHT = REGISTRY.gauge("webhook_in_flight", "Webhook updates being processed")
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+MAX_BODY = 1024 * 1024
+
+
+def webhook_path(webhook: Dict) -> str:
+    """
+    The path Telegram posts to: ``webhook.path``, or the path of the public
+    ``webhook.url`` without its query, ``/`` for a bare host.
+    """
+    return webhook.get("path") or urlparse(webhook["url"]).path or "/"
+
+
+def check_webhook(webhook: Dict) -> None:
+    """
+    Refuse a public webhook without a ``secret_token``: anyone who finds its
+    url could post forged updates, including ones from allowed users.
+
+    Raises
+    ------
+    ValueError
+        If ``webhook.url`` is set without a ``secret_token``.
+    """
+    if webhook.get("url") and not webhook.get("secret_token"):
+        raise ValueError("webhook.secret_token is required when webhook.url is set")
+
+
+class WebhookApp:
+    """
+    ASGI application receiving Telegram updates on ``POST {path}``.
+
+    Each accepted update is answered right away and processed in its own
+    task, so slow replies do not hold Telegram's connections. At most
+    ``max_concurrent_updates`` updates are processed at once; beyond that the
+    webhook answers 503 with ``Retry-After`` and Telegram delivers the update
+    again later, so a burst waits in Telegram's queue instead of growing one
+    in the bot's memory.
+
+    Parameters
+    ----------
+    application : Application
+        The initialized python-telegram-bot application.
+    path : str
+        The URL path Telegram posts to.
+    secret_token : Optional[str]
+        Compared with the ``X-Telegram-Bot-Api-Secret-Token`` header.
+    max_concurrent_updates : int
+        Updates processed at the same time.
+    retry_after : int
+        Seconds suggested to Telegram when the bot is saturated.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        path: str = "/telegram",
+        secret_token: Optional[str] = None,
+        max_concurrent_updates: int = 256,
+        retry_after: int = 1,
+    ):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token.encode() if secret_token else None
+        self.max_concurrent_updates = max_concurrent_updates
+        self.retry_after = retry_after
+        self._tasks: Set[asyncio.Task] = set()
+        IN_FLIGHT.set_function(lambda: len(self._tasks))
+
+    async def __call__(self, scope: Dict, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/healthz":
+            await self._respond(send, 200, b"ok")
+            return
+        if scope["path"] != self.path:
+            await self._respond(send, 404, b"not found")
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, b"method not allowed")
+            return
+
+        headers = dict(scope["headers"])
+        if self.secret_token is not None and not hmac.compare_digest(
+            headers.get(SECRET_HEADER, b""), self.secret_token
+        ):
+            logger.warning("Rejected a webhook request with a wrong secret token")
+            await self._respond(send, 403, b"forbidden")
+            return
+
+        if len(self._tasks) >= self.max_concurrent_updates:
+            REJECTED.inc()
+            await self._respond(
+                send, 503, b"busy", [(b"retry-after", str(self.retry_after).encode())]
+            )
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, b"too large")
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning("Invalid webhook update: %s", e)
+            await self._respond(send, 400, b"bad request")
+            return
+
+        UPDATES.inc()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        await self._respond(send, 200, b"ok")
+
+    async def _process(self, update: Update) -> None:
+        try:
+            # Handler errors go to the application's error handlers
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error("Processing update %s failed: %s", update.update_id, e)
+
+    async def drain(self) -> None:
+        """Wait until the updates being processed are finished."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY:
+                return None
+            if not message.get("more_body"):
+                return bytes(body)
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, headers=None) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"text/plain"),
+                    (b"content-length", str(len(body)).encode()),
+                    *(headers or []),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+async def serve(
+    app: WebhookApp,
+    host: str = "0.0.0.0",
+    port: int = 8443,
+    cert: Optional[str] = None,
+    key: Optional[str] = None,
+) -> None:
+    """
+    Serve the webhook with uvicorn until the process is interrupted.
+
+    uvicorn is an optional dependency, only needed in webhook mode.
+    """
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise RuntimeError("Webhook mode needs uvicorn: pip install uvicorn") from e
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        ssl_certfile=cert,
+        ssl_keyfile=key,
+        lifespan="off",
+        access_log=False,
+        log_config=None,
+    )
+    await uvicorn.Server(config).serve()
@@ -9,22 +9,44 @@ from bot.config import (
     USERS,
     STREAMING,
     MODEL,
+    BACKEND_POOL,
+    ROUTING,
+    EDIT_RATE_LIMITS,
+    NEW_DIALOG_TIMEOUT,
+    CONVERSATION_LIMITS,
+    CONTEXT,
+    STORAGE,
+    CONCURRENT_MESSAGES,
+    PREFIX_CACHE,
+    METRICS,
+    TELEGRAM_API_URL,
+    WEBHOOK,
+    SHARDING,
+    SAMPLING,
+    RAW_BACKEND,
+    RESPONSE_CACHE,
+    ADMISSION,
+    ERROR_REPORTS,
     instruction_templates,
+    chat_modes,
+    config_dir,
+    reload_config,
 )
-from bot.config_watcher import ConfigWatcher
+import asyncio
+import atexit
 import logging
 
-from bot.logging_watcher import LoggingWatcher
+from bot.logging_watcher import LoggingWatcher, stop_logging
 
 # Initialize logging system
-logging_watcher = LoggingWatcher()
-logging_watcher.start()
+LoggingWatcher().reload_config()
+atexit.register(stop_logging)
 logger = logging.getLogger(__name__)
 
 
 # Run the program
 if __name__ == "__main__":
-    chatbot = Bot(
+    bot_kwargs = dict(
         token=TOKEN,
         backend=BACKEND,
         template=TEMPLATE,
@@ -36,9 +58,38 @@ if __name__ == "__main__":
         instruction_templates=instruction_templates,
         max_new_tokens=1024,
         streaming=STREAMING,
+        backend_pool=BACKEND_POOL,
+        routing=ROUTING,
+        edit_rate_limits=EDIT_RATE_LIMITS,
+        new_dialog_timeout=NEW_DIALOG_TIMEOUT,
+        conversation_limits=CONVERSATION_LIMITS,
+        context=CONTEXT,
+        storage=STORAGE,
+        concurrent_messages=CONCURRENT_MESSAGES,
+        prefix_cache=PREFIX_CACHE,
+        metrics=METRICS,
+        telegram_api_url=TELEGRAM_API_URL,
+        webhook=WEBHOOK,
+        sampling=SAMPLING,
+        raw_backend=RAW_BACKEND,
+        response_cache=RESPONSE_CACHE,
+        admission=ADMISSION,
+        error_reports=ERROR_REPORTS,
+        chat_modes=chat_modes,
+        config_dir=str(config_dir),
     )
 
-    config_watcher = ConfigWatcher(chatbot)
-    config_watcher.start()
+    if SHARDING.get("workers", 0) > 1:
+        from bot.sharding import Supervisor
 
-    chatbot.run()
+        supervisor = Supervisor(
+            bot_kwargs,
+            workers=SHARDING["workers"],
+            socket_dir=SHARDING.get("socket_dir", "data/sockets"),
+            base_port=SHARDING.get("base_port", 7700),
+            reload_workers=lambda: (reload_config().get("sharding") or {}).get("workers", 1),
+        )
+        asyncio.run(supervisor.run())
+    else:
+        chatbot = Bot(**bot_kwargs)
+        chatbot.run()
@@ -0,0 +1,47 @@
+from unittest import IsolatedAsyncioTestCase
+
+from benchmarks.mock_llm_server import MockLLMServer
+from bot.backends import OpenAIBackend, PoolSettings, create_http_client
+
+
+class OpenAIBackendTest(IsolatedAsyncioTestCase):
+    """Test the pooled async backend against the local mock server."""
+
+    async def asyncSetUp(self):
+        self.server = await MockLLMServer(tokens=5, token_delay=0).start()
+        self.http_client = create_http_client(PoolSettings(http2=False))
+        self.backend = OpenAIBackend(self.server.uri, self.http_client)
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+        await self.server.stop()
+
+    async def test_stream_chat(self):
+        """Streamed deltas are yielded as plain strings."""
+        chunks = [
+            chunk
+            async for chunk in self.backend.stream_chat(
+                [{"role": "user", "content": "hi"}], model="mock"
+            )
+        ]
+        self.assertEqual(chunks, ["tok "] * 5)
+
+    async def test_non_streaming(self):
+        """A non-streamed reply is yielded as a single chunk."""
+        chunks = [
+            chunk
+            async for chunk in self.backend.stream_chat(
+                [{"role": "user", "content": "hi"}], model="mock", stream=False
+            )
+        ]
+        self.assertEqual(chunks, ["tok tok tok tok tok"])
+
+    async def test_connections_are_reused(self):
+        """Sequential streams share one keep-alive connection."""
+        for _ in range(3):
+            async for _ in self.backend.stream_chat(
+                [{"role": "user", "content": "hi"}], model="mock"
+            ):
+                pass
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.connections, 1)
@@ -0,0 +1,65 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from bot.chat_coordinator import ChatCoordinator
+
+
+class ChatCoordinatorTest(IsolatedAsyncioTestCase):
+    """Test serialization and cancellation of turns within a chat."""
+
+    async def test_turns_of_a_chat_are_serialized(self):
+        """A second message waits, another chat does not."""
+        coordinator = ChatCoordinator("serialize")
+        events = []
+
+        async def reply(chat_id, name):
+            async with coordinator.turn(chat_id):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.02)
+                events.append(f"{name} end")
+
+        await asyncio.gather(reply(1, "a"), reply(1, "b"), reply(2, "c"))
+
+        self.assertLess(events.index("a end"), events.index("b start"))
+        self.assertLess(events.index("c start"), events.index("a end"))
+        self.assertEqual(coordinator.stats["queued"], 1)
+        self.assertEqual(coordinator._locks, {})
+
+    async def test_new_message_cancels_reply(self):
+        """In cancel mode the running generation is cancelled and superseded."""
+        coordinator = ChatCoordinator("cancel")
+        outcome = {}
+
+        async def reply(name, duration):
+            async with coordinator.turn(1) as turn:
+                try:
+                    turn.allow_cancel()
+                    await asyncio.sleep(duration)
+                    outcome[name] = "done"
+                except asyncio.CancelledError:
+                    asyncio.current_task().uncancel()
+                    outcome[name] = "cancelled" if turn.superseded else "error"
+                finally:
+                    turn.forbid_cancel()
+
+        first = asyncio.create_task(reply("a", 10))
+        await asyncio.sleep(0.01)
+        await reply("b", 0)
+        await first
+
+        self.assertEqual(outcome, {"a": "cancelled", "b": "done"})
+        self.assertEqual(coordinator.stats["cancelled"], 1)
+
+    async def test_waiting_turn_is_superseded(self):
+        """Newer messages mark older ones, waiting or not cancellable, as superseded."""
+        coordinator = ChatCoordinator("cancel")
+        superseded = {}
+
+        async def reply(name):
+            async with coordinator.turn(1) as turn:
+                await asyncio.sleep(0.01)
+                superseded[name] = turn.superseded
+
+        await asyncio.gather(reply("a"), reply("b"), reply("c"))
+
+        self.assertEqual(superseded, {"a": True, "b": True, "c": False})
@@ -0,0 +1,103 @@
+from unittest import IsolatedAsyncioTestCase
+
+from bot.context_manager import (
+    ContextManager,
+    LastTurnsPolicy,
+    PrefixCachePolicy,
+    SlidingWindowPolicy,
+    SummaryPolicy,
+    TokenCounter,
+)
+
+
+def estimate_counter() -> TokenCounter:
+    # Four characters per token, independent of installed tokenizers
+    counter = TokenCounter()
+    counter._encode = None
+    return counter
+
+
+def make_entry(turns: int) -> dict:
+    messages = [{"role": "system", "content": "be brief"}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " + "x" * 36})
+        messages.append({"role": "assistant", "content": f"answer {turn} " + "y" * 36})
+    return {"messages": messages, "metadata": {}}
+
+
+class ContextManagerTest(IsolatedAsyncioTestCase):
+    """Test that long chats are trimmed to the token budget."""
+
+    async def test_short_chat_is_not_copied(self):
+        """A chat within budget is sent as is."""
+        entry = make_entry(2)
+        manager = ContextManager(SlidingWindowPolicy(), estimate_counter(), 1000, 100)
+        self.assertIs(await manager.build(entry, "model"), entry["messages"])
+
+    async def test_sliding_window(self):
+        """The system prompt and the latest messages are kept."""
+        entry = make_entry(20)
+        entry["messages"].append({"role": "user", "content": "latest"})
+        manager = ContextManager(SlidingWindowPolicy(), estimate_counter(), 200, 50)
+        messages = await manager.build(entry, "model")
+
+        self.assertEqual(messages[0]["content"], "be brief")
+        self.assertEqual(messages[1]["role"], "user")
+        self.assertEqual(messages[-1]["content"], "latest")
+        self.assertLessEqual(manager.counter.count_messages(messages), 150)
+        self.assertEqual(len(entry["messages"]), 42)
+
+    async def test_model_limits(self):
+        """A per-model window overrides the default one."""
+        manager = ContextManager(
+            SlidingWindowPolicy(), estimate_counter(), 200, 50, {"big": 100000}
+        )
+        entry = make_entry(20)
+        self.assertIs(await manager.build(entry, "big"), entry["messages"])
+
+    async def test_last_turns(self):
+        """Only the last N exchanges are kept."""
+        entry = make_entry(10)
+        manager = ContextManager(LastTurnsPolicy(2), estimate_counter(), 200, 0)
+        messages = await manager.build(entry, "model")
+
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "user", "assistant"])
+        self.assertTrue(messages[1]["content"].startswith("question 8"))
+
+    async def test_summary(self):
+        """Old turns are folded into a summary that is kept for later turns."""
+        calls = []
+
+        async def summarize(messages):
+            calls.append(messages)
+            return "they talked"
+
+        entry = make_entry(20)
+        manager = ContextManager(SummaryPolicy(summarize), estimate_counter(), 300, 50)
+        messages = await manager.build(entry, "model")
+
+        self.assertTrue(calls)
+        self.assertIn("they talked", messages[0]["content"])
+        self.assertEqual(messages[-1], entry["messages"][-1])
+        self.assertEqual(entry["metadata"]["summary"], "they talked")
+        self.assertGreater(entry["metadata"]["summarized"], 0)
+
+    async def test_prefix_cache_window_moves_in_chunks(self):
+        """The prompt prefix stays identical until a whole chunk is dropped."""
+        manager = ContextManager(PrefixCachePolicy(0.5), estimate_counter(), 400, 0)
+        entry = make_entry(0)
+        prompts = []
+        for turn in range(30):
+            entry["messages"].append({"role": "user", "content": f"question {turn} " + "x" * 36})
+            prompts.append(list(await manager.build(entry, "model")))
+            entry["messages"].append({"role": "assistant", "content": "y" * 40})
+
+        # Count how often the window start changed, a sliding window moves every turn
+        starts = [prompt[1]["content"] for prompt in prompts]
+        moves = sum(1 for a, b in zip(starts, starts[1:]) if a != b)
+        self.assertGreater(moves, 0)
+        self.assertLess(moves, 10)
+        for prompt in prompts:
+            self.assertEqual(prompt[0]["content"], "be brief")
+            self.assertEqual(prompt[1]["role"], "user")
+            self.assertLessEqual(manager.counter.count_messages(prompt), 400)
@@ -0,0 +1,59 @@
+import time
+from unittest import TestCase
+
+from bot.conversation_store import ConversationStore
+
+
+def make_entry(*contents: str) -> dict:
+    return {
+        "messages": [{"role": "user", "content": content} for content in contents],
+        "metadata": {},
+    }
+
+
+class ConversationStoreTest(TestCase):
+    """Test the eviction rules of the bounded conversation memory."""
+
+    def test_least_recently_used_chat_is_evicted(self):
+        """Reading a chat protects it from eviction."""
+        store = ConversationStore(max_chats=2, ttl=None)
+        store[1] = make_entry("a")
+        store[2] = make_entry("b")
+        store[1]
+        store[3] = make_entry("c")
+
+        self.assertEqual(sorted(store), [1, 3])
+        self.assertEqual(store.stats["evicted"], 1)
+
+    def test_byte_budget(self):
+        """Growing one chat evicts others, but never the chat itself."""
+        store = ConversationStore(max_bytes=1000, ttl=None)
+        store[1] = make_entry("x" * 100)
+        store[2] = make_entry("y" * 100)
+        store[2]["messages"].append({"role": "user", "content": "z" * 2000})
+        store.resize(2)
+
+        self.assertEqual(list(store), [2])
+        self.assertEqual(store.total_bytes, ConversationStore._entry_size(store[2]))
+
+    def test_idle_chats_expire(self):
+        """Idle chats are missing on lookup and removed by the sweep."""
+        store = ConversationStore(ttl=0.01)
+        store[1] = make_entry("a")
+        store[2] = make_entry("b")
+        time.sleep(0.02)
+        store[3] = make_entry("c")
+
+        self.assertNotIn(1, store)
+        self.assertEqual(store.expire(), 2)
+        self.assertEqual(list(store), [3])
+        self.assertEqual(store.total_bytes, ConversationStore._entry_size(store[3]))
+
+    def test_wipe(self):
+        """Deleting a chat releases its bytes."""
+        store = ConversationStore(ttl=None)
+        store[1] = make_entry("a")
+        del store[1]
+
+        self.assertNotIn(1, store)
+        self.assertEqual(store.total_bytes, 0)
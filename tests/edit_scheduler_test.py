@@ -0,0 +1,71 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from telegram.error import RetryAfter
+
+from bot.edit_scheduler import EditScheduler
+
+
+class FakeBot:
+    """Records edits instead of calling Telegram."""
+
+    def __init__(self, flood_errors: int = 0):
+        self.edits = []
+        self.flood_errors = flood_errors
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode):
+        if self.flood_errors:
+            self.flood_errors -= 1
+            raise RetryAfter(0)
+        self.edits.append((chat_id, message_id, text))
+        return text
+
+
+class EditSchedulerTest(IsolatedAsyncioTestCase):
+    """Test coalescing, skipping and flood control handling of edits."""
+
+    async def test_edits_are_coalesced(self):
+        """Edits queued while the chat is throttled collapse into the newest."""
+        bot = FakeBot()
+        scheduler = EditScheduler(bot, chat_interval=0.05)
+        scheduler.submit(1, 10, "a")
+        await asyncio.sleep(0.01)
+        for text in ("ab", "abc", "abcd"):
+            scheduler.submit(1, 10, text)
+        await scheduler.flush(1, 10, "abcde")
+        await scheduler.stop()
+
+        self.assertEqual(bot.edits, [(1, 10, "a"), (1, 10, "abcde")])
+        self.assertEqual(scheduler.stats["edits_sent"], 2)
+        self.assertEqual(scheduler.stats["edits_coalesced"], 3)
+
+    async def test_unchanged_text_is_skipped(self):
+        """Submitting the text that was already sent does not edit again."""
+        bot = FakeBot()
+        scheduler = EditScheduler(bot, chat_interval=0)
+        scheduler.submit(1, 10, "same")
+        await asyncio.sleep(0.01)
+        self.assertIsNone(await scheduler.flush(1, 10, "same"))
+        await scheduler.stop()
+
+        self.assertEqual(len(bot.edits), 1)
+        self.assertEqual(scheduler.stats["edits_skipped"], 1)
+
+    async def test_retry_after(self):
+        """A flood control error is retried instead of being raised."""
+        bot = FakeBot(flood_errors=1)
+        scheduler = EditScheduler(bot, chat_interval=0)
+        self.assertEqual(await scheduler.flush(1, 10, "text"), "text")
+        await scheduler.stop()
+
+        self.assertEqual(scheduler.stats["retry_after"], 1)
+        self.assertEqual(bot.edits, [(1, 10, "text")])
+
+    async def test_chats_do_not_wait_for_each_other(self):
+        """The per-chat interval does not delay other chats."""
+        bot = FakeBot()
+        scheduler = EditScheduler(bot, chat_interval=10)
+        await asyncio.gather(*(scheduler.flush(chat_id, 1, "hi") for chat_id in range(5)))
+        await scheduler.stop()
+
+        self.assertEqual(len(bot.edits), 5)
@@ -0,0 +1,71 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from bot.error_reporter import MAX_MESSAGE_LENGTH, ErrorReporter, fingerprint
+
+
+def raise_timeout(url: str):
+    raise TimeoutError(f"Timed out: {url}")
+
+
+def raise_value():
+    raise ValueError("Bad value " + "&<" * 2000)
+
+
+def caught(func, *args) -> BaseException:
+    try:
+        func(*args)
+    except Exception as e:
+        return e
+
+
+class ErrorReporterTest(IsolatedAsyncioTestCase):
+    """Test grouping errors into rate-limited digests."""
+
+    async def asyncSetUp(self):
+        self.sent = []
+
+        async def send(text: str):
+            self.sent.append(text)
+
+        self.reporter = ErrorReporter(send, window=0.05, max_groups=2)
+
+    async def asyncTearDown(self):
+        await self.reporter.stop()
+
+    async def test_errors_are_grouped_in_one_digest(self):
+        """Errors from the same place count as one, whatever their message."""
+        first, second = caught(raise_timeout, "http://a"), caught(raise_timeout, "http://b")
+        self.assertEqual(fingerprint(first), fingerprint(second))
+
+        self.reporter.start()
+        for chat_id in range(50):
+            self.reporter.report(caught(raise_timeout, f"http://{chat_id}"), f"chat {chat_id}")
+        self.reporter.report(caught(raise_value), "chat 1")
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(len(self.sent), 1)
+        digest = self.sent[0]
+        self.assertIn("51 errors", digest)
+        self.assertIn("<b>50×</b> <code>TimeoutError: Timed out: http://0</code>", digest)
+        self.assertLess(digest.index("TimeoutError"), digest.index("ValueError"))
+        self.assertEqual(self.reporter.stats, {"reported": 51, "digests": 1})
+
+    async def test_digest_fits_in_a_message(self):
+        """Long tracebacks are left out and untracked kinds are only counted."""
+        self.reporter.report(caught(raise_value))
+        self.reporter.report(caught(raise_timeout, "x" * 5000))
+        self.reporter.report(caught(lambda: {}["missing"]))
+        digest = self.reporter.digest()
+
+        self.assertLessEqual(len(digest), MAX_MESSAGE_LENGTH)
+        self.assertIn("1 errors of other kinds", digest)
+        self.assertIsNone(self.reporter.digest())
+
+    def test_disabled(self):
+        self.assertIsNone(ErrorReporter.from_config({"enabled": False}, print))
+
+    def test_source_names_the_worker(self):
+        reporter = ErrorReporter.from_config({"source": "worker-1"}, print)
+        reporter.report(caught(raise_value))
+        self.assertIn("1 errors in worker-1 in the last 60s", reporter.digest())
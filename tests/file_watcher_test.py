@@ -0,0 +1,66 @@
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+from bot.file_watcher import FileWatcher
+
+
+class FileWatcherTest(IsolatedAsyncioTestCase):
+    """Test change detection and debouncing of the file watcher."""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "config.yml"
+        self.path.write_text("a: 1\n")
+        self.reloads = []
+        self.watcher = FileWatcher(self.directory.name, interval=0.01, debounce=0.05)
+
+    async def asyncTearDown(self):
+        await self.watcher.stop()
+        self.directory.cleanup()
+
+    def write(self, text: str, mtime_ns: int):
+        self.path.write_text(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    async def test_changes_are_debounced(self):
+        """A burst of writes reloads once, after the file settled."""
+        self.watcher.register("config.yml", lambda: self.reloads.append(self.path.read_text()))
+        for i in range(3):
+            self.write(f"a: {i + 2}\n", 10**18 + i)
+            await self.watcher.poll()
+        self.assertEqual(self.reloads, [])
+
+        await asyncio.sleep(0.06)
+        await self.watcher.poll()
+        await self.watcher.poll()
+        self.assertEqual(self.reloads, ["a: 4\n"])
+
+    async def test_async_and_failing_callbacks(self):
+        """Coroutine callbacks are awaited, a failing one does not stop the watcher."""
+
+        async def reload():
+            self.reloads.append("async")
+
+        def fail():
+            raise ValueError("broken")
+
+        (Path(self.directory.name) / "other.yml").write_text("")
+        self.watcher.register("other.yml", fail)
+        self.watcher.register("config.yml", reload)
+        self.watcher.start()
+
+        os.utime(Path(self.directory.name) / "other.yml", ns=(10**18, 10**18))
+        self.write("a: 2\n", 10**18)
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.reloads, ["async"])
+
+    async def test_deleted_file_is_not_reloaded(self):
+        self.watcher.register("config.yml", lambda: self.reloads.append("reload"))
+        self.path.unlink()
+        await self.watcher.poll()
+        await asyncio.sleep(0.06)
+        await self.watcher.poll()
+        self.assertEqual(self.reloads, [])
@@ -0,0 +1,98 @@
+from unittest import TestCase
+
+from bot.helpers.formatting_helper import StreamingFormatter, StreamingPager, TextFormatter
+
+REPLY = (
+    "Use `open()` to read files (see the *docs*):\n\n"
+    "```python\n"
+    "with open('a.txt') as f:\n"
+    "    print(f.read().replace('\\\\', '/'))  # `quoted`\n"
+    "```\n"
+    "Done! Inline ``double`` and ````four```` backticks.\n"
+)
+
+
+class StreamingFormatterTest(TestCase):
+    """Test that incremental rendering matches TextFormatter.render."""
+
+    def assert_matches_legacy(self, text: str, delta_size: int):
+        formatter = StreamingFormatter()
+        for start in range(0, len(text), delta_size):
+            formatter.feed(text[start : start + delta_size])
+            prefix = text[: start + delta_size]
+            self.assertEqual(formatter.render(), TextFormatter.render(prefix))
+            self.assertEqual(
+                formatter.in_code_block, TextFormatter.has_open_code_block(prefix)
+            )
+            self.assertEqual(
+                formatter.in_inline_code, TextFormatter.has_open_inline_code(prefix)
+            )
+        self.assertEqual(formatter.text, text)
+
+    def test_every_prefix(self):
+        """Every delta size renders each prefix like the legacy formatter."""
+        for delta_size in (1, 2, 3, 5, 16, len(REPLY)):
+            with self.subTest(delta_size=delta_size):
+                self.assert_matches_legacy(REPLY, delta_size)
+
+    def test_fence_split_across_deltas(self):
+        """A code fence arriving one backtick at a time still opens a block."""
+        formatter = StreamingFormatter()
+        for delta in ("a", "`", "`", "`", "x"):
+            formatter.feed(delta)
+        self.assertTrue(formatter.in_code_block)
+        self.assertEqual(formatter.render(), "a```x```")
+
+    def test_empty(self):
+        """Nothing fed renders as an empty string."""
+        self.assertEqual(StreamingFormatter().render(), "")
+
+
+LONG_REPLY = (
+    "An introduction to the code below. " * 20
+    + "\n\n```python\n"
+    + "".join(f"value_{i} = compute(a, b)  # step {i}\n" for i in range(200))
+    + "```\n"
+    + "Closing words. " * 100
+)
+
+
+class StreamingPagerTest(TestCase):
+    """Test that long replies are split into valid Telegram messages."""
+
+    def paginate(self, text: str, delta_size: int, limit: int = 1000):
+        pager = StreamingPager(limit=limit)
+        pages = []
+        for start in range(0, len(text), delta_size):
+            pager.feed(text[start : start + delta_size])
+            pages += pager.take_full_pages()
+        self.assertEqual(pager.text, text)
+        return pages + [pager.render()]
+
+    def test_pages_fit_and_do_not_depend_on_deltas(self):
+        """Every page fits the limit, whatever the size of the deltas."""
+        expected = self.paginate(LONG_REPLY, len(LONG_REPLY))
+        self.assertGreater(len(expected), 3)
+        for delta_size in (1, 7, 64):
+            with self.subTest(delta_size=delta_size):
+                pages = self.paginate(LONG_REPLY, delta_size)
+                self.assertEqual(pages, expected)
+                self.assertTrue(all(len(page) <= 1000 for page in pages))
+
+    def test_code_block_continues_on_next_page(self):
+        """A code block cut by a page break is closed and reopened with its language."""
+        pages = self.paginate(LONG_REPLY, 16)
+        for page in pages:
+            self.assertEqual(page.count("```") % 2, 0)
+        self.assertTrue(pages[2].startswith("```python\n"))
+        # Pages are cut after a whole line
+        self.assertTrue(pages[1].endswith("\n```"))
+
+    def test_short_reply_is_one_page(self):
+        """A reply under the limit is never split."""
+        self.assertEqual(self.paginate(REPLY, 5), [TextFormatter.render(REPLY)])
+
+    def test_unbroken_text_is_hard_cut(self):
+        """Text without spaces or newlines is still split at the limit."""
+        pages = self.paginate("x" * 2500, 100)
+        self.assertEqual([len(page) for page in pages], [1000, 1000, 500])
@@ -0,0 +1,87 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from bot.generation_scheduler import GenerationScheduler
+
+
+class GenerationSchedulerTest(IsolatedAsyncioTestCase):
+    """Test the concurrency limit, priorities and fairness of the queue."""
+
+    async def asyncSetUp(self):
+        self.scheduler = GenerationScheduler(
+            max_concurrent=1, dev_id=1, priority_users=[2, "vip"], position_interval=0
+        )
+        self.releases = {}
+        self.served = []
+        self.positions = {}
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    async def reply(self, user_id: int, label: str, username: str = None):
+        def on_position(position):
+            self.positions.setdefault(label, []).append(position)
+
+        async with self.scheduler.slot(user_id, username, on_position):
+            self.served.append(label)
+            await self.releases.setdefault(label, asyncio.Event()).wait()
+
+    def release_all(self):
+        for label in ("running", "dev", "vip1", "a1", "a2", "a3", "b1"):
+            self.releases.setdefault(label, asyncio.Event()).set()
+
+    async def start(self, *replies):
+        tasks = []
+        for reply in replies:
+            tasks.append(asyncio.create_task(self.reply(*reply)))
+            await asyncio.sleep(0)
+        return tasks
+
+    async def test_priority_and_turns(self):
+        """The developer goes first, then priority users, then users take turns."""
+        tasks = await self.start(
+            (9, "running"),
+            (5, "a1"),
+            (5, "a2"),
+            (5, "a3"),
+            (6, "b1"),
+            (7, "vip1", "VIP"),
+            (1, "dev"),
+        )
+        self.assertEqual(self.scheduler.waiting, 6)
+        self.release_all()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(self.served, ["running", "dev", "vip1", "a1", "b1", "a2", "a3"])
+        self.assertEqual(self.scheduler.running, 0)
+
+    async def test_positions_are_reported(self):
+        """Waiters learn their position and it moves up as slots free."""
+        tasks = await self.start((9, "running"), (5, "a1"), (6, "b1"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.positions, {"a1": [1], "b1": [2]})
+
+        self.releases["running"].set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.served, ["running", "a1"])
+        self.assertEqual(self.positions["b1"], [2, 1])
+        self.release_all()
+        await asyncio.gather(*tasks)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        """A reply cancelled while queued does not take a slot."""
+        tasks = await self.start((9, "running"), (5, "a1"), (6, "b1"))
+        tasks[1].cancel()
+        await asyncio.sleep(0)
+        self.release_all()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(self.served, ["running", "b1"])
+        self.assertEqual(self.scheduler.stats["abandoned"], 1)
+        self.assertEqual((self.scheduler.running, self.scheduler.waiting), (0, 0))
+
+    def test_disabled_without_a_limit(self):
+        """No max_concurrent leaves generations unlimited."""
+        self.assertIsNone(GenerationScheduler.from_config({}))
+        scheduler = GenerationScheduler.from_config({"max_concurrent": 4, "priority_users": []}, 1, [3])
+        self.assertEqual(scheduler.priority(3), 1)
@@ -0,0 +1,37 @@
+from collections import Counter
+from unittest import TestCase
+
+from bot.helpers.hash_ring import HashRing
+
+
+class HashRingTest(TestCase):
+    """Test the consistent hash ring used for sticky routing."""
+
+    def test_keys_are_stable(self):
+        """A key maps to the same node on every lookup."""
+        ring = HashRing()
+        for node in ("a", "b", "c"):
+            ring.add(node)
+        self.assertEqual({ring.get(42) for _ in range(10)}, {ring.get(42)})
+        self.assertEqual(sorted(ring.walk(42)), ["a", "b", "c"])
+
+    def test_removal_only_moves_its_keys(self):
+        """Keys owned by other nodes keep their node when one is removed."""
+        ring = HashRing()
+        for node in ("a", "b", "c"):
+            ring.add(node)
+        before = {key: ring.get(key) for key in range(1000)}
+        ring.remove("b")
+        for key, node in before.items():
+            if node != "b":
+                self.assertEqual(ring.get(key), node)
+            else:
+                self.assertIn(ring.get(key), ("a", "c"))
+
+    def test_weights(self):
+        """A heavier node owns proportionally more keys."""
+        ring = HashRing()
+        ring.add("light", 1)
+        ring.add("heavy", 3)
+        counts = Counter(ring.get(key) for key in range(4000))
+        self.assertGreater(counts["heavy"], 2 * counts["light"])
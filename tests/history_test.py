@@ -0,0 +1,66 @@
+import time
+from unittest import TestCase
+
+from bot.conversation_store import ConversationStore
+from bot.history import History, Turn
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "Tell me about compression. " * 20},
+    {"role": "assistant", "content": "It removes redundancy. " * 20},
+]
+
+
+class HistoryTest(TestCase):
+    """Test the compact history records."""
+
+    def test_turns_read_like_message_dicts(self):
+        turn = Turn("user", "hi")
+        self.assertEqual(turn, {"role": "user", "content": "hi"})
+        self.assertEqual(dict(turn), {"role": "user", "content": "hi"})
+        turn["content"] = "hello"
+        self.assertEqual(turn["content"], "hello")
+        self.assertIs(Turn("".join(["us", "er"]), "").role, turn.role)
+        with self.assertRaises(KeyError):
+            turn["name"]
+
+    def test_history_is_the_messages_list(self):
+        history = History(MESSAGES[:2])
+        history.append(MESSAGES[2])
+        self.assertEqual(history, MESSAGES)
+        self.assertIsInstance(history[-1], Turn)
+        # Slices share the records instead of copying them
+        self.assertIs(history[1:][0], history[1])
+
+    def test_compression_round_trip(self):
+        history = History(MESSAGES)
+        size = history.nbytes
+        self.assertTrue(history.compress())
+        self.assertTrue(history.compressed)
+        self.assertLess(history.nbytes, size / 4)
+        self.assertFalse(history.compress())
+
+        self.assertEqual(history[1]["content"], MESSAGES[1]["content"])
+        self.assertFalse(history.compressed)
+        self.assertEqual(history, MESSAGES)
+
+        self.assertFalse(History(MESSAGES[:1]).compress(), "too small to be worth it")
+
+
+class CompressedStoreTest(TestCase):
+    """Test compressing idle chats in the conversation memory."""
+
+    def test_idle_chats_are_compressed(self):
+        store = ConversationStore(ttl=None, compress_after=0.01)
+        store[1] = {"messages": list(MESSAGES), "metadata": {}}
+        store[2] = {"messages": [], "metadata": {}}
+        size = store.total_bytes
+        time.sleep(0.02)
+
+        self.assertEqual(store.compress_idle(), 1)
+        self.assertLess(store.total_bytes, size / 4)
+
+        # The next access unpacks the chat and counts its full size again
+        self.assertEqual(store[1]["messages"], MESSAGES)
+        self.assertEqual(store.total_bytes, size)
+        self.assertEqual(store.stats["compressed"], 1)
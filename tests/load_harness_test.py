@@ -0,0 +1,30 @@
+from unittest import IsolatedAsyncioTestCase
+
+from benchmarks.load_test import LoadTest
+from benchmarks.mock_llm_server import MockLLMServer
+from benchmarks.mock_telegram_server import MockTelegramServer
+
+
+class LoadHarnessTest(IsolatedAsyncioTestCase):
+    """Run the whole bot against the fake Telegram and LLM servers."""
+
+    async def test_replies_are_streamed_end_to_end(self):
+        """Every message gets a complete reply through edits of its placeholder."""
+        llm = MockLLMServer(tokens=8, token_delay=0.01).start_in_thread()
+        telegram = MockTelegramServer().start_in_thread()
+        test = LoadTest(
+            users=3,
+            messages=2,
+            llm=llm,
+            telegram=telegram,
+            timeout=10,
+            bot_options={"edit_rate_limits": {"chat_interval": 0.05}},
+        )
+        report = await test.run()
+
+        self.assertEqual(report["messages"], 6)
+        self.assertEqual(report["failed"], 0)
+        self.assertGreater(report["ttfe_p50"], 0)
+        self.assertEqual(telegram.calls["sendMessage"], 6)
+        self.assertGreaterEqual(telegram.calls["editMessageText"], 6)
+        self.assertEqual(llm.requests, 6)
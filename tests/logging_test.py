@@ -0,0 +1,83 @@
+import logging
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import yaml
+
+from bot.helpers.log_helper import ChatSampleFilter, chat_sampled
+from bot.logging_watcher import LoggingWatcher, stop_logging
+
+
+class QueuedLoggingTest(TestCase):
+    """Test moving the configured handlers behind the listener thread."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = Path(self.directory.name) / "logging.yml"
+        self.log_path = Path(self.directory.name) / "test.log"
+        self.root_handlers = logging.getLogger().handlers[:]
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        stop_logging()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        for handler in self.root_handlers:
+            root.addHandler(handler)
+        root.setLevel(self.root_level)
+        logging.getLogger("tests.queued").handlers.clear()
+        self.directory.cleanup()
+
+    def configure(self, message_format: str):
+        config = {
+            "version": 1,
+            "disable_existing_loggers": False,
+            "formatters": {"plain": {"format": message_format}},
+            "handlers": {
+                "file": {
+                    "class": "logging.FileHandler",
+                    "filename": str(self.log_path),
+                    "formatter": "plain",
+                    "level": "INFO",
+                }
+            },
+            "loggers": {"tests.queued": {"level": "DEBUG", "handlers": ["file"], "propagate": False}},
+        }
+        self.config_path.write_text(yaml.safe_dump(config))
+        LoggingWatcher(self.config_path).reload_config()
+
+    def test_records_reach_the_handlers_after_a_reload(self):
+        log = logging.getLogger("tests.queued")
+        self.configure("first %(message)s")
+        self.assertNotIsInstance(log.handlers[0], logging.FileHandler)
+
+        entry = {"turns": 1}
+        log.info("entry %s", entry)
+        # Arguments are resolved when logging, not when the listener writes
+        entry["turns"] = 2
+        log.debug("below the handler level")
+
+        self.configure("second %(message)s")
+        log.info("after reload")
+        stop_logging()
+
+        self.assertEqual(
+            self.log_path.read_text().splitlines(),
+            ["first entry {'turns': 1}", "second after reload"],
+        )
+
+
+class ChatSampleFilterTest(TestCase):
+    def test_sampling_is_per_chat(self):
+        sampled = sum(chat_sampled(chat_id, 0.1) for chat_id in range(10000))
+        self.assertAlmostEqual(sampled / 10000, 0.1, delta=0.02)
+        self.assertTrue(all(chat_sampled(chat_id, 1.0) for chat_id in range(100)))
+
+        sample_filter = ChatSampleFilter(rate=0.1)
+        record = logging.makeLogRecord({"msg": "no chat"})
+        self.assertTrue(sample_filter.filter(record))
+        chat_id = next(chat_id for chat_id in range(100) if not chat_sampled(chat_id, 0.1))
+        self.assertFalse(sample_filter.filter(logging.makeLogRecord({"chat_id": chat_id})))
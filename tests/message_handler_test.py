@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+from bot.backends import ChatBackend
+from bot.message_handler import MyMessageHandler
+
+TEMPLATES = {"chat": {"system_prompt": "You are helpful."}}
+
+
+class FakeMessage:
+    def __init__(self, message_id: int):
+        self.chat_id = 1
+        self.message_id = message_id
+        self.deleted = False
+
+    async def reply_text(self, text, do_quote=True):
+        return FakeMessage(self.message_id + 1)
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeEditScheduler:
+    def __init__(self):
+        self.submitted = []
+        self.flushed = []
+
+    def submit(self, chat_id, message_id, text):
+        self.submitted.append((message_id, text))
+
+    async def flush(self, chat_id, message_id, text):
+        self.flushed.append((message_id, text))
+
+
+class ScriptedBackend(ChatBackend):
+    """Yields ``deltas`` as they are released with ``release``, then ``finish``."""
+
+    def __init__(self):
+        self.queue: "asyncio.Queue" = asyncio.Queue()
+        self.streamed = 0
+
+    def release(self, *deltas):
+        for delta in deltas:
+            self.queue.put_nowait(delta)
+
+    def finish(self):
+        self.queue.put_nowait(None)
+
+    async def stream_chat(self, messages, model, stream=True, route_key=None):
+        while (delta := await self.queue.get()) is not None:
+            self.streamed += 1
+            yield delta
+
+
+class FakeUpdate:
+    """A private text message whose placeholder is sent when ``placeholder`` resolves."""
+
+    def __init__(self, text: str = "hi"):
+        self.placeholder = asyncio.get_running_loop().create_future()
+        self.typing_started = asyncio.Event()
+        self.typing_cancelled = asyncio.Event()
+        chat = SimpleNamespace(type="private", id=1, send_action=self._send_action)
+        self.message = SimpleNamespace(chat=chat, text=text, reply_text=self._reply_text)
+        self.effective_user = None
+
+    async def _reply_text(self, text):
+        return await self.placeholder
+
+    async def _send_action(self, action):
+        self.typing_started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.typing_cancelled.set()
+            raise
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class HandleMessageTest(IsolatedAsyncioTestCase):
+    """Test the concurrent start of a reply with a slow placeholder."""
+
+    async def asyncSetUp(self):
+        self.edit_scheduler = FakeEditScheduler()
+        self.handler = MyMessageHandler(
+            template="chat",
+            instruction_templates=TEMPLATES,
+            BOT_USERNAME="bot",
+            DEV_ID=0,
+            MODEL="m",
+            URI="http://127.0.0.1:9/v1",
+            backend="openai",
+            edit_scheduler=self.edit_scheduler,
+            concurrent_messages="cancel",
+        )
+        self.backend = self.handler.client = ScriptedBackend()
+
+    async def asyncTearDown(self):
+        await self.handler.aclose()
+
+    async def test_deltas_wait_for_the_placeholder(self):
+        """The backend streams before the placeholder exists, shown once it does."""
+        update = FakeUpdate()
+        reply = asyncio.create_task(self.handler.handle_message(update, None))
+        self.backend.release("Hel", "lo")
+        await settle()
+        self.assertEqual(self.backend.streamed, 2)
+        self.assertEqual(self.edit_scheduler.submitted, [])
+
+        update.placeholder.set_result(FakeMessage(5))
+        await settle()
+        self.assertEqual(self.edit_scheduler.submitted, [(5, "Hello")])
+
+        self.backend.finish()
+        await reply
+        self.assertEqual(self.handler.conversation_memory[1]["messages"][-1]["content"], "Hello")
+
+    async def test_typing_stops_at_first_delta(self):
+        update = FakeUpdate()
+        update.placeholder.set_result(FakeMessage(5))
+        reply = asyncio.create_task(self.handler.handle_message(update, None))
+        await asyncio.wait_for(update.typing_started.wait(), 1)
+        self.assertFalse(update.typing_cancelled.is_set())
+
+        self.backend.release("a")
+        await asyncio.wait_for(update.typing_cancelled.wait(), 1)
+        # Still streaming when the typing action stopped
+        self.assertFalse(reply.done())
+        self.backend.finish()
+        await reply
+
+    async def test_superseded_turn_deletes_its_late_placeholder(self):
+        """A reply cancelled before any text still waits for its placeholder to delete it."""
+        first = FakeUpdate("one")
+        first_reply = asyncio.create_task(self.handler.handle_message(first, None))
+        await settle()
+
+        second = FakeUpdate("two")
+        second.placeholder.set_result(FakeMessage(9))
+        second_reply = asyncio.create_task(self.handler.handle_message(second, None))
+        await settle()
+        self.assertFalse(first_reply.done())
+
+        placeholder = FakeMessage(5)
+        first.placeholder.set_result(placeholder)
+        await asyncio.wait_for(first_reply, 1)
+        self.assertTrue(placeholder.deleted)
+
+        self.backend.release("answer")
+        self.backend.finish()
+        await second_reply
+        self.assertEqual(self.edit_scheduler.flushed[-1], (9, "answer"))
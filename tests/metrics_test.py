@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from bot.command_handler import Commands
+from bot.metrics import MetricsRegistry, MetricsServer
+
+
+class MetricsRegistryTest(TestCase):
+    """Test recording and the Prometheus text format."""
+
+    def setUp(self):
+        self.registry = MetricsRegistry(prefix="test")
+
+    def test_counter_and_gauge(self):
+        """Counters get a _total suffix, gauges may be read from a function."""
+        self.registry.counter("messages", "Messages").inc(3)
+        self.registry.gauge("queue", "Queue").set_function(lambda: 7)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_messages counter\ntest_messages_total 3\n", text)
+        self.assertIn("test_queue 7\n", text)
+
+    def test_histogram(self):
+        """Buckets are cumulative and quantiles fall in the right bucket."""
+        histogram = self.registry.histogram("latency", "Latency", buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        text = self.registry.render()
+        self.assertIn('test_latency_bucket{le="1"} 1\n', text)
+        self.assertIn('test_latency_bucket{le="2"} 3\n', text)
+        self.assertIn('test_latency_bucket{le="4"} 4\n', text)
+        self.assertIn('test_latency_bucket{le="+Inf"} 5\n', text)
+        self.assertIn("test_latency_count 5\n", text)
+        self.assertTrue(1 <= histogram.quantile(0.5) <= 2)
+
+    def test_same_name_returns_same_metric(self):
+        """Modules registering a metric twice share it, a type clash fails."""
+        counter = self.registry.counter("x", "X")
+        self.assertIs(self.registry.counter("x", "X"), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("x", "X")
+
+    def test_stats_dicts(self):
+        """Component stats are read when rendering and in the summary."""
+        stats = {"edits_sent": 0}
+        self.registry.register_stats("edit_scheduler", lambda: stats)
+        stats["edits_sent"] = 5
+        self.assertIn("test_edit_scheduler_edits_sent_total 5\n", self.registry.render())
+        self.assertIn("edit_scheduler: edits_sent=5", self.registry.summary())
+
+
+class StatsCommandTest(IsolatedAsyncioTestCase):
+    async def test_long_summary_is_cut_before_escaping(self):
+        """No HTML entity is split when the summary is cut to one message."""
+        registry = MetricsRegistry(prefix="test")
+        registry.register_stats("x", lambda: {f"k&{n}": n for n in range(500)})
+        sent = []
+
+        async def reply_text(text, parse_mode=None):
+            sent.append(text)
+
+        update = SimpleNamespace(
+            message=SimpleNamespace(reply_text=reply_text), effective_user=SimpleNamespace(id=1)
+        )
+        await Commands.stats_command(update, None, registry, dev_id=1)
+        body = sent[0][len("<pre>") : -len("</pre>")]
+        self.assertNotRegex(body, r"&(?!amp;)")
+
+
+class MetricsServerTest(IsolatedAsyncioTestCase):
+    async def test_scrape(self):
+        """GET /metrics returns the rendered registry, other paths 404."""
+        registry = MetricsRegistry(prefix="test")
+        registry.counter("messages", "Messages").inc()
+        server = MetricsServer(registry, port=0)
+        await server.start()
+        try:
+            for path, expected in (("/metrics", b"test_messages_total 1"), ("/", b"404")):
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+                response = await reader.read()
+                writer.close()
+                self.assertIn(expected, response)
+        finally:
+            await server.stop()
@@ -0,0 +1,106 @@
+from unittest import TestCase
+
+from bot.prompt_templates import PromptRenderer, PromptTemplate, compile_templates
+
+CHATML = {
+    "system_prompt": "Be brief.",
+    "prompt_template": {
+        "header": "<|im_start|>system\n{system_prompt}<|im_end|>\n",
+        "user": "<|im_start|>user\n{input}<|im_end|>\n",
+        "output": "<|im_start|>assistant\n{output}\n",
+    },
+}
+
+LLAMA3 = {
+    "system_prompt": "Be brief.",
+    "prompt_template": (
+        "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n"
+        "{system_prompt}<|eot_id|>\n"
+        "<|start_header_id|>user<|end_header_id|>\n"
+        "{input}<|eot_id|>\n"
+        "<|start_header_id|>assistant<|end_header_id|>\n"
+        "{output}\n"
+    ),
+}
+
+ALPACA = {
+    "prompt_start": "Complete the request.",
+    "instruction": "\\n### Instruction:\\n",
+    "response": "\\n### Response:\\n",
+}
+
+CHAT = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "Hi {name}"},
+    {"role": "assistant", "content": "Hello."},
+    {"role": "user", "content": "Bye"},
+]
+
+
+class PromptTemplateTest(TestCase):
+    """Test compiling the layouts of instruction_templates.yml."""
+
+    def test_chatml(self):
+        self.assertEqual(
+            PromptTemplate("ChatML", CHATML).render(CHAT),
+            "<|im_start|>system\nBe brief.<|im_end|>\n"
+            "<|im_start|>user\nHi {name}<|im_end|>\n"
+            "<|im_start|>assistant\nHello.<|im_end|>\n"
+            "<|im_start|>user\nBye<|im_end|>\n"
+            "<|im_start|>assistant\n",
+        )
+
+    def test_single_string_template(self):
+        self.assertEqual(
+            PromptTemplate("llama3", LLAMA3).render(CHAT[:2]),
+            "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\nBe brief.<|eot_id|>\n"
+            "<|start_header_id|>user<|end_header_id|>\nHi {name}<|eot_id|>\n"
+            "<|start_header_id|>assistant<|end_header_id|>\n",
+        )
+
+    def test_legacy_template(self):
+        template = PromptTemplate("alpaca", ALPACA)
+        self.assertEqual(template.system_message, {"role": "system", "content": "Complete the request."})
+        self.assertEqual(
+            template.render(CHAT[1:]),
+            "Complete the request.\n### Instruction:\nHi {name}\n### Response:\nHello."
+            "\n### Instruction:\nBye\n### Response:\n",
+        )
+
+    def test_invalid_templates_are_listed(self):
+        with self.assertRaises(ValueError) as raised:
+            compile_templates({"ok": CHATML, "a": {"prompt_template": {"header": ""}}, "b": "x"})
+        self.assertIn("'a'", str(raised.exception))
+        self.assertIn("'b'", str(raised.exception))
+        self.assertFalse(compile_templates({"chat": {"system_prompt": "Hi"}})["chat"].raw)
+
+
+class PromptRendererTest(TestCase):
+    """Test the incremental rendering of a chat."""
+
+    def setUp(self):
+        self.template = PromptTemplate("ChatML", CHATML)
+        self.renderer = PromptRenderer(max_chats=2)
+
+    def test_turns_are_appended(self):
+        """Only new messages are rendered and the result matches a full render."""
+        for end in range(2, len(CHAT) + 1):
+            self.assertEqual(
+                self.renderer.render(1, CHAT[:end], self.template), self.template.render(CHAT[:end])
+            )
+        self.assertEqual(self.renderer.stats, {"rendered": 3, "reused": 3})
+
+    def test_changed_history_renders_again(self):
+        """A trimmed history or new system prompt renders from the change on."""
+        self.renderer.render(1, CHAT, self.template)
+        trimmed = [CHAT[0]] + CHAT[3:]
+        self.assertEqual(self.renderer.render(1, trimmed, self.template), self.template.render(trimmed))
+        summarized = [{"role": "system", "content": "Be brief. Summary: hi"}] + CHAT[3:]
+        self.assertEqual(
+            self.renderer.render(1, summarized, self.template), self.template.render(summarized)
+        )
+
+    def test_least_recent_chats_are_dropped(self):
+        for chat_id in range(3):
+            self.renderer.render(chat_id, CHAT, self.template)
+        self.assertEqual(len(self.renderer), 2)
@@ -0,0 +1,112 @@
+import json
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+from bot.backends import (
+    RAW_BACKENDS,
+    ExLlamaBackend,
+    LlamaCppBackend,
+    SGLangBackend,
+)
+
+
+class FakeServer:
+    """Answers every request with fixed lines and keeps the request bodies."""
+
+    def __init__(self, lines, json_body=None):
+        self.lines = lines
+        self.json_body = json_body
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((str(request.url), json.loads(request.content)))
+        if self.json_body is not None:
+            return httpx.Response(200, json=self.json_body)
+        return httpx.Response(200, content="".join(line + "\n" for line in self.lines).encode())
+
+
+class RawBackendTest(IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+
+    def backend(self, backend_class, server, uri="http://llm:8000", **options):
+        self.http_client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+        return backend_class(
+            uri, self.http_client, sampling={"temperature": 0.5}, max_new_tokens=64, **options
+        )
+
+    async def collect(self, backend, stream=True):
+        return [
+            chunk
+            async for chunk in backend.stream_chat(
+                [], model="", stream=stream, prompt="<s>hi", stop=["</s>"]
+            )
+        ]
+
+    async def test_sglang_cumulative_text(self):
+        """SGLang's cumulative text is yielded as deltas."""
+        server = FakeServer(
+            [f"data: {json.dumps({'text': text})}" if text else "" for text in ("Hel", "", "Hello", "Hello!")]
+            + ["data: [DONE]"]
+        )
+        backend = self.backend(SGLangBackend, server)
+        self.assertEqual(await self.collect(backend), ["Hel", "lo", "!"])
+        url, body = server.requests[0]
+        self.assertEqual(url, "http://llm:8000/generate")
+        self.assertEqual(body["text"], "<s>hi")
+        self.assertFalse(body["return_logprob"])
+        self.assertEqual(
+            body["sampling_params"], {"max_new_tokens": 64, "stop": ["</s>"], "temperature": 0.5}
+        )
+        self.assertEqual(backend.stats["first_tokens"], 1)
+
+    async def test_sglang_incremental_text(self):
+        """Repeated tokens of an incremental stream are all kept."""
+        events = [f"data: {json.dumps({'text': text})}" for text in ("ha", "ha", "!")]
+        server = FakeServer(events + ["data: [DONE]"])
+        backend = self.backend(SGLangBackend, server, incremental_output=True)
+        self.assertEqual(await self.collect(backend), ["ha", "ha", "!"])
+
+    async def test_sglang_switches_to_incremental_text(self):
+        """Text that does not extend the stream locks the response to incremental text."""
+        events = [f"data: {json.dumps({'text': text})}" for text in ("Hi", " there", "Hi")]
+        server = FakeServer(events + ["data: [DONE]"])
+        backend = self.backend(SGLangBackend, server)
+        with self.assertLogs("bot.backends.raw_backend", "WARNING"):
+            self.assertEqual(await self.collect(backend), ["Hi", " there", "Hi"])
+
+    async def test_llamacpp_sse(self):
+        """llama.cpp events carry the new content, the prompt cache is enabled."""
+        server = FakeServer(
+            ['data: {"content": "a"}', "", 'data: {"content": "b"}', 'data: {"content": "", "stop": true}']
+        )
+        backend = self.backend(LlamaCppBackend, server)
+        self.assertEqual(await self.collect(backend), ["a", "b"])
+        url, body = server.requests[0]
+        self.assertEqual(url, "http://llm:8000/completion")
+        self.assertTrue(body["cache_prompt"])
+        self.assertEqual((body["n_predict"], body["stop"]), (64, ["</s>"]))
+
+    async def test_exllama_ndjson(self):
+        """Newline-delimited JSON is read as well as server-sent events."""
+        server = FakeServer(['{"text": "x"}', '{"text": "y"}'])
+        backend = self.backend(ExLlamaBackend, server, uri="http://llm:5005/api/generate")
+        self.assertEqual(await self.collect(backend), ["x", "y"])
+        url, body = server.requests[0]
+        self.assertEqual(url, "http://llm:5005/api/generate")
+        self.assertEqual(body["stop_strings"], ["</s>"])
+        self.assertEqual(backend.health_url(backend.url), "http://llm:5005/health")
+
+    async def test_non_streaming(self):
+        """A non-streamed reply is one chunk."""
+        server = FakeServer([], json_body={"text": "whole reply"})
+        backend = self.backend(SGLangBackend, server)
+        self.assertEqual(await self.collect(backend, stream=False), ["whole reply"])
+        self.assertFalse(server.requests[0][1]["stream"])
+
+    async def test_needs_prompt(self):
+        backend = self.backend(RAW_BACKENDS["sglang_generate"], FakeServer([]))
+        with self.assertRaises(ValueError):
+            async for _ in backend.stream_chat([{"role": "user", "content": "hi"}], model=""):
+                pass
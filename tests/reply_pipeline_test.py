@@ -0,0 +1,131 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from bot.helpers.formatting_helper import StreamingPager
+from bot.reply_pipeline import ReplyPipeline
+
+
+class FakeMessage:
+    def __init__(self, message_id: int):
+        self.chat_id = 1
+        self.message_id = message_id
+
+    async def reply_text(self, text, do_quote=True):
+        return FakeMessage(self.message_id + 1)
+
+
+class FakeEditScheduler:
+    """Records edits; ``flush`` takes ``delay`` seconds like a slow Telegram."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.submitted = []
+        self.flushed = []
+
+    def submit(self, chat_id, message_id, text):
+        self.submitted.append((message_id, text))
+
+    async def flush(self, chat_id, message_id, text):
+        await asyncio.sleep(self.delay)
+        self.flushed.append((message_id, text))
+
+
+async def generate(deltas, log=None, delay=0.0):
+    for delta in deltas:
+        if delay:
+            await asyncio.sleep(delay)
+        yield delta
+    if log is not None:
+        log.append("backend done")
+
+
+def placeholder():
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(FakeMessage(1))
+    return future
+
+
+class ReplyPipelineTest(IsolatedAsyncioTestCase):
+    async def test_slow_telegram_does_not_stall_the_backend(self):
+        """The backend is drained while a full page is still being sent."""
+        log = []
+        scheduler = FakeEditScheduler(delay=0.05)
+        original_flush = scheduler.flush
+
+        async def flush(*args):
+            await original_flush(*args)
+            log.append("page sent")
+
+        scheduler.flush = flush
+        pager = StreamingPager(limit=40)
+        pages = []
+        pipeline = ReplyPipeline(pager, pages, placeholder(), scheduler)
+        await pipeline.run(generate(["word "] * 20, log))
+
+        self.assertEqual(log[0], "backend done")
+        self.assertEqual(pager.text, "word " * 20)
+        # Every full page went to its own message, in order
+        self.assertEqual([message_id for message_id, _ in scheduler.flushed], [1, 2])
+        self.assertEqual([message.message_id for message in pages], [1, 2, 3])
+
+    async def test_only_latest_snapshot_is_sent(self):
+        """Deltas that arrive within an edit interval are sent as one edit."""
+        scheduler = FakeEditScheduler()
+        pager = StreamingPager()
+        pipeline = ReplyPipeline(pager, [], placeholder(), scheduler, edit_interval=10)
+        await pipeline.run(generate(["a", "b", "c"], delay=0.001))
+
+        self.assertLessEqual(len(scheduler.submitted), 1)
+        self.assertEqual(pager.render(), "abc")
+
+    async def test_deltas_wait_for_the_placeholder(self):
+        """Nothing is edited before the placeholder exists."""
+        scheduler = FakeEditScheduler()
+        pending = asyncio.get_running_loop().create_future()
+        pages = []
+        pipeline = ReplyPipeline(StreamingPager(), pages, pending, scheduler)
+        run = asyncio.create_task(pipeline.run(generate(["a", "b"], delay=0.01)))
+        await asyncio.sleep(0.005)
+        self.assertEqual(scheduler.submitted, [])
+
+        pending.set_result(FakeMessage(7))
+        await run
+        self.assertEqual(pages[0].message_id, 7)
+        self.assertEqual(scheduler.submitted[0][0], 7)
+
+    async def test_non_streaming_sends_no_snapshots(self):
+        scheduler = FakeEditScheduler()
+        pager = StreamingPager()
+        pipeline = ReplyPipeline(pager, [], placeholder(), scheduler, streaming=False)
+        await pipeline.run(generate(["whole reply"]))
+
+        self.assertEqual(scheduler.submitted, [])
+        self.assertEqual(pager.text, "whole reply")
+
+    async def test_backend_error_is_raised(self):
+        async def failing():
+            yield "a"
+            raise ConnectionError("backend down")
+
+        pipeline = ReplyPipeline(StreamingPager(), [], placeholder(), FakeEditScheduler())
+        with self.assertRaises(ConnectionError):
+            await pipeline.run(failing())
+
+    async def test_cancel_closes_the_backend_stream(self):
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(0.001)
+                    yield "x"
+            finally:
+                closed.set()
+
+        pipeline = ReplyPipeline(StreamingPager(), [], placeholder(), FakeEditScheduler())
+        run = asyncio.create_task(pipeline.run(endless()))
+        await asyncio.sleep(0.01)
+        run.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await run
+        self.assertTrue(closed.is_set())
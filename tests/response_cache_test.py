@@ -0,0 +1,64 @@
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from bot.response_cache import ResponseCache, is_deterministic
+
+MESSAGES = [
+    {"role": "system", "content": "You are helpful."},
+    {"role": "user", "content": "hi"},
+]
+
+
+class ResponseCacheTest(TestCase):
+    """Test the keys and the eviction rules of the response cache."""
+
+    def test_key_normalizes_content_only(self):
+        """Whitespace around a message does not matter, the settings do."""
+        key = ResponseCache.key(MESSAGES, "m", {"temperature": 0})
+        padded = [dict(m, content=f" {m['content']}\n") for m in MESSAGES]
+        self.assertEqual(ResponseCache.key(padded, "m", {"temperature": 0}), key)
+        self.assertNotEqual(ResponseCache.key(MESSAGES, "other", {"temperature": 0}), key)
+        self.assertNotEqual(ResponseCache.key(MESSAGES, "m", {"temperature": 0, "seed": 1}), key)
+        self.assertNotEqual(ResponseCache.key(MESSAGES[1:], "m", {"temperature": 0}), key)
+
+    def test_only_deterministic_sampling_is_cached(self):
+        """Random sampling disables the cache."""
+        self.assertTrue(is_deterministic({"temperature": 0}))
+        self.assertTrue(is_deterministic({"temperature": 0.7, "seed": 3}))
+        self.assertFalse(is_deterministic({}))
+        self.assertIsNone(ResponseCache.from_config({"enabled": True}, {"temperature": 0.7}))
+        self.assertIsNone(ResponseCache.from_config({}, {"temperature": 0}))
+        cache = ResponseCache.from_config({"enabled": True, "ttl": 5}, {"temperature": 0})
+        self.assertEqual(cache.ttl, 5)
+
+    def test_least_recently_used_reply_is_evicted(self):
+        """The entry limit evicts the reply not read for the longest time."""
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", "reply a")
+        cache.put("b", "reply b")
+        self.assertEqual(cache.get("a"), "reply a")
+        cache.put("c", "reply c")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "reply a")
+        self.assertEqual(cache.stats["evicted"], 1)
+        self.assertEqual((cache.stats["hits"], cache.stats["misses"]), (2, 1))
+
+    def test_byte_budget_and_ttl(self):
+        """Replies expire after the ttl and the byte budget is respected."""
+        cache = ResponseCache(max_bytes=500, ttl=0.01)
+        cache.put("big", "x" * 1000)
+        self.assertEqual(len(cache), 0)
+        cache.put("a", "reply")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.total_bytes, 0)
+        self.assertEqual(cache.stats["expired"], 1)
+
+
+class ReplayTest(IsolatedAsyncioTestCase):
+    async def test_replay_yields_the_whole_reply(self):
+        """A hit is streamed in small deltas that add up to the reply."""
+        cache = ResponseCache(replay_chunk=4)
+        deltas = [delta async for delta in cache.replay("Hello there!")]
+        self.assertEqual(deltas, ["Hell", "o th", "ere!"])
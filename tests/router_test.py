@@ -0,0 +1,189 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import httpx
+
+from benchmarks.mock_llm_server import MockLLMServer
+from bot.backends import (
+    ChatBackend,
+    EndpointRouter,
+    OpenAIBackend,
+    PoolSettings,
+    create_http_client,
+    parse_endpoints,
+)
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class ParseEndpointsTest(TestCase):
+    def test_single_and_weighted(self):
+        """A plain uri and mixed lists normalize to weighted endpoints."""
+        self.assertEqual(parse_endpoints("http://a/v1"), [{"uri": "http://a/v1", "weight": 1.0}])
+        self.assertEqual(
+            parse_endpoints(["http://a/v1", {"uri": "http://b/v1", "weight": 3}]),
+            [{"uri": "http://a/v1", "weight": 1.0}, {"uri": "http://b/v1", "weight": 3.0}],
+        )
+        with self.assertRaises(ValueError):
+            parse_endpoints([{"uri": "http://a/v1", "weight": 0}])
+
+
+class StaticBackend(ChatBackend):
+    def __init__(self, uri):
+        self.uri = uri
+        self.stats = {"requests": 0}
+
+    async def stream_chat(self, messages, model, stream=True):
+        yield self.uri
+
+
+class RefusingBackend(ChatBackend):
+    """Answers every request with an HTTP ``status``."""
+
+    def __init__(self, uri, status):
+        self.uri = uri
+        self.status = status
+        self.requests = 0
+
+    async def stream_chat(self, messages, model, stream=True):
+        self.requests += 1
+        request = httpx.Request("POST", self.uri)
+        response = httpx.Response(self.status, request=request)
+        raise httpx.HTTPStatusError("refused", request=request, response=response)
+        yield
+
+
+class ChooseTest(TestCase):
+    def setUp(self):
+        self.router = EndpointRouter(
+            parse_endpoints(["a", {"uri": "b", "weight": 2}]),
+            StaticBackend,
+            http_client=None,
+            health_check_interval=0,
+            failure_threshold=2,
+        )
+        self.a, self.b = self.router.endpoints
+
+    def test_least_outstanding_per_weight(self):
+        """Load is compared relative to the endpoint weight."""
+        self.a.outstanding, self.b.outstanding = 1, 2
+        self.assertIs(self.router.choose(), self.b)
+        self.b.outstanding = 4
+        self.assertIs(self.router.choose(), self.a)
+
+    def test_open_circuit_is_avoided(self):
+        """Repeated failures take an endpoint out until it recovers."""
+        for _ in range(2):
+            self.b.record_failure(self.router.failure_threshold, self.router.cooldown)
+        self.assertEqual({self.router.choose() for _ in range(20)}, {self.a})
+        self.b.record_success()
+        self.a.outstanding = 5
+        self.assertIs(self.router.choose(), self.b)
+
+    def test_sticky(self):
+        """A chat stays on one endpoint and moves only when it is down."""
+        self.router.policy = "sticky"
+        owner = self.router.choose(key=7)
+        self.assertEqual({self.router.choose(key=7) for _ in range(10)}, {owner})
+        other = self.b if owner is self.a else self.a
+        self.assertIs(self.router.choose(exclude=[owner], key=7), other)
+
+    def test_update_keeps_known_endpoints(self):
+        """Unchanged uris keep their backend and statistics."""
+        self.a.outstanding = 4
+        self.router.update_endpoints(parse_endpoints(["a", "c"]))
+        self.assertIs(self.router.endpoints[0], self.a)
+        self.assertEqual(self.router.endpoints[1].uri, "c")
+
+    def test_backend_stats_survive_removed_endpoints(self):
+        """The exported totals never drop when a reload removes an endpoint."""
+        self.a.backend.stats["requests"] = 2
+        self.b.backend.stats["requests"] = 3
+        self.router.update_endpoints(parse_endpoints(["a"]))
+        self.assertEqual(self.router.backend_stats(), {"requests": 5})
+
+
+class NoEndpointTest(IsolatedAsyncioTestCase):
+    async def test_no_endpoint_available(self):
+        """An empty endpoint list raises a clear error instead of an unbound name."""
+        router = EndpointRouter(
+            parse_endpoints(["a"]), StaticBackend, http_client=None, health_check_interval=0
+        )
+        router.update_endpoints([])
+        with self.assertRaisesRegex(RuntimeError, "no backend endpoint"):
+            async for _ in router.stream_chat(MESSAGES, "mock"):
+                pass
+        await router.aclose()
+
+
+class ClientErrorTest(IsolatedAsyncioTestCase):
+    async def stream(self, status):
+        router = EndpointRouter(
+            parse_endpoints(["a", "b"]),
+            lambda uri: RefusingBackend(uri, status),
+            http_client=None,
+            health_check_interval=0,
+            failure_threshold=1,
+        )
+        with self.assertRaises(httpx.HTTPStatusError):
+            async for _ in router.stream_chat(MESSAGES, "mock"):
+                pass
+        await router.aclose()
+        return router
+
+    async def test_client_error_is_not_retried(self):
+        """A 400 is raised at once without failing over or opening a circuit."""
+        router = await self.stream(400)
+        self.assertEqual(sum(e.backend.requests for e in router.endpoints), 1)
+        self.assertEqual(router.stats["failures"], 0)
+        self.assertTrue(all(e.available for e in router.endpoints))
+
+    async def test_server_error_fails_over(self):
+        router = await self.stream(503)
+        self.assertEqual([e.backend.requests for e in router.endpoints], [1, 1])
+        self.assertEqual(router.stats["failures"], 2)
+        self.assertFalse(any(e.available for e in router.endpoints))
+
+
+class FailoverTest(IsolatedAsyncioTestCase):
+    """Test failover between two mock replicas."""
+
+    async def asyncSetUp(self):
+        self.servers = [await MockLLMServer(tokens=3, token_delay=0).start() for _ in range(2)]
+        self.http_client = create_http_client(PoolSettings(http2=False))
+        self.router = EndpointRouter(
+            parse_endpoints([server.uri for server in self.servers]),
+            lambda uri: OpenAIBackend(uri, self.http_client, max_retries=0),
+            self.http_client,
+            health_check_interval=0,
+        )
+
+    async def asyncTearDown(self):
+        await self.router.aclose()
+        await self.http_client.aclose()
+        for server in self.servers:
+            await server.stop()
+
+    async def test_retry_before_first_token(self):
+        """A replica failing before the first token is replaced transparently."""
+        self.servers[0].fail_requests = 1
+        # The lighter replica is chosen first
+        self.router.endpoints[1].weight = 0.5
+        chunks = [chunk async for chunk in self.router.stream_chat(MESSAGES, "mock")]
+        self.assertEqual(chunks, ["tok "] * 3)
+        self.assertEqual(self.router.stats["retries"], 1)
+        self.assertEqual(sum(e.outstanding for e in self.router.endpoints), 0)
+
+    async def test_all_replicas_failing(self):
+        """The last error is raised once every endpoint was tried."""
+        self.servers[0].fail_requests = self.servers[1].fail_requests = 2
+        with self.assertRaises(Exception):
+            async for _ in self.router.stream_chat(MESSAGES, "mock"):
+                pass
+        self.assertEqual(self.router.stats["failures"], 2)
+
+    async def test_health_check(self):
+        """A replica that stops answering probes is marked as failing."""
+        await self.servers[1].stop()
+        for endpoint in self.router.endpoints:
+            await self.router._probe(endpoint)
+        self.assertEqual([e.failures for e in self.router.endpoints], [0, 1])
@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+from bot.bot import Bot
+from bot.runtime_config import RuntimeConfig
+
+TEMPLATES = {
+    "chat": {"system_prompt": "You are helpful."},
+    "terse": {"system_prompt": "Answer briefly."},
+}
+
+CONFIG = {
+    "uri": ["http://a:30000/v1", "http://b:30000/v1"],
+    "model": "m",
+    "enable_message_streaming": True,
+    "template": "chat",
+    "allowed_telegram_usernames": [],
+}
+
+
+def message_from(user_id: int, username: str):
+    return SimpleNamespace(from_user=SimpleNamespace(id=user_id, username=username))
+
+
+class RuntimeConfigTest(IsolatedAsyncioTestCase):
+    """Test validating and swapping the reloadable settings."""
+
+    async def asyncSetUp(self):
+        self.bot = Bot(
+            token="123:ABC",
+            backend="openai",
+            template="chat",
+            uri=CONFIG["uri"],
+            model="m",
+            users=[],
+            bot_username="bot",
+            dev_id=0,
+            instruction_templates=TEMPLATES,
+            max_new_tokens=64,
+            streaming=True,
+        )
+        self.bot.build_application()
+        self.handler = self.bot.message_handling
+
+    async def asyncTearDown(self):
+        await self.handler.aclose()
+
+    def test_invalid_config_is_rejected_whole(self):
+        """Every problem is reported and nothing is applied."""
+        config = dict(CONFIG, uri=[], template="missing", enable_message_streaming="yes")
+        with self.assertRaises(ValueError) as raised:
+            self.bot.apply_config(config)
+        for key in ("uri", "template", "enable_message_streaming"):
+            self.assertIn(key, str(raised.exception))
+        self.assertEqual(self.handler.runtime.version, 1)
+
+    def test_reload_keeps_the_client(self):
+        """Changing the model reuses the client, new endpoints reuse it too."""
+        client = self.handler.client
+        endpoint = client.endpoints[0]
+        before = self.handler.runtime
+
+        runtime = self.bot.apply_config(dict(CONFIG, model="n", template="terse"))
+        self.assertEqual((runtime.version, runtime.model, runtime.template), (2, "n", "terse"))
+        self.assertIs(self.handler.client, client)
+        # A reply that started before the reload keeps its snapshot
+        self.assertEqual(before.model, "m")
+
+        self.bot.apply_config(dict(CONFIG, model="n", template="terse", uri=CONFIG["uri"][:1]))
+        self.assertIs(self.handler.client, client)
+        self.assertEqual(client.endpoints, [endpoint])
+
+    def test_unchanged_config_is_not_a_new_version(self):
+        """Saving the file without changes keeps the running snapshot."""
+        self.assertIs(self.bot.apply_config(dict(CONFIG)), self.handler.runtime)
+        self.assertEqual(self.handler.runtime.version, 1)
+
+    def test_allowed_users_are_reloaded(self):
+        """The user filter follows allowed_telegram_usernames."""
+        user_filter = self.bot.user_filter
+        self.assertTrue(user_filter.filter(message_from(7, "someone")))
+
+        self.bot.apply_config(dict(CONFIG, allowed_telegram_usernames=["@Alice", 42]))
+        self.assertTrue(user_filter.filter(message_from(1, "alice")))
+        self.assertTrue(user_filter.filter(message_from(42, None)))
+        self.assertFalse(user_filter.filter(message_from(7, "someone")))
+
+    def test_instruction_templates_are_reloaded(self):
+        """New templates apply unless the running template disappears."""
+        with self.assertRaises(ValueError):
+            self.bot.apply_instruction_templates({"terse": TEMPLATES["terse"]})
+        self.assertIs(self.handler.instruction_templates, TEMPLATES)
+
+        templates = dict(TEMPLATES, chat={"system_prompt": "Be kind."})
+        self.bot.apply_instruction_templates(templates)
+        self.assertIs(self.handler.instruction_templates, templates)
+
+    def test_changes_lists_config_keys(self):
+        old = RuntimeConfig("http://a/v1", "m", True, "chat")
+        new = RuntimeConfig("http://a/v1", "m", False, "chat", ["bob"])
+        self.assertEqual(old.changes(new), ["enable_message_streaming", "allowed_telegram_usernames"])
+
+
+class RawTemplateTest(IsolatedAsyncioTestCase):
+    """A raw completion backend only runs with templates that render a prompt."""
+
+    RAW_TEMPLATES = dict(
+        TEMPLATES,
+        chatml={
+            "system_prompt": "You are helpful.",
+            "prompt_template": "<|im_start|>system\n{system_prompt}\n<|im_start|>user\n{input}\n"
+            "<|im_start|>assistant\n{output}",
+        },
+    )
+
+    async def asyncSetUp(self):
+        self.bot = Bot(
+            token="123:ABC",
+            backend="sglang_generate",
+            template="chatml",
+            uri="http://a:30000",
+            model="m",
+            users=[],
+            bot_username="bot",
+            dev_id=0,
+            instruction_templates=self.RAW_TEMPLATES,
+            max_new_tokens=64,
+            streaming=True,
+        )
+        self.bot.build_application()
+        self.handler = self.bot.message_handling
+
+    async def asyncTearDown(self):
+        await self.handler.aclose()
+
+    def test_reload_to_chat_template_is_rejected(self):
+        config = dict(CONFIG, uri="http://a:30000", template="chat")
+        with self.assertRaisesRegex(ValueError, "prompt_template"):
+            self.bot.apply_config(config)
+        self.assertEqual(self.handler.runtime.template, "chatml")
+        self.assertEqual(self.bot.apply_config(dict(config, template="chatml")).template, "chatml")
+
+    def test_running_template_must_stay_raw(self):
+        templates = dict(self.RAW_TEMPLATES, chatml={"system_prompt": "Plain."})
+        with self.assertRaisesRegex(ValueError, "prompt_template"):
+            self.bot.apply_instruction_templates(templates)
+        self.assertIs(self.handler.instruction_templates, self.RAW_TEMPLATES)
+
+    def test_startup_with_chat_template_fails(self):
+        bot = Bot(
+            token="123:ABC",
+            backend="llamacpp_completion",
+            template="chat",
+            uri="http://a:8080",
+            model="m",
+            users=[],
+            bot_username="bot",
+            dev_id=0,
+            instruction_templates=self.RAW_TEMPLATES,
+            max_new_tokens=64,
+            streaming=True,
+        )
+        with self.assertRaisesRegex(ValueError, "prompt_template"):
+            bot.build_application()
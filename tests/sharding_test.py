@@ -0,0 +1,154 @@
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+from telegram import Update
+
+from bot.conversation_store import ConversationStore
+from bot.generation_scheduler import GenerationScheduler
+from bot.sharding import (
+    ShardWorker,
+    Supervisor,
+    _WorkerHandle,
+    read_frame,
+    shard_ring,
+    worker_budget,
+    write_frame,
+)
+
+
+class FakeProcess:
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+
+def make_update(chat_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": chat_id,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "hi",
+            },
+        },
+        None,
+    )
+
+
+class ShardingTest(IsolatedAsyncioTestCase):
+    """Test the IPC channel and the chat to worker assignment."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.received = {}
+        self.servers = []
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            server.close()
+        self.tmp.cleanup()
+
+    async def start_fake_worker(self, name: str) -> _WorkerHandle:
+        """A socket collecting the frames sent to one worker."""
+        self.received[name] = []
+
+        async def handle(reader, writer):
+            while (message := await read_frame(reader)) is not None:
+                self.received[name].append(message)
+
+        path = str(Path(self.tmp.name) / f"{name}.sock")
+        self.servers.append(await asyncio.start_unix_server(handle, path=path))
+        handle = _WorkerHandle(name, path)
+        handle.process = FakeProcess()
+        await handle.connect()
+        return handle
+
+    async def test_frames_round_trip(self):
+        """Messages arrive whole and in order, None once the channel closes."""
+        handle = await self.start_fake_worker("worker-0")
+        await write_frame(handle.writer, {"type": "update", "update": {"text": "ü" * 100000}})
+        await write_frame(handle.writer, {"type": "stop"})
+        handle.close()
+        await asyncio.sleep(0.05)
+
+        messages = self.received["worker-0"]
+        self.assertEqual([m["type"] for m in messages], ["update", "stop"])
+        self.assertEqual(len(messages[0]["update"]["text"]), 100000)
+
+    async def test_updates_follow_their_chat(self):
+        """Each chat goes to its owner, or the next worker while it is down."""
+        supervisor = Supervisor({"token": "1:A"}, workers=2)
+        names = ["worker-0", "worker-1"]
+        supervisor.ring = shard_ring(names)
+        for name in names:
+            supervisor.workers[name] = await self.start_fake_worker(name)
+
+        for chat_id in range(20):
+            await supervisor._forward(make_update(chat_id), None)
+        supervisor.workers["worker-0"].process.alive = False
+        for chat_id in range(20):
+            await supervisor._forward(make_update(chat_id), None)
+        await asyncio.sleep(0.05)
+
+        owned = [m["update"]["message"]["chat"]["id"] for m in self.received["worker-0"]]
+        self.assertTrue(owned)
+        self.assertTrue(all(supervisor.ring.get(chat_id) == "worker-0" for chat_id in owned))
+        self.assertEqual(len(self.received["worker-1"]), 40 - len(owned))
+        for handle in supervisor.workers.values():
+            handle.close()
+
+    async def test_rebalance_releases_lost_chats(self):
+        """A worker keeps only the chats it still owns after a resize."""
+        memory = ConversationStore(ttl=None)
+        for chat_id in range(50):
+            memory[chat_id] = {"messages": [], "metadata": {}}
+        bot = SimpleNamespace(message_handling=SimpleNamespace(conversation_memory=memory))
+        worker = ShardWorker(bot, "worker-0", "unused", ["worker-0"])
+
+        await worker.rebalance(["worker-0", "worker-1"])
+
+        self.assertTrue(0 < len(memory) < 50)
+        self.assertTrue(all(worker.ring.get(chat_id) == "worker-0" for chat_id in memory))
+
+    async def test_ingress_webhook_path(self):
+        """The ingress listens on the path of the webhook url, / for a bare host."""
+        for url, path in (
+            ("https://bot.example.com", "/"),
+            ("https://bot.example.com/hook?x=1", "/hook"),
+        ):
+            supervisor = Supervisor(
+                {"token": "1:A", "webhook": {"url": url, "secret_token": "s"}}, workers=1
+            )
+            self.assertEqual(supervisor._webhook_app(None).path, path)
+
+    async def test_workers_share_the_bot_wide_limits(self):
+        """The edit rate and admitted generations are split between the workers."""
+        kwargs = {
+            "token": "1:A",
+            "edit_rate_limits": {"global_rate": 30, "chat_interval": 1.0},
+            "admission": {"max_concurrent": 8},
+        }
+        supervisor = Supervisor(kwargs, workers=4)
+        worker_kwargs = supervisor._worker_kwargs(1, 4)
+        self.assertEqual(worker_kwargs["edit_rate_limits"], {"global_rate": 7.5, "chat_interval": 1.0})
+        self.assertEqual(worker_kwargs["admission"], {"max_concurrent": 2})
+        self.assertEqual(worker_kwargs["error_reports"], {"source": "worker-1"})
+        self.assertEqual(worker_budget(kwargs, 16)["admission"]["max_concurrent"], 1)
+        # The configuration itself is left as it was
+        self.assertEqual(kwargs["admission"], {"max_concurrent": 8})
+
+        scheduler = GenerationScheduler(max_concurrent=2)
+        bot = SimpleNamespace(
+            edit_scheduler=SimpleNamespace(global_interval=0.0),
+            message_handling=SimpleNamespace(generation_scheduler=scheduler),
+        )
+        ShardWorker(bot, "worker-0", "unused", ["worker-0"]).apply_budget(worker_budget(kwargs, 2))
+        self.assertAlmostEqual(bot.edit_scheduler.global_interval, 1 / 15)
+        self.assertEqual(scheduler.max_concurrent, 4)
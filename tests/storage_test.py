@@ -0,0 +1,90 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+from bot.conversation_store import ConversationStore
+from bot.storage import SQLiteStorage, WriteBehindStorage
+
+
+class PersistentStoreTest(IsolatedAsyncioTestCase):
+    """Test the SQLite write-behind tier of the conversation memory."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "conversations.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_store(self, **kwargs) -> ConversationStore:
+        storage = WriteBehindStorage(SQLiteStorage(self.path), flush_interval=60)
+        return ConversationStore(storage=storage, **kwargs)
+
+    async def test_history_survives_restart(self):
+        """Messages and metadata are written on stop and loaded lazily."""
+        store = self.make_store(ttl=None)
+        store[1] = {
+            "messages": [{"role": "user", "content": "hi"}],
+            "metadata": {"model": "m"},
+        }
+        store[1]["messages"].append({"role": "assistant", "content": "hello"})
+        store.resize(1)
+        await store.stop()
+
+        store = self.make_store(ttl=None)
+        self.assertNotIn(1, store)
+        entry = await store.load(1)
+        self.assertEqual(len(entry["messages"]), 2)
+        self.assertEqual(entry["metadata"], {"model": "m"})
+        self.assertIn(1, store)
+        await store.stop()
+
+    async def test_writes_are_batched(self):
+        """Many changes between flushes are written once per chat."""
+        store = self.make_store(ttl=None)
+        for chat_id in range(3):
+            store[chat_id] = {"messages": [], "metadata": {}}
+            for _ in range(10):
+                store.resize(chat_id)
+        await store.storage.flush()
+
+        self.assertEqual(store.storage.stats, {"flushes": 1, "chats_written": 3})
+        await store.stop()
+
+    async def test_evicted_chat_is_reloaded(self):
+        """Eviction only frees memory, wiping deletes from disk."""
+        store = self.make_store(max_chats=1, ttl=None)
+        store[1] = {"messages": [{"role": "user", "content": "a"}], "metadata": {}}
+        store[2] = {"messages": [{"role": "user", "content": "b"}], "metadata": {}}
+        self.assertNotIn(1, store)
+        self.assertIsNotNone(await store.load(1))
+
+        del store[1]
+        await store.storage.flush()
+        self.assertIsNone(await store.load(1))
+        await store.stop()
+
+    async def test_expired_chat_is_not_resumed(self):
+        """A saved chat older than the dialog timeout starts a new dialog."""
+        store = self.make_store(ttl=None)
+        store[1] = {"messages": [], "metadata": {}}
+        await store.stop()
+
+        store = self.make_store(ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(await store.load(1))
+        await store.stop()
+
+    async def test_released_chat_moves_to_another_store(self):
+        """A released chat is written and reloaded by the store taking it over."""
+        old_owner = self.make_store(ttl=None)
+        new_owner = self.make_store(ttl=None)
+        old_owner[1] = {"messages": [{"role": "user", "content": "a"}], "metadata": {}}
+        await old_owner.release([1])
+
+        self.assertNotIn(1, old_owner)
+        entry = await new_owner.load(1)
+        self.assertEqual(entry["messages"], [{"role": "user", "content": "a"}])
+        await old_owner.stop()
+        await new_owner.stop()
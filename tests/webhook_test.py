@@ -0,0 +1,121 @@
+import asyncio
+import json
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from bot.bot import Bot
+from bot.sharding import Supervisor
+from bot.webhook import WebhookApp, check_webhook
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "text": "hi",
+    },
+}
+
+
+class FakeApplication:
+    bot = None
+
+    def __init__(self):
+        self.updates = []
+        self.release = asyncio.Event()
+
+    async def process_update(self, update):
+        self.updates.append(update)
+        await self.release.wait()
+
+
+class WebhookAppTest(IsolatedAsyncioTestCase):
+    """Test the webhook ingress at the ASGI level."""
+
+    async def asyncSetUp(self):
+        self.application = FakeApplication()
+        self.app = WebhookApp(
+            self.application, path="/telegram", secret_token="s3cret", max_concurrent_updates=2
+        )
+
+    async def asyncTearDown(self):
+        self.application.release.set()
+        await self.app.drain()
+
+    async def request(self, body=UPDATE, secret="s3cret", path="/telegram", method="POST"):
+        headers = [(b"content-type", b"application/json")]
+        if secret is not None:
+            headers.append((b"x-telegram-bot-api-secret-token", secret.encode()))
+        scope = {"type": "http", "method": method, "path": path, "headers": headers}
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        messages = [{"type": "http.request", "body": data, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"])
+
+    async def test_update_is_processed(self):
+        """A valid update is answered at once and processed in the background."""
+        status, _ = await self.request()
+        self.assertEqual(status, 200)
+        await asyncio.sleep(0)
+        self.assertEqual(self.application.updates[0].message.text, "hi")
+
+    async def test_secret_token(self):
+        """Requests without the right secret are refused."""
+        self.assertEqual((await self.request(secret="wrong"))[0], 403)
+        self.assertEqual((await self.request(secret=None))[0], 403)
+        self.assertEqual(self.application.updates, [])
+
+    async def test_backpressure(self):
+        """Beyond the limit Telegram is asked to retry instead of queueing."""
+        for _ in range(2):
+            self.assertEqual((await self.request())[0], 200)
+        status, headers = await self.request()
+        self.assertEqual(status, 503)
+        self.assertEqual(headers[b"retry-after"], b"1")
+
+        self.application.release.set()
+        await self.app.drain()
+        self.assertEqual((await self.request())[0], 200)
+
+    async def test_invalid_requests(self):
+        """Malformed bodies, other paths and methods get errors."""
+        self.assertEqual((await self.request(body=b"{"))[0], 400)
+        self.assertEqual((await self.request(path="/other"))[0], 404)
+        self.assertEqual((await self.request(method="GET"))[0], 405)
+        self.assertEqual((await self.request(path="/healthz", method="GET"))[0], 200)
+
+
+class WebhookConfigTest(TestCase):
+    def test_url_without_secret_is_refused(self):
+        """A public webhook without a secret token does not start."""
+        for webhook in ({"url": "https://bot.example.com"}, {"url": "https://b/x", "secret_token": ""}):
+            with self.assertRaisesRegex(ValueError, "secret_token"):
+                check_webhook(webhook)
+            with self.assertRaisesRegex(ValueError, "secret_token"):
+                Supervisor({"token": "1:A", "webhook": webhook}, workers=2)
+            with self.assertRaisesRegex(ValueError, "secret_token"):
+                Bot(
+                    token="1:A",
+                    backend="openai",
+                    template="chat",
+                    uri="http://a/v1",
+                    model="m",
+                    users=[],
+                    bot_username="bot",
+                    dev_id=0,
+                    instruction_templates={"chat": {"system_prompt": "Hi."}},
+                    max_new_tokens=64,
+                    streaming=True,
+                    webhook=webhook,
+                )
+        # Polling needs no secret
+        check_webhook({})
+        check_webhook({"url": "https://b/x", "secret_token": "s"})